@@ -0,0 +1,289 @@
+"""Benchmarks for the featurize / train / predict hot paths.
+
+Stages: load_and_preprocess, ingest (CSV and cached), balance_dataset,
+enrich_features (global and per series), scaler transform, single-row and
+batch predict, and a full Streamlit rerun of PP.py. They run on DMart.csv and
+on deterministic synthetic catalogs (100k / 1M / 10M rows).
+Results are written as JSON and optionally compared against a stored baseline;
+any stage slower than baseline * (1 + threshold) is a regression (exit code 1).
+A stage that raised, or a baseline stage of a group that ran but did not report
+it, fails the run as well.
+
+    python benchmarks.py [--datasets dmart,100k] [--out bench_results.json]
+                         [--baseline bench_baseline.json] [--threshold 0.2] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+import forecast_core
+from forecast_core import BASE_DIR
+
+DMART_CSV = os.path.join(BASE_DIR, "DMart.csv")
+BENCH_DIR = os.path.join(os.environ.get("FORECAST_CACHE_DIR", os.path.join(BASE_DIR, ".cache")), "bench")
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+BATCH_ROWS = 10_000
+
+
+def synthetic_catalog(n_rows, seed=42):
+    """DMart-shaped CSV with `n_rows` rows resampled from DMart.csv; cached, deterministic."""
+    path = os.path.join(BENCH_DIR, f"synthetic_{n_rows}_{seed}.csv")
+    if os.path.exists(path):
+        return path
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    source = pd.read_csv(DMART_CSV)
+    rng = np.random.default_rng(seed)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    chunk = 1_000_000
+    for start in range(0, n_rows, chunk):
+        size = min(chunk, n_rows - start)
+        part = source.iloc[rng.integers(0, len(source), size)].reset_index(drop=True)
+        jitter = rng.uniform(0.9, 1.1, size)
+        part["Price"] = (part["Price"] * jitter).round(2)
+        part["DiscountedPrice"] = (part["DiscountedPrice"] * jitter).round(2)
+        part.to_csv(tmp, mode="a", header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def measure(fn, repeats):
+    times, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def _record(results, key, times, rows=None):
+    entry = {"seconds": statistics.median(times), "runs": times}
+    if rows:
+        entry["rows"] = rows
+        entry["rows_per_sec"] = rows / entry["seconds"] if entry["seconds"] > 0 else None
+    results[key] = entry
+    rate = f" ({entry['rows_per_sec']:,.0f} rows/s)" if rows and entry["rows_per_sec"] else ""
+    print(f"  {key:<40} {entry['seconds'] * 1e3:10.2f} ms{rate}")
+
+
+def _run_stage(results, key, fn):
+    try:
+        fn()
+    except Exception as exc:
+        results[key] = {"error": f"{type(exc).__name__}: {exc}"}
+        print(f"  {key:<40} FAILED {type(exc).__name__}: {exc}")
+        if os.environ.get("BENCH_TRACEBACK"):
+            traceback.print_exc()
+
+
+def bench_training_prep(results, name, csv_path, repeats):
+    import ingest
+    import ptr
+
+    state = {}
+
+    def ingest_csv():
+        _, times = measure(lambda: ingest.load_dataset(csv_path, cache=False), repeats)
+        _record(results, f"{name}/ingest_csv", times, len(state["df"]))
+
+    def ingest_cached():
+        ingest.load_dataset(csv_path)
+        df, times = measure(lambda: ingest.load_dataset(csv_path), repeats)
+        _record(results, f"{name}/ingest_cached", times, len(df))
+
+    def load():
+        state["df"], times = measure(lambda: ptr.load_and_preprocess(csv_path), repeats)
+        _record(results, f"{name}/load_and_preprocess", times, len(state["df"]))
+
+    def balance():
+        state["balanced"], times = measure(lambda: ptr.balance_dataset(state["df"].copy()), repeats)
+        _record(results, f"{name}/balance_dataset", times, len(state["df"]))
+
+    def enrich():
+        state["enriched"], times = measure(lambda: ptr.enrich_features(state["balanced"]), repeats)
+        _record(results, f"{name}/enrich_features", times, len(state["balanced"]))
+
+    def enrich_series():
+        _, times = measure(lambda: ptr.enrich_features_by_series(state["balanced"]), repeats)
+        _record(results, f"{name}/enrich_features_by_series", times, len(state["balanced"]))
+
+    def scale():
+        from sklearn.preprocessing import StandardScaler
+
+        X = state["enriched"][ptr.features]
+        scaler = StandardScaler().fit(X)
+        _, times = measure(lambda: scaler.transform(X), repeats)
+        _record(results, f"{name}/scaler_transform", times, len(X))
+
+    _run_stage(results, f"{name}/load_and_preprocess", load)
+    if not state:   # the reference loader failed; the fast path still gets measured
+        state["df"] = ingest.load_dataset(csv_path)
+    for key, stage in (("ingest_csv", ingest_csv), ("ingest_cached", ingest_cached),
+                       ("balance_dataset", balance), ("enrich_features", enrich), ("enrich_features_by_series", enrich_series),
+                       ("scaler_transform", scale)):
+        _run_stage(results, f"{name}/{key}", stage)
+
+
+def bench_predict(results, repeats):
+    from forecast_pipeline import load_pipeline
+
+    pipeline = load_pipeline()
+    inputs = forecast_core.synthetic_inputs(BATCH_ROWS)
+    one = forecast_core.preprocess_batch(inputs.head(1))
+
+    def featurize():
+        _, times = measure(lambda: forecast_core.preprocess_batch(inputs), repeats)
+        _record(results, "predict/preprocess_batch", times, len(inputs))
+
+    def single():
+        _, times = measure(lambda: pipeline.predict_features(one), max(20, repeats))
+        _record(results, "predict/single_row", times, 1)
+
+    def single_estimator():
+        if pipeline.estimator is None:   # not applicable, so neither measured nor a failure
+            results["predict/single_row_estimator"] = {"skipped": "flat artifact has no estimator"}
+            print(f"  {'predict/single_row_estimator':<40} skipped (flat artifact has no estimator)")
+            return
+        X = pipeline.transform(one)
+        _, times = measure(lambda: pipeline.estimator.predict(X), max(5, repeats))
+        _record(results, "predict/single_row_estimator", times, 1)
+
+    def batch():
+        _, times = measure(lambda: pipeline.predict(inputs), repeats)
+        _record(results, "predict/batch", times, len(inputs))
+
+    for key, stage in (("preprocess_batch", featurize), ("single_row", single),
+                       ("single_row_estimator", single_estimator), ("batch", batch)):
+        _run_stage(results, f"predict/{key}", stage)
+
+
+def bench_app(results, repeats):
+    from streamlit.testing.v1 import AppTest
+
+    def rerun():
+        app = AppTest.from_file(os.path.join(BASE_DIR, "PP.py"), default_timeout=300)
+        _, first = measure(app.run, 1)
+        _record(results, "app/first_run", first)
+        _, idle = measure(app.run, repeats)
+        _record(results, "app/rerun_idle", idle)
+
+        def forecast():
+            app.button[0].click()
+            app.run()
+        _, times = measure(forecast, repeats)
+        _record(results, "app/rerun_forecast", times)
+
+    _run_stage(results, "app/rerun", rerun)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, ran=None):
+    """(regressions, failures) against `baseline`.
+
+    Failures are stages that raised, and baseline stages missing from `results` whose group
+    (the key prefix: dataset name, "predict" or "app") is in `ran` (default: every group seen).
+    """
+    regressions, failures = [], []
+    base_results = baseline.get("results", {})
+    for key, entry in results.items():
+        if "error" in entry:
+            failures.append((key, entry["error"]))
+            continue
+        base = base_results.get(key)
+        if not base or "seconds" not in base or "seconds" not in entry:
+            continue
+        ratio = entry["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        entry["baseline_seconds"] = base["seconds"]
+        entry["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((key, base["seconds"], entry["seconds"], ratio))
+    ran = {key.split("/")[0] for key in results} if ran is None else set(ran)
+    for key in base_results:
+        if key not in results and key.split("/")[0] in ran:
+            failures.append((key, "in the baseline but not measured"))
+    return regressions, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the forecasting hot paths.")
+    parser.add_argument("--datasets", default="dmart,100k", help="comma list of dmart, 100k, 1m, 10m")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip", default="", help="comma list of groups to skip: train, predict, app")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the new baseline")
+    args = parser.parse_args(argv)
+    skip = set(filter(None, args.skip.split(",")))
+
+    results = {}
+    ran = set()
+    if "train" not in skip:
+        for name in filter(None, args.datasets.split(",")):
+            ran.add(name)
+            path = DMART_CSV if name == "dmart" else synthetic_catalog(SIZES[name])
+            print(f"[{name}] {path}")
+            bench_training_prep(results, name, path, 1 if name in ("1m", "10m") else args.repeats)
+    if "predict" not in skip:
+        print("[predict]")
+        ran.add("predict")
+        _run_stage(results, "predict/setup", lambda: bench_predict(results, args.repeats))
+    if "app" not in skip:
+        print("[app]")
+        ran.add("app")
+        bench_app(results, args.repeats)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "results": results,
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions, failures = compare(results, baseline, args.threshold, ran)
+    report["failures"] = [{"stage": k, "reason": reason} for k, reason in failures]
+    for key, reason in failures:
+        print(f"FAILED {key}: {reason}")
+    if baseline:
+        report["regressions"] = [{"stage": k, "baseline": b, "current": c, "ratio": r} for k, b, c, r in regressions]
+        for key, base, cur, ratio in regressions:
+            print(f"REGRESSION {key}: {base * 1e3:.2f} ms -> {cur * 1e3:.2f} ms ({ratio:.2f}x)")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} vs {args.baseline}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""Compaction of the served tree model, with a size / latency / accuracy trade-off table.
+
+    merge      Drop splits that cannot change the outcome: one side unreachable given the
+               splits above it, or both sides identical. Thresholds on integer-valued
+               features are snapped to k + 0.5 first, so near-duplicate cut points merge.
+               Exact for integer inputs on those features (NaN inputs may route differently).
+               --tol additionally merges sibling leaves whose values differ by at most tol.
+    quantize   Store thresholds as uint16 bin indices into per-feature cut tables, and the
+               node arrays as uint8 / int32 / float32. Inputs are binned once per batch.
+               Exact up to float32 leaf values. Less than half the size, but binning and
+               the narrow index dtypes make a single row roughly 2x slower; the table shows
+               every variant's latency and throughput relative to the full model.
+    top-k      Keep the k trees that best reproduce the full forest (greedy forward
+               selection; boosted models keep their first k rounds).
+    distill    Fit a smaller RandomForest to the full model's predictions.
+
+    python compact_model.py [--data DMart.csv] [--keep 100,50,25] [--students 50x10,100x12] [--tol 1]
+                            [--save quantized --out forecast_model.flat]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+import forecast_core
+from forecast_core import FEATURES
+from tree_engine import FlatForest, _pack
+
+INTEGER_FEATURES = ('DayOfWeek', 'Month', 'Quarter', 'Year', 'IsHoliday', 'CategoryEncoded',
+                    'BrandEncoded', 'DayOfYear', 'WeekOfYear', 'IsWeekend')
+
+
+# ------------------- TREE ACCESS -------------------
+def unpack(engine):
+    """Per-tree (feature, threshold, left, right, value, missing_left) with -1 children at leaves."""
+    if engine.quantized:
+        raise TypeError("unpack a forest before quantizing it")
+    bounds = np.append(engine.roots, engine.n_nodes)
+    trees = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        local = np.arange(stop - start)
+        left = engine.left[start:stop] - start
+        leaf = left == local
+        missing = engine.missing_left[start:stop] if engine.missing_left is not None else np.ones(len(local), dtype=bool)
+        trees.append((engine.feature[start:stop], engine.threshold[start:stop].astype(np.float64),
+                      np.where(leaf, -1, left), np.where(leaf, -1, left + 1), engine.value[start:stop], missing))
+    return trees
+
+
+def repack(engine, trees):
+    return _pack(trees, engine.n_features, strict=engine.strict, aggregate=engine.aggregate,
+                 base_score=engine.base_score)
+
+
+# ------------------- MERGE REDUNDANT SPLITS -------------------
+def _merge_tree(tree, integer, strict, tol):
+    feat, thr, left, right, val, miss = tree
+    n_features = len(integer)
+    lo, hi = [-math.inf] * n_features, [math.inf] * n_features
+    interned, keys = {}, []
+
+    def make(key):
+        node = interned.get(key)
+        if node is None:
+            node = interned[key] = len(keys)
+            keys.append(key)
+        return node
+
+    def visit(i):
+        while left[i] >= 0:
+            f, t = int(feat[i]), float(thr[i])
+            if integer[f]:
+                t = math.ceil(t) - 0.5 if strict else math.floor(t) + 0.5
+            if t >= hi[f]:
+                i = left[i]          # every value reaching here goes left
+            elif t <= lo[f]:
+                i = right[i]
+            else:
+                break
+        else:
+            return make(('leaf', float(val[i])))
+        saved = hi[f]
+        hi[f] = t
+        l_node = visit(left[i])
+        hi[f] = saved
+        saved = lo[f]
+        lo[f] = t
+        r_node = visit(right[i])
+        lo[f] = saved
+        if l_node == r_node:
+            return l_node
+        l_key, r_key = keys[l_node], keys[r_node]
+        if l_key[0] == r_key[0] == 'leaf' and abs(l_key[1] - r_key[1]) <= tol:
+            return make(('leaf', (l_key[1] + r_key[1]) / 2))
+        return make(('split', f, t, bool(miss[i]), l_node, r_node))
+
+    root = visit(0)
+    # Emit the (possibly shared) nodes as a plain tree
+    out_feat, out_thr, out_left, out_right, out_val, out_miss = [], [], [], [], [], []
+    stack = [(root, None, None)]
+    while stack:
+        node, parent, side = stack.pop()
+        i = len(out_feat)
+        if parent is not None:
+            (out_left if side == 0 else out_right)[parent] = i
+        key = keys[node]
+        out_left.append(-1)
+        out_right.append(-1)
+        if key[0] == 'leaf':
+            out_feat.append(0)
+            out_thr.append(np.nan)
+            out_val.append(key[1])
+            out_miss.append(True)
+        else:
+            _, f, t, m, l_node, r_node = key
+            out_feat.append(f)
+            out_thr.append(t)
+            out_val.append(0.0)
+            out_miss.append(m)
+            stack.append((r_node, i, 1))
+            stack.append((l_node, i, 0))
+    return out_feat, out_thr, out_left, out_right, out_val, out_miss
+
+
+def merge_redundant(engine, integer_features=None, tol=0.0):
+    """Forest with unreachable and no-op splits removed; `integer_features` are feature indices.
+
+    With `tol` > 0, sibling leaves whose values differ by at most `tol` are also merged
+    into their mean (lossy: each merge moves a tree's output by at most tol / 2).
+    """
+    integer = np.zeros(engine.n_features, dtype=bool)
+    if integer_features is not None:
+        integer[list(integer_features)] = True
+    return repack(engine, [_merge_tree(t, integer, engine.strict, tol) for t in unpack(engine)])
+
+
+# ------------------- QUANTIZE -------------------
+def quantize(engine):
+    """Forest whose thresholds are bin indices into per-feature cut tables, in compact dtypes."""
+    internal = engine.left != np.arange(engine.n_nodes)
+    cuts, offsets = [], [0]
+    bins = np.zeros(engine.n_nodes, dtype=np.int64)
+    for f in range(engine.n_features):
+        mask = internal & (engine.feature == f)
+        table = np.unique(engine.threshold[mask])
+        bins[mask] = np.searchsorted(table, engine.threshold[mask])
+        cuts.append(table)
+        offsets.append(offsets[-1] + len(table))
+    bin_dtype = np.uint16 if max(len(c) for c in cuts) < np.iinfo(np.uint16).max else np.int32
+    bins[~internal] = np.iinfo(bin_dtype).max          # leaves never step right
+    return FlatForest(
+        engine.feature.astype(np.uint8 if engine.n_features < 256 else np.int16),
+        bins.astype(bin_dtype),
+        engine.left.astype(np.int32 if engine.n_nodes < np.iinfo(np.int32).max else np.int64),
+        engine.value.astype(np.float32), engine.roots, engine.depth, engine.n_features,
+        aggregate=engine.aggregate, base_score=engine.base_score, strict=engine.strict,
+        missing_left=engine.missing_left, cuts=np.concatenate(cuts), cut_offsets=offsets,
+    )
+
+
+# ------------------- DROP TREES -------------------
+def select_trees(engine, X, k, target=None):
+    """Sub-forest of `k` trees.
+
+    Mean-aggregated forests use greedy forward selection against `target` on X
+    (default: the full forest's predictions). Boosted forests keep their first k
+    rounds, because later trees correct the earlier ones.
+    """
+    trees = unpack(engine)
+    k = min(k, len(trees))
+    if engine.aggregate != "mean":
+        return repack(engine, trees[:k])
+    per_tree = engine.predict_trees(X)
+    target = per_tree.mean(axis=1) if target is None else np.asarray(target, dtype=np.float64)
+    chosen, total = [], np.zeros(len(X))
+    available = np.ones(len(trees), dtype=bool)
+    for m in range(k):
+        err = (((total[:, None] + per_tree) / (m + 1) - target[:, None]) ** 2).mean(axis=0)
+        err[~available] = np.inf
+        best = int(np.argmin(err))
+        chosen.append(best)
+        available[best] = False
+        total += per_tree[:, best]
+    return repack(engine, [trees[i] for i in sorted(chosen)])
+
+
+# ------------------- DISTILL -------------------
+def distill(engine, X, n_estimators=50, max_depth=10, seed=42):
+    """Smaller RandomForest fitted to the engine's predictions on X; returns (FlatForest, estimator)."""
+    from sklearn.ensemble import RandomForestRegressor
+    from tree_engine import from_sklearn
+
+    student = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=seed, n_jobs=-1)
+    student.fit(X, engine.predict(X))
+    return from_sklearn(student), student
+
+
+# ------------------- REPORT -------------------
+def _latency(engine, X):
+    one = X[:1]
+    for _ in range(10):
+        engine.predict(one)
+    times = []
+    for _ in range(200):
+        start = time.perf_counter()
+        engine.predict(one)
+        times.append(time.perf_counter() - start)
+    batch = X[:256]
+    start = time.perf_counter()
+    for _ in range(5):
+        engine.predict(batch)
+    return float(np.median(times)) * 1e3, 5 * len(batch) / (time.perf_counter() - start)
+
+
+def evaluate(name, engine, reference, X_app, holdout=None):
+    row = {"variant": name, "trees": engine.n_trees, "nodes": engine.n_nodes, "depth": engine.depth,
+           "size_mb": engine.nbytes / 1e6}
+    row["single_row_ms"], row["batch_rows_per_s"] = _latency(engine, X_app)
+    pred = engine.predict(X_app)
+    row["fidelity_rmse"] = float(np.sqrt(np.mean((pred - reference) ** 2)))
+    if holdout is not None:
+        X_hold, y_hold = holdout
+        p = engine.predict(X_hold)
+        row["holdout_rmse"] = float(np.sqrt(np.mean((p - y_hold) ** 2)))
+        row["holdout_r2"] = float(1 - np.sum((p - y_hold) ** 2) / np.sum((y_hold - y_hold.mean()) ** 2))
+    return row
+
+
+def app_inputs(pipeline, n, seed):
+    """Engine-space features for `n` synthetic app requests."""
+    features = forecast_core.preprocess_batch(forecast_core.synthetic_inputs(n, seed=seed), encoders=pipeline.encoders)
+    return np.asarray(pipeline.transform(features), dtype=np.float32)
+
+
+def training_holdout(pipeline, csv_path):
+    """Engine-space features and labels of the last 20% of the training frame."""
+    import ptr
+    from ingest import load_dataset
+
+    df = ptr.enrich_features_by_series(ptr.balance_dataset(load_dataset(csv_path)))
+    X = np.asarray(pipeline.transform(df[ptr.features]), dtype=np.float32)
+    y = df['UnitsSold'].to_numpy(dtype=np.float64)
+    split = int(len(df) * 0.8)
+    return (X[:split], y[:split]), (X[split:], y[split:])
+
+
+def compact(pipeline, keep=(100, 50, 25), students=((50, 10), (100, 12)), tol=1.0, csv_path=None, n_app=20000,
+            log=print):
+    """Build every variant and return ({name: FlatForest}, [table rows])."""
+    from tree_engine import compile_model
+
+    engine = pipeline.engine if pipeline.engine is not None else compile_model(pipeline.estimator)
+    app_fit, app_eval = (app_inputs(pipeline, n_app, seed) for seed in (1, 2))
+    train = holdout = None
+    if csv_path:
+        train, holdout = training_holdout(pipeline, csv_path)
+    fit_X = app_fit if train is None else np.vstack([app_fit, train[0]])
+    reference = engine.predict(app_eval)
+
+    # Snapping integer features is only valid when the engine sees raw feature values
+    integer = [FEATURES.index(f) for f in INTEGER_FEATURES] if pipeline.scaler is None else None
+    variants = {"full": engine}
+    started = time.perf_counter()
+    variants["merged"] = merge_redundant(engine, integer)
+    log(f"merged in {time.perf_counter() - started:.1f}s")
+    variants["quantized"] = quantize(variants["merged"])
+    if tol > 0:
+        variants[f"merged-tol{tol:g}"] = quantize(merge_redundant(engine, integer, tol))
+    for k in keep:
+        if k < engine.n_trees:
+            variants[f"top{k}"] = select_trees(variants["merged"], fit_X, k)
+            variants[f"top{k}-quantized"] = quantize(variants[f"top{k}"])
+    for n_estimators, max_depth in students:
+        started = time.perf_counter()
+        student, _ = distill(engine, fit_X, n_estimators, max_depth)
+        name = f"distill-{n_estimators}x{max_depth}"
+        variants[name] = merge_redundant(student, integer)
+        variants[f"{name}-quantized"] = quantize(variants[name])
+        log(f"distilled {n_estimators}x{max_depth} in {time.perf_counter() - started:.1f}s")
+    rows = [evaluate(name, v, reference, app_eval, holdout) for name, v in variants.items()]
+    return variants, relative_to_full(rows)
+
+
+def relative_to_full(rows):
+    """Add size / single-row latency / batch throughput ratios against the "full" row."""
+    full = next(r for r in rows if r["variant"] == "full")
+    for row in rows:
+        row["size_vs_full"] = row["size_mb"] / full["size_mb"]
+        row["latency_vs_full"] = row["single_row_ms"] / full["single_row_ms"]
+        row["throughput_vs_full"] = row["batch_rows_per_s"] / full["batch_rows_per_s"]
+    return rows
+
+
+def slower_single_row(rows, margin=0.25):
+    """Variants whose single-row latency is more than `margin` above the full model's."""
+    return [r["variant"] for r in rows if r["latency_vs_full"] > 1 + margin]
+
+
+def format_table(rows):
+    import pandas as pd
+
+    return pd.DataFrame(rows).set_index("variant").to_string(float_format=lambda v: f"{v:,.4g}")
+
+
+if __name__ == "__main__":
+    from forecast_pipeline import FLAT_PATH, ForecastPipeline, load_pipeline, save_flat
+
+    parser = argparse.ArgumentParser(description="Compact the served tree model and compare the variants.")
+    parser.add_argument("--pipeline", default=None, help="artifact path (default: load_pipeline())")
+    parser.add_argument("--data", default=None, help="training CSV for holdout accuracy, e.g. DMart.csv")
+    parser.add_argument("--keep", default="100,50,25", help="tree counts for top-k selection")
+    parser.add_argument("--tol", type=float, default=1.0, help="leaf-merge tolerance in units sold (0 = exact only)")
+    parser.add_argument("--students", default="50x10,100x12", help="distilled forests as TREESxDEPTH")
+    parser.add_argument("--save", default=None, help="variant to write as a flat artifact")
+    parser.add_argument("--out", default=FLAT_PATH)
+    args = parser.parse_args()
+
+    pipeline = load_pipeline() if args.pipeline is None else load_pipeline(args.pipeline)
+    keep = tuple(int(k) for k in args.keep.split(",") if k)
+    students = tuple(tuple(int(v) for v in s.split("x")) for s in args.students.split(",") if s)
+    variants, rows = compact(pipeline, keep, students, args.tol, args.data)
+    print(format_table(rows))
+    slower = slower_single_row(rows)
+    print("\nQuantized variants trade single-row latency for size (inputs are binned on every call); "
+          "serve them where memory matters, not on the apps' single-row path.")
+    if slower:
+        print(f"Measured slower per row than the full model: {', '.join(slower)}")
+    if args.save and (args.save in slower or variants[args.save].quantized):
+        print(f"Warning: {args.save} is slower per row than its unquantized source.")
+    if args.save:
+        if args.save not in variants:
+            parser.error(f"unknown variant {args.save!r}; choose from {', '.join(variants)}")
+        served = ForecastPipeline(None, pipeline.scaler, pipeline.encoders, scaler_folded=pipeline.scaler is None,
+                                  model_version=f"{pipeline.model_version}-{args.save}")
+        served.engine = variants[args.save]
+        served.importances = getattr(pipeline, "feature_importances_", None)
+        served.permutation_importances = getattr(pipeline, "permutation_importances", None)
+        save_flat(served, args.out)
+        print(f"Saved {args.save} to {args.out}/ (model version {served.model_version})")
@@ -0,0 +1,316 @@
+"""Incremental per-(Category, Brand) lag features with ring-buffer rolling windows.
+
+Every series keeps its last WINDOW daily totals in a fixed-size ring plus a
+running window sum. Appending a day is O(1) per series, and the lags for the
+next day are read straight from the ring. Days with no sales count as zero, and
+same-day appends accumulate. The state snapshots to a single .npz for fast
+restarts.
+
+Lags follow `forecast_recursive`: for the day after the last appended one,
+Lag_1 is the last day, Lag_7 the day seven days earlier and RollingMean_7 the
+mean of the last seven days.
+
+With `fill_gaps=False`, each appended day is the next observation and missing
+days are skipped. That is how `ptr.enrich_features_by_series` builds the
+training lags. `ingest_training_data` replays the training rows (DMart.csv via
+ingest.load_dataset) up to a cut-off day this way, filed under the app's
+categories. Run it once to seed the store, then daily to append the new days:
+
+    python feature_store.py --ingest [DMart.csv] [--until YYYY-MM-DD]   # seed / append, then snapshot
+    python feature_store.py [--check]     # replay random series against pandas
+"""
+import os
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+from forecast_core import BASE_DIR, category_mapping
+
+STORE_FORMAT_VERSION = 3
+STORE_PATH = os.environ.get("FORECAST_FEATURE_STORE_PATH", os.path.join(BASE_DIR, "feature_store.npz"))
+TRAINING_DATA_PATH = os.environ.get("FORECAST_TRAINING_DATA_PATH", os.path.join(BASE_DIR, "DMart.csv"))
+WINDOW = 7
+
+# The app's categories; in DMart all but Grocery are subcategories of it (e.g. "Pulses",
+# "Grocery/Masala & Spices"), and a catalog row is stored under one when its subcategory names it
+APP_CATEGORIES = frozenset(category_mapping)
+
+
+def _ordinal(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return day if isinstance(day, (int, np.integer)) else day.toordinal()
+
+
+class FeatureStore:
+    def __init__(self, capacity=64, fill_gaps=True):
+        self.fill_gaps = fill_gaps                       # False: skip missing days (observation steps)
+        self.keys = []                                   # (category, brand) per series slot
+        self._index = {}
+        self.ring = np.zeros((capacity, WINDOW))
+        self.ring_day = np.zeros((capacity, WINDOW), dtype=np.int64)   # day ordinal of each ring entry
+        self.pos = np.zeros(capacity, dtype=np.intp)     # next slot to write in each ring
+        self.count = np.zeros(capacity, dtype=np.int64)  # days seen, capped at WINDOW
+        self.total = np.zeros(capacity)                  # sum of the ring
+        self.last_day = np.zeros(capacity, dtype=np.int64)
+        self.through = 0                                 # last day ingested into the store (ordinal)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return tuple(key) in self._index
+
+    def _slot(self, key):
+        key = tuple(key)
+        s = self._index.get(key)
+        if s is not None:
+            return s
+        s = len(self.keys)
+        if s == len(self.pos):
+            grow = max(64, s)
+            self.ring = np.vstack([self.ring, np.zeros((grow, WINDOW))])
+            self.ring_day = np.vstack([self.ring_day, np.zeros((grow, WINDOW), dtype=np.int64)])
+            self.pos, self.count, self.total, self.last_day = (
+                np.concatenate([a, np.zeros(grow, dtype=a.dtype)])
+                for a in (self.pos, self.count, self.total, self.last_day))
+        self.keys.append(key)
+        self._index[key] = s
+        return s
+
+    def _push(self, s, value, day):
+        p = self.pos[s]
+        self.total[s] += value - self.ring[s, p]
+        self.ring[s, p] = value
+        self.ring_day[s, p] = day
+        self.pos[s] = (p + 1) % WINDOW
+        self.count[s] = min(self.count[s] + 1, WINDOW)
+
+    def append(self, category, brand, day, units):
+        """Add `units` sold on `day`; days must not go backwards within a series."""
+        s = self._slot((category, brand))
+        day = _ordinal(day)
+        self.through = max(self.through, day)
+        if self.count[s] == 0:
+            self._push(s, units, day)
+        else:
+            gap = day - self.last_day[s]
+            if gap < 0:
+                raise ValueError(f"{self.keys[s]}: {date.fromordinal(day)} is before the last "
+                                 f"appended day {date.fromordinal(int(self.last_day[s]))}")
+            if gap == 0:
+                p = (self.pos[s] - 1) % WINDOW
+                self.ring[s, p] += units
+                self.total[s] += units
+            else:
+                if self.fill_gaps:
+                    for k in range(max(1, gap - WINDOW), gap):   # days without sales
+                        self._push(s, 0.0, day - gap + k)
+                self._push(s, units, day)
+        self.last_day[s] = day
+
+    def append_day(self, keys, day, units):
+        """Append one day for many series; consecutive-day series are updated in one vectorized step."""
+        day = _ordinal(day)
+        slots = np.array([self._slot(k) for k in keys], dtype=np.intp)
+        units = np.asarray(units, dtype=np.float64)
+        if len(np.unique(slots)) != len(slots):
+            for key, value in zip(keys, units):
+                self.append(key[0], key[1], day, value)
+            return
+        last = self.last_day[slots]
+        fast = (self.count[slots] > 0) & ((last == day - 1) if self.fill_gaps else (last < day))
+        s, v = slots[fast], units[fast]
+        p = self.pos[s]
+        self.total[s] += v - self.ring[s, p]
+        self.ring[s, p] = v
+        self.ring_day[s, p] = day
+        self.pos[s] = (p + 1) % WINDOW
+        self.count[s] = np.minimum(self.count[s] + 1, WINDOW)
+        self.last_day[s] = day
+        self.through = max(self.through, day)
+        for i in np.flatnonzero(~fast):
+            self.append(keys[i][0], keys[i][1], day, units[i])
+
+    def lags(self, category, brand, when=None):
+        """(Lag_1, Lag_7, RollingMean_7, as_of) for the next step after the last append, or None
+        until the series has a full window.
+
+        `as_of` is the day after the last append. With `when` (the forecast date), dates
+        before `as_of` return None, because the ring no longer holds their window. Later
+        dates get the latest window, like lag_provider.
+        """
+        s = self._index.get((category, brand))
+        if s is None or self.count[s] < WINDOW:
+            return None
+        as_of = date.fromordinal(int(self.last_day[s]) + 1)
+        if when is not None and _ordinal(when) < as_of.toordinal():
+            return None
+        p = self.pos[s]
+        return float(self.ring[s, (p - 1) % WINDOW]), float(self.ring[s, p]), float(self.total[s] / WINDOW), as_of
+
+    def window(self, category, brand):
+        """(first, last) day of the window behind `lags`: the Lag_7 and Lag_1 days."""
+        s = self._index[(category, brand)]
+        p = self.pos[s]
+        return date.fromordinal(int(self.ring_day[s, p])), date.fromordinal(int(self.ring_day[s, (p - 1) % WINDOW]))
+
+    # ------------------- SNAPSHOTS -------------------
+    def snapshot(self, path=STORE_PATH):
+        n = len(self.keys)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, format_version=STORE_FORMAT_VERSION, keys=np.array(self.keys, dtype=str).reshape(n, 2),
+                 ring=self.ring[:n], ring_day=self.ring_day[:n], pos=self.pos[:n], count=self.count[:n],
+                 last_day=self.last_day[:n], fill_gaps=self.fill_gaps, through=self.through)
+        os.replace(tmp, path)
+
+    @classmethod
+    def restore(cls, path=STORE_PATH):
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["format_version"]) != STORE_FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported feature store format {int(z['format_version'])}")
+            n = len(z["keys"])
+            store = cls(capacity=max(n, 64), fill_gaps=bool(z["fill_gaps"]))
+            store.through = int(z["through"])
+            store.keys = [tuple(k) for k in z["keys"].tolist()]
+            store._index = {k: i for i, k in enumerate(store.keys)}
+            store.ring[:n] = z["ring"]
+            store.ring_day[:n] = z["ring_day"]
+            store.pos[:n] = z["pos"]
+            store.count[:n] = z["count"]
+            store.last_day[:n] = z["last_day"]
+        store.total[:n] = store.ring[:n].sum(axis=1)   # re-derived so running-sum drift never persists
+        return store
+
+
+def load_store(path=STORE_PATH):
+    """The snapshotted store, or None; cached per process and re-read when the snapshot changes."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _load_store(path, mtime)
+
+
+@lru_cache(maxsize=2)
+def _load_store(path, mtime):
+    try:
+        return FeatureStore.restore(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# ------------------- TRAINING DATA INGEST -------------------
+def training_rows(path=TRAINING_DATA_PATH, cache=True):
+    """(category, brand, day ordinal, UnitsSold) per training row, in the order training sees them.
+
+    The category is the row's subcategory when that is an app category, else its catalog category.
+    """
+    import pandas as pd
+
+    from ingest import load_dataset
+
+    names = pd.read_csv(path, usecols=lambda c: c in ("Category", "SubCategory", "Brand"), dtype=str)
+    sub = names.get("SubCategory", pd.Series("", index=names.index)).fillna("").str.rsplit("/", n=1).str[-1]
+    category = np.where(sub.isin(APP_CATEGORIES), sub, names["Category"].fillna(""))
+    data = load_dataset(path, cache=cache)
+    days = data["Date"].to_numpy().astype("datetime64[D]").astype(np.int64) + date(1970, 1, 1).toordinal()
+    return category, names["Brand"].fillna("").to_numpy(), days, data["UnitsSold"].to_numpy(dtype=np.float64)
+
+
+def ingest_training_data(store=None, path=TRAINING_DATA_PATH, until=None, cache=True):
+    """Append the training rows dated after `store.through` and up to `until` (default: the
+    last training day).
+
+    A new store skips missing days, like the training lags. Returns the store.
+    """
+    store = FeatureStore(fill_gaps=False) if store is None else store
+    category, brand, days, units = training_rows(path, cache=cache)
+    if until is None:
+        until = int(days.max()) if len(days) else store.through
+    until = _ordinal(until)
+    new = np.flatnonzero((days > store.through) & (days <= until))
+    new = new[np.argsort(days[new], kind="stable")]
+    if not len(new):
+        return store
+    breaks = np.flatnonzero(np.diff(days[new])) + 1
+    for rows in np.split(new, breaks):
+        store.append_day(list(zip(category[rows], brand[rows])), int(days[rows[0]]), units[rows])
+    store.through = max(store.through, until)
+    return store
+
+
+def check_against_pandas(n_series=20, n_days=120, seed=0):
+    """Replay random gappy series and compare with a pandas reindex + shift/rolling; returns max abs diff."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1).toordinal()
+    store = FeatureStore(capacity=4)
+    sales = {}
+    for day in range(start, start + n_days):
+        active = np.flatnonzero(rng.random(n_series) < 0.7)
+        units = rng.integers(0, 300, len(active)).astype(float)
+        store.append_day([(f"c{i % 3}", f"b{i}") for i in active], day, units)
+        for i, u in zip(active, units):
+            sales.setdefault(i, {})[day] = u
+    worst = 0.0
+    for i, days in sales.items():
+        series = pd.Series(days).reindex(range(min(days), max(days) + 1), fill_value=0.0)
+        got = store.lags(f"c{i % 3}", f"b{i}")
+        if len(series) < WINDOW:
+            assert got is None
+            continue
+        expected = (series.iloc[-1], series.iloc[-7], series.iloc[-7:].mean())
+        worst = max(worst, float(np.abs(np.subtract(got[:3], expected)).max()))
+    return worst
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Per-series ring-buffer feature store.")
+    parser.add_argument("--check", action="store_true", help="compare against pandas shift/rolling")
+    parser.add_argument("--bench", type=int, default=10000, help="series for the append benchmark")
+    parser.add_argument("--ingest", nargs="?", const=TRAINING_DATA_PATH, metavar="CSV",
+                        help="append the training rows up to --until to the snapshot (created if missing)")
+    parser.add_argument("--until", type=date.fromisoformat, help="last day to ingest (default: the last training day)")
+    parser.add_argument("--store", default=STORE_PATH)
+    args = parser.parse_args()
+
+    if args.ingest:
+        started = time.perf_counter()
+        try:
+            store = FeatureStore.restore(args.store) if os.path.exists(args.store) else None
+        except (ValueError, KeyError) as exc:   # older snapshot format: rebuild it from the CSV
+            print(f"{exc}; rebuilding", file=sys.stderr)
+            store = None
+        before = 0 if store is None else store.through
+        store = ingest_training_data(store, args.ingest, args.until)
+        store.snapshot(args.store)
+        ready = sum(store.lags(*key) is not None for key in store.keys)
+        print(f"{args.store}: {len(store)} series ({ready} with a full window), ingested "
+              f"{date.fromordinal(before) if before else 'start'} .. {date.fromordinal(store.through)} "
+              f"in {time.perf_counter() - started:.2f}s")
+        raise SystemExit(0)
+
+    if args.check:
+        diff = check_against_pandas()
+        print(f"parity vs pandas: max abs diff {diff:.3g}")
+    keys = [(f"c{i % 5}", f"b{i}") for i in range(args.bench)]
+    store = FeatureStore()
+    started = time.perf_counter()
+    for day in range(60):
+        store.append_day(keys, date(2024, 1, 1).toordinal() + day, np.full(len(keys), float(day)))
+    print(f"append_day: {(time.perf_counter() - started) / 60 * 1e3:.2f} ms per day for {len(keys):,} series")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "store.npz")
+        started = time.perf_counter()
+        store.snapshot(path)
+        restored = FeatureStore.restore(path)
+        print(f"snapshot + restore: {(time.perf_counter() - started) * 1e3:.1f} ms, "
+              f"lags equal: {restored.lags(*keys[-1]) == store.lags(*keys[-1])}")
@@ -0,0 +1,212 @@
+"""Headless forecasting core shared by the Streamlit apps, batch jobs and workers.
+
+Importing this module has no side effects: pandas, joblib and the pickled
+artifacts are only loaded the first time they are needed, once per process.
+"""
+import os
+from functools import lru_cache
+
+from metrics import timed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get("FORECAST_MODEL_PATH", os.path.join(BASE_DIR, "best_random_forest_model.pkl"))
+SCALER_PATH = os.environ.get("FORECAST_SCALER_PATH", os.path.join(BASE_DIR, "scaler.pkl"))
+
+# ------------------- ENCODING MAPS -------------------
+category_mapping = {
+    'Grocery': 0, 'Pulses': 1, 'Masala & Spices': 2,
+    'Ghee & Vanaspati': 3, 'Cooking Oil': 4
+}
+brand_mapping = {
+    'Premia': 0, 'Nutraj': 1, 'Tata': 2, 'Satyam': 3,
+    'DMart': 4, 'KMK': 5, 'ProV': 6, '24 Mantra': 7,
+    'Organic Tattva': 8, 'Kokan Gem': 9, 'Fortune': 10
+}
+HOLIDAY_DATES = ('2023-12-25', '2024-01-01', '2024-01-26', '2024-03-25', '2024-08-15')
+
+FEATURES = [
+    'DayOfWeek', 'Month', 'Quarter', 'Year', 'DiscountPct',
+    'IsHoliday', 'CategoryEncoded', 'BrandEncoded',
+    'Lag_1', 'Lag_7', 'DayOfYear', 'WeekOfYear', 'IsWeekend', 'RollingMean_7'
+]
+
+
+@lru_cache(maxsize=None)
+def get_holidays(dates=HOLIDAY_DATES):
+    import pandas as pd
+    return pd.to_datetime(list(dates))
+
+
+# ------------------- LAZY ARTIFACTS -------------------
+@lru_cache(maxsize=None)
+def load_model(path=MODEL_PATH):
+    import joblib
+    return joblib.load(path)
+
+
+@lru_cache(maxsize=None)
+def load_scaler(path=SCALER_PATH):
+    import joblib
+    return joblib.load(path)
+
+
+# ------------------- PREPROCESS FUNCTION -------------------
+# Batch path: featurize a whole DataFrame (or list of dicts / dict of arrays) with
+# columns Category, Brand, Price, DiscountedPrice, Date, Lag_1, Lag_7, RollingMean_7
+# in one vectorized pass. Target: >= 100k rows/sec featurization, >= 20k rows/sec
+# end to end through predict_batch for the 300-tree forest. `encoders` overrides the
+# module-level maps with the ones stored in a pipeline artifact; labels missing from a
+# map get the code training gives missing values (one past the last class).
+def preprocess_batch(inputs, encoders=None):
+    import numpy as np
+    import pandas as pd
+
+    with timed("preprocess"):
+        encoders = encoders or {}
+        category_map = encoders.get('category', category_mapping)
+        brand_map = encoders.get('brand', brand_mapping)
+        holidays = get_holidays(tuple(encoders.get('holidays', HOLIDAY_DATES)))
+
+        df = inputs if isinstance(inputs, pd.DataFrame) else pd.DataFrame(inputs)
+        dates = pd.DatetimeIndex(pd.to_datetime(df['Date'], format='ISO8601')).normalize()
+        price = df['Price'].to_numpy(dtype=float)
+        discounted = df['DiscountedPrice'].to_numpy(dtype=float)
+        day_of_week = dates.dayofweek
+
+        out = pd.DataFrame({
+            'DayOfWeek': day_of_week,
+            'Month': dates.month,
+            'Quarter': dates.quarter,
+            'Year': dates.year,
+            'DiscountPct': ((price - discounted) / price) * 100,
+            'IsHoliday': dates.isin(holidays).astype(int),
+            'CategoryEncoded': df['Category'].map(category_map).fillna(len(category_map)).to_numpy(dtype=int),
+            'BrandEncoded': df['Brand'].map(brand_map).fillna(len(brand_map)).to_numpy(dtype=int),
+            'Lag_1': df['Lag_1'].to_numpy(),
+            'Lag_7': df['Lag_7'].to_numpy(),
+            'DayOfYear': dates.dayofyear,
+            'WeekOfYear': dates.isocalendar().week.to_numpy().astype(int),
+            'IsWeekend': np.isin(day_of_week, [5, 6]).astype(int),
+            'RollingMean_7': df['RollingMean_7'].to_numpy(),
+        }, columns=FEATURES)
+    return out
+
+
+def preprocess_input(input_data, lag_1, lag_7, rolling_mean):
+    row = dict(input_data, Lag_1=lag_1, Lag_7=lag_7, RollingMean_7=rolling_mean)
+    return preprocess_batch([row])
+
+
+# One transform and one model.predict for the whole batch. Without an explicit
+# model/scaler this goes through the fused pipeline artifact (see forecast_pipeline).
+def predict_batch(inputs, model=None, scaler=None):
+    if model is None and scaler is None:
+        from forecast_pipeline import load_pipeline
+        return load_pipeline().predict(inputs)
+    model = load_model() if model is None else model
+    scaler = load_scaler() if scaler is None else scaler
+    features = preprocess_batch(inputs)
+    return model.predict(scaler.transform(features))
+
+
+# P10 / P50 / P90 demand from the spread of the served forest's per-tree predictions.
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+class QuantilesUnavailable(TypeError):
+    """The served model is not an averaged forest, so it has no per-tree distribution."""
+
+
+def predict_quantiles_batch(inputs, quantiles=QUANTILES):
+    """(n, len(quantiles)) array; QuantilesUnavailable when the served model is not an averaged forest."""
+    from forecast_pipeline import load_pipeline
+    return load_pipeline().predict_quantiles(inputs, quantiles)
+
+
+# Deterministic random inputs in the ranges the app allows, for parity checks and benchmarks.
+def synthetic_inputs(n, seed=0, start_date='2024-01-01'):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(10, 5000, n).round(2)
+    return pd.DataFrame({
+        'Category': rng.choice(list(category_mapping), n),
+        'Brand': rng.choice(list(brand_mapping), n),
+        'Price': price,
+        'DiscountedPrice': (price * rng.uniform(0.5, 1.0, n)).round(2),
+        'Date': pd.Timestamp(start_date) + pd.to_timedelta(rng.integers(0, 366, n), unit='D'),
+        'Lag_1': rng.integers(0, 1000, n),
+        'Lag_7': rng.integers(0, 1000, n),
+        'RollingMean_7': rng.integers(0, 1000, n),
+    })
+
+
+# ------------------- RECURSIVE MULTI-DAY FORECAST -------------------
+MAX_HORIZON = 90
+LAG_COLUMNS = [FEATURES.index('Lag_1'), FEATURES.index('Lag_7'), FEATURES.index('RollingMean_7')]
+
+
+def _seed_history(lag_1, lag_7, rolling_mean):
+    # Last 7 days per product: day t-7 = Lag_7, day t-1 = Lag_1, the five days in
+    # between share what is left of 7 * RollingMean_7.
+    import numpy as np
+
+    middle = np.clip((7 * rolling_mean - lag_1 - lag_7) / 5, 0, None)
+    return np.column_stack([lag_7] + [middle] * 5 + [lag_1])
+
+
+def forecast_recursive(inputs, horizon, predict=None, interval=None):
+    """Forecast `horizon` days from each row's Date, feeding every prediction back into
+    Lag_1 / Lag_7 / RollingMean_7 for the next day.
+
+    `inputs` has the preprocess_batch columns (one row per product). Date features for
+    all products x days are built in one pass, then each day is a single batched
+    predict over all products. Returns an (n_products, horizon) array. `horizon` must be
+    1..MAX_HORIZON.
+
+    With `interval` (features -> (n, k) array, e.g. a pipeline's predict_quantiles_features),
+    it is also evaluated on each day's features and ((n, horizon), (n, horizon, k)) is
+    returned. The lags follow the point forecast, so the spread is the model's per-day
+    uncertainty, not error fed forward through the lags.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_HORIZON} days, got {horizon}")
+    if predict is None:
+        from forecast_pipeline import load_pipeline
+        predict = load_pipeline().predict_features
+
+    df = inputs if isinstance(inputs, pd.DataFrame) else pd.DataFrame(inputs)
+    n = len(df)
+    steps = np.repeat(np.arange(horizon), n)
+    days = df.iloc[np.tile(np.arange(n), horizon)].reset_index(drop=True)
+    days['Date'] = pd.to_datetime(days['Date']).to_numpy() + steps.astype('timedelta64[D]')
+    X = preprocess_batch(days).to_numpy(dtype=np.float64).reshape(horizon, n, len(FEATURES))
+
+    lag_1, lag_7, rolling_mean = (df[c].to_numpy(dtype=np.float64) for c in ('Lag_1', 'Lag_7', 'RollingMean_7'))
+    history = np.empty((n, 7 + horizon))
+    history[:, :7] = _seed_history(lag_1, lag_7, rolling_mean)
+    window_sum = 7 * rolling_mean
+    bounds = []
+    for h in range(horizon):
+        X[h][:, LAG_COLUMNS] = np.column_stack([history[:, 6 + h], history[:, h], window_sum / 7])
+        day = pd.DataFrame(X[h], columns=FEATURES)
+        y = np.asarray(predict(day), dtype=np.float64)
+        if interval is not None:
+            bounds.append(np.asarray(interval(day), dtype=np.float64))
+        history[:, 7 + h] = y
+        window_sum = window_sum + y - history[:, h]
+    if interval is not None:
+        return history[:, 7:], np.stack(bounds, axis=1)
+    return history[:, 7:]
+
+
+# Relative half-width of the band around day h, for models without per-tree quantiles.
+# Recursive forecasts feed their own errors forward, so the band grows with
+# sqrt(1 + h / 7) from the +/-15% at day 0.
+def forecast_band(horizon, base=0.15):
+    import numpy as np
+    return base * np.sqrt(1 + np.arange(horizon) / 7)
@@ -0,0 +1,217 @@
+"""Precomputed forecast cube served from a memory-mapped .npy file.
+
+The nightly job predicts every (category, brand, date, discount, Lag_1, Lag_7,
+RollingMean_7) combination on a fixed grid and writes `forecast_cube.<build>.npy`
+plus a small JSON header, `forecast_cube.json`, that names it. The data file is
+complete before the header is swapped in with os.replace, so readers always see a
+matching pair. The previous build's data file is kept for readers that are
+still opening it. The apps map the cube read-only, so every Streamlit worker
+shares the same pages, and a lookup is a handful of index computations. Inputs
+off the grid (or a cube built for another model) fall back to live inference.
+
+The lag grid covers the default inputs (150) and round what-if values. Lags
+prefilled from the feature store or sales history are whole units that rarely
+land on it, so those forecasts go through the prediction cache instead. Every
+lag level multiplies the cube by its cube (3 levels: 27 cells per discount);
+`--lag-levels` trades size for coverage.
+
+The last axis holds the outputs named in the header: the prediction, and for
+averaged forests also its P10 / P50 / P90 (from the same walk over the trees), so
+a lookup answers the whole forecast card without touching the model.
+
+    python forecast_cube.py [--start YYYY-MM-DD] [--days 366] [--out forecast_cube] [--lag-levels 100,150,200]
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+from forecast_core import BASE_DIR, QUANTILES, QuantilesUnavailable, brand_mapping, category_mapping
+
+CUBE_FORMAT_VERSION = 3
+CUBE_PATH = os.environ.get("FORECAST_CUBE_PATH", os.path.join(BASE_DIR, "forecast_cube"))
+CUBE_DAYS = 366                               # the apps allow today .. today + 365
+DISCOUNT_STEP = 5.0                           # DiscountPct grid: 0, 5, ..., 90
+DISCOUNT_LEVELS = 19
+LAG_LEVELS = (100, 150, 200)                  # shared grid for Lag_1, Lag_7 and RollingMean_7
+ON_GRID_TOLERANCE = 1e-6
+
+
+class ForecastCube:
+    def __init__(self, values, header):
+        self.values = values
+        self.header = header
+        self.start = date.fromisoformat(header["start_date"])
+        self.model_version = header["model_version"]
+        self.discount_step = header["discount_step"]
+        self._category = {name: i for i, name in enumerate(header["categories"])}
+        self._brand = {name: i for i, name in enumerate(header["brands"])}
+        self._lag = {float(level): i for i, level in enumerate(header["lag_levels"])}
+
+    def _discount_index(self, discount_pct):
+        i = round(discount_pct / self.discount_step)
+        if 0 <= i < self.values.shape[3] and abs(discount_pct - i * self.discount_step) <= ON_GRID_TOLERANCE:
+            return i
+        return None
+
+    def lookup(self, category, brand, forecast_date, price, discounted_price, lag_1, lag_7, rolling_mean):
+        """Precomputed outputs for one input (a tuple following header["outputs"]), or None when it is off the grid."""
+        if isinstance(forecast_date, datetime):
+            forecast_date = forecast_date.date()
+        day = (forecast_date - self.start).days
+        if not 0 <= day < self.values.shape[2]:
+            return None
+        index = (
+            self._category.get(category), self._brand.get(brand), day,
+            self._discount_index((price - discounted_price) / price * 100),
+            self._lag.get(float(lag_1)), self._lag.get(float(lag_7)), self._lag.get(float(rolling_mean)),
+        )
+        if None in index:
+            return None
+        return tuple(float(v) for v in self.values[index])
+
+
+def _grid_inputs(day, lag_levels):
+    import numpy as np
+    import pandas as pd
+
+    axes = [list(category_mapping), list(brand_mapping), np.arange(DISCOUNT_LEVELS) * DISCOUNT_STEP,
+            lag_levels, lag_levels, lag_levels]
+    mesh = np.meshgrid(*[np.arange(len(a)) for a in axes], indexing="ij")
+    idx = [m.ravel() for m in mesh]
+    discount = axes[2][idx[2]]
+    return pd.DataFrame({
+        "Category": np.asarray(axes[0])[idx[0]],
+        "Brand": np.asarray(axes[1])[idx[1]],
+        "Price": 100.0,
+        "DiscountedPrice": 100.0 - discount,
+        "Date": day,
+        "Lag_1": np.asarray(lag_levels)[idx[3]],
+        "Lag_7": np.asarray(lag_levels)[idx[4]],
+        "RollingMean_7": np.asarray(lag_levels)[idx[5]],
+    })
+
+
+def _grid_outputs(pipeline, inputs, quantiles):
+    import numpy as np
+
+    import forecast_core
+
+    features = forecast_core.preprocess_batch(inputs, encoders=pipeline.encoders)
+    if quantiles:
+        return pipeline.predict_with_quantiles_features(features, quantiles)
+    return np.asarray(pipeline.predict_features(features))[:, None]
+
+
+def build_cube(pipeline, start, out=CUBE_PATH, days=CUBE_DAYS, lag_levels=LAG_LEVELS):
+    import numpy as np
+    import pandas as pd
+
+    quantiles = list(QUANTILES)
+    try:
+        _grid_outputs(pipeline, _grid_inputs(pd.Timestamp(start), lag_levels).head(1), quantiles)
+    except QuantilesUnavailable:
+        quantiles = []
+    outputs = ["prediction"] + [f"p{round(q * 100)}" for q in quantiles]
+    shape = (len(category_mapping), len(brand_mapping), days, DISCOUNT_LEVELS) + (len(lag_levels),) * 3 + (len(outputs),)
+    build = time.time_ns()
+    data_file = f"{os.path.basename(out)}.{build}.npy"
+    data_path = os.path.join(os.path.dirname(out), data_file)
+    tmp = f"{data_path}.{os.getpid()}.tmp"
+    try:
+        values = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape)
+        for d in range(days):
+            inputs = _grid_inputs(pd.Timestamp(start) + pd.Timedelta(days=d), lag_levels)
+            preds = _grid_outputs(pipeline, inputs, quantiles).astype(np.float32)
+            values[:, :, d] = preds.reshape(shape[:2] + shape[3:])
+        values.flush()
+        del values
+        os.replace(tmp, data_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    header = {
+        "format_version": CUBE_FORMAT_VERSION,
+        "build": build,
+        "data_file": data_file,
+        "outputs": outputs,
+        "quantiles": quantiles,
+        "start_date": start.isoformat(),
+        "model_version": pipeline.model_version,
+        "categories": list(category_mapping),
+        "brands": list(brand_mapping),
+        "discount_step": DISCOUNT_STEP,
+        "lag_levels": list(lag_levels),
+        "shape": list(shape),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    tmp = f"{out}.json.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, f"{out}.json")   # publishes the new pair
+    _prune(out, keep=2)
+    return header
+
+
+def _prune(out, keep=2):
+    """Delete all but the newest `keep` data files (open mappings stay valid after unlink)."""
+    builds = sorted(glob.glob(f"{glob.escape(out)}.[0-9]*.npy"), key=lambda p: int(p.rsplit(".", 2)[-2]))
+    for path in builds[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_cube(path=CUBE_PATH, model_version=None):
+    """Memory-map the cube; None if it is missing or was built for a different model.
+
+    The mapping is cached per process and re-opened when the nightly job publishes a new header.
+    """
+    try:
+        st = os.stat(f"{path}.json")
+    except OSError:
+        return None
+    return _load_cube(path, model_version, (st.st_ino, st.st_mtime_ns))
+
+
+@lru_cache(maxsize=4)
+def _load_cube(path, model_version, stamp):
+    import numpy as np
+
+    try:
+        with open(f"{path}.json", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format_version") != CUBE_FORMAT_VERSION:
+            return None
+        values = np.load(os.path.join(os.path.dirname(path), header["data_file"]), mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        return None
+    if model_version is not None and header.get("model_version") != model_version:
+        return None
+    if list(values.shape) != header.get("shape"):
+        return None
+    return ForecastCube(values, header)
+
+
+if __name__ == "__main__":
+    from forecast_pipeline import load_pipeline
+
+    parser = argparse.ArgumentParser(description="Precompute the forecast cube for the apps.")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--days", type=int, default=CUBE_DAYS)
+    parser.add_argument("--out", default=CUBE_PATH)
+    parser.add_argument("--lag-levels", type=lambda s: tuple(float(v) for v in s.split(",")), default=LAG_LEVELS,
+                        help="comma list shared by Lag_1, Lag_7 and RollingMean_7")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    header = build_cube(load_pipeline(), args.start, args.out, args.days, args.lag_levels)
+    data_path = os.path.join(os.path.dirname(args.out), header["data_file"])
+    size = os.path.getsize(data_path) / 1e6
+    print(f"Built {data_path} {tuple(header['shape'])} ({size:.1f} MB) for model {header['model_version']} "
+          f"in {time.perf_counter() - started:.1f}s")
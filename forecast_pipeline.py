@@ -0,0 +1,451 @@
+"""Single versioned forecasting artifact: encoders + scaler + estimator.
+
+For sklearn tree ensembles the StandardScaler is folded into the split
+thresholds (x_scaled <= t  <=>  x <= t * scale + mean), so predict runs on the
+raw feature matrix with no transform step. Other estimators keep the scaler.
+Folded predictions match the unfolded model except for inputs lying within one
+float32 ulp of a split point (e.g. re-scoring the exact training rows).
+
+Tree models can also be saved as a flat artifact. This is a directory holding a
+JSON header plus the flattened node arrays as .npy files, each with a sha256.
+It loads with np.load(mmap_mode='r'), so cold start skips unpickling, and all
+worker processes share the same page-cache pages. `forecast_model.flat` is a
+symlink to a versioned directory (`forecast_model.flat.v<ns>`), so a new artifact
+is published with one atomic rename. A flat artifact older than the joblib
+pipeline is stale (a retrain that did not rewrite it), and the joblib is served instead.
+
+    python forecast_pipeline.py [model.pkl] [scaler.pkl] [forecast_pipeline.joblib]
+    python forecast_pipeline.py --flat [model.pkl] [scaler.pkl] [forecast_model.flat]
+"""
+import copy
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from functools import lru_cache
+
+import forecast_core
+from forecast_core import BASE_DIR, FEATURES
+from metrics import timed
+
+PIPELINE_FORMAT_VERSION = 1
+PIPELINE_PATH = os.environ.get("FORECAST_PIPELINE_PATH", os.path.join(BASE_DIR, "forecast_pipeline.joblib"))
+# Batches up to this many rows go through the flattened tree engine (tree_engine); larger
+# ones use the estimator's own compiled predict loop, which has the higher per-row throughput.
+ENGINE_MAX_ROWS = int(os.environ.get("FORECAST_ENGINE_MAX_ROWS", 2048))
+USE_TREE_ENGINE = os.environ.get("FORECAST_TREE_ENGINE", "1") != "0"
+FLAT_FORMAT_VERSION = 1
+FLAT_PATH = os.environ.get("FORECAST_FLAT_PATH", os.path.join(BASE_DIR, "forecast_model.flat"))
+# Array checksums are checked when an artifact is written; a load only checks header, sizes and
+# shapes, so it never reads the mapped pages. FORECAST_FLAT_VERIFY=1 hashes every array on load too.
+FLAT_VERIFY = os.environ.get("FORECAST_FLAT_VERIFY", "0") == "1"
+
+
+class ForecastPipeline:
+    def __init__(self, estimator, scaler, encoders, scaler_folded=False, model_version=None):
+        self.format_version = PIPELINE_FORMAT_VERSION
+        self.estimator = estimator
+        self.scaler = None if scaler_folded else scaler
+        self.encoders = encoders
+        self.features = list(FEATURES)
+        self.scaler_folded = scaler_folded
+        self.model_version = model_version or time.strftime("%Y%m%d%H%M%S")
+        self.engine = None
+        self.importances = None   # kept for flat artifacts, which have no estimator
+        self.permutation_importances = None   # {'mean', 'std', 'repeats', 'metric'} from ptr.permutation_importance
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["engine"] = None   # rebuilt by compile() after loading
+        return state
+
+    def compile(self):
+        """Attach a flattened tree engine when the estimator supports it."""
+        from tree_engine import compile_model
+
+        if self.estimator is None:   # flat artifact: the engine is the model
+            return self
+        try:
+            self.engine = compile_model(self.estimator)
+        except TypeError:
+            self.engine = None
+        return self
+
+    def transform(self, features):
+        import numpy as np
+
+        with timed("transform"):
+            if self.scaler is not None:
+                return self.scaler.transform(features)
+            return np.asarray(features, dtype=np.float64)
+
+    def predict_features(self, features):
+        X = self.transform(features)
+        engine = getattr(self, "engine", None)
+        with timed("predict"):
+            if engine is not None and (len(X) <= ENGINE_MAX_ROWS or self.estimator is None):
+                return engine.predict(X)
+            return self.estimator.predict(X)
+
+    def predict(self, inputs):
+        return self.predict_features(forecast_core.preprocess_batch(inputs, encoders=self.encoders))
+
+    def _per_tree(self, X):
+        """Per-tree outputs, shape (n, n_trees); QuantilesUnavailable unless the model is an
+        averaged forest (boosted trees are not separate estimates)."""
+        import numpy as np
+
+        engine = getattr(self, "engine", None)
+        if engine is not None:
+            if engine.aggregate != "mean":
+                raise forecast_core.QuantilesUnavailable("quantiles need an averaged forest, not a boosted one")
+            return engine.predict_trees(X)
+        from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+        if not isinstance(self.estimator, (RandomForestRegressor, ExtraTreesRegressor)):
+            raise forecast_core.QuantilesUnavailable(
+                f"quantiles need an averaged forest, not {type(self.estimator).__name__}")
+        return np.column_stack([tree.predict(X) for tree in self.estimator.estimators_])
+
+    def predict_quantiles_features(self, features, quantiles=forecast_core.QUANTILES):
+        """Per-row quantiles over the forest's trees, shape (n, len(quantiles))."""
+        import numpy as np
+
+        X = self.transform(features)
+        with timed("predict_quantiles"):
+            return np.quantile(self._per_tree(X), quantiles, axis=1).T
+
+    def predict_with_quantiles_features(self, features, quantiles=forecast_core.QUANTILES):
+        """The forest mean (what `predict_features` returns) and its quantiles from one walk over
+        the trees, shape (n, 1 + len(quantiles))."""
+        import numpy as np
+
+        X = self.transform(features)
+        with timed("predict_quantiles"):
+            per_tree = self._per_tree(X)
+            return np.column_stack([per_tree.mean(axis=1, dtype=np.float64), np.quantile(per_tree, quantiles, axis=1).T])
+
+    def predict_quantiles(self, inputs, quantiles=forecast_core.QUANTILES):
+        return self.predict_quantiles_features(forecast_core.preprocess_batch(inputs, encoders=self.encoders), quantiles)
+
+    @property
+    def feature_importances_(self):
+        if self.estimator is None:
+            return self.importances
+        return self.estimator.feature_importances_
+
+
+class _AffineScaler:
+    """StandardScaler.transform from stored mean_/scale_ (flat artifacts of unfolded models)."""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        import numpy as np
+
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+def _tree_estimators(estimator):
+    from sklearn.tree import BaseDecisionTree
+
+    if isinstance(estimator, BaseDecisionTree):
+        return [estimator]
+    members = getattr(estimator, "estimators_", None)
+    if members is None:
+        return None
+    trees = []
+    for member in getattr(members, "flat", members):
+        if not isinstance(member, BaseDecisionTree):
+            return None
+        trees.append(member)
+    return trees
+
+
+def _raw_thresholds(threshold, mean, scale):
+    """Largest float32 raw value whose scaled float32 value still goes left of `threshold`.
+
+    sklearn trees compare float32 inputs against float64 thresholds, so a plain
+    `t * scale + mean` can land one ulp on the wrong side of a training value.
+    """
+    import numpy as np
+
+    def goes_left(v):
+        return ((v.astype(np.float64) - mean) / scale).astype(np.float32) <= threshold
+
+    v = (threshold * scale + mean).astype(np.float32)
+    for _ in range(64):
+        up = np.nextafter(v, np.float32(np.inf))
+        step_up = goes_left(up)
+        step_down = ~goes_left(v)
+        if not (step_up.any() or step_down.any()):
+            break
+        v = np.where(step_up, up, np.where(step_down, np.nextafter(v, np.float32(-np.inf)), v))
+    return v.astype(np.float64)
+
+
+def fold_scaler(estimator, scaler):
+    """Return a copy of `estimator` whose thresholds live in raw feature space, or None."""
+    trees = _tree_estimators(estimator)
+    if not trees or scaler is None or not getattr(scaler, "with_mean", True) or not getattr(scaler, "with_std", True):
+        return None
+    folded = copy.deepcopy(estimator)
+    mean, scale = scaler.mean_, scaler.scale_
+    for tree in _tree_estimators(folded):
+        feature = tree.tree_.feature
+        threshold = tree.tree_.threshold   # view into the tree's node array
+        split = feature >= 0
+        threshold[split] = _raw_thresholds(threshold[split], mean[feature[split]], scale[feature[split]])
+    return folded
+
+
+def build_pipeline(model, scaler, model_version=None, classes=None):
+    """`classes` holds the training encoders' `classes_` ({"category": [...], "brand": [...]});
+    without it (legacy pickles) the app's hard-coded maps are used."""
+    if classes is None:
+        category, brand = dict(forecast_core.category_mapping), dict(forecast_core.brand_mapping)
+    else:
+        category = {name: code for code, name in enumerate(classes["category"])}
+        brand = {name: code for code, name in enumerate(classes["brand"])}
+    encoders = {"category": category, "brand": brand, "holidays": list(forecast_core.HOLIDAY_DATES)}
+    folded = fold_scaler(model, scaler)
+    if folded is not None:
+        return ForecastPipeline(folded, scaler, encoders, scaler_folded=True, model_version=model_version)
+    return ForecastPipeline(model, scaler, encoders, model_version=model_version)
+
+
+def artifact_version(path):
+    """Short fingerprint of an artifact file (size + mtime), stable across processes."""
+    import hashlib
+
+    st = os.stat(path)
+    return hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+def save_pipeline(pipeline, path=PIPELINE_PATH):
+    import joblib
+
+    joblib.dump(pipeline, path)
+
+
+def artifact_stamp(path=PIPELINE_PATH):
+    """(st_ino, st_mtime_ns) of each file `load_pipeline(path)` may read, None where missing.
+
+    Publishing any of them (a flat symlink swap, a rewritten joblib or pickle) changes the stamp.
+    """
+    files = (os.path.join(FLAT_PATH, "header.json"), os.path.join(path, "header.json"), path,
+             forecast_core.MODEL_PATH, forecast_core.SCALER_PATH)
+    stamp = []
+    for file in files:
+        try:
+            st = os.stat(file)
+            stamp.append((st.st_ino, st.st_mtime_ns))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def load_pipeline(path=PIPELINE_PATH):
+    """Load the forecasting artifact once per process, and again after it is republished.
+
+    Preference order: the flat artifact (FLAT_PATH, or `path` if it is a directory),
+    the joblib pipeline, then the legacy model + scaler pickles.
+    """
+    return _load_stamped(path, artifact_stamp(path))
+
+
+@lru_cache(maxsize=4)
+def _load_stamped(path, stamp):
+    with timed("artifact_load"):
+        pipeline = _load_pipeline(path)
+    pipeline.artifact_stamp = stamp
+    return pipeline
+
+
+def flat_is_stale(flat_path=FLAT_PATH, pipeline_path=PIPELINE_PATH):
+    """True when the joblib pipeline was written after the flat artifact."""
+    try:
+        return os.stat(pipeline_path).st_mtime_ns > os.stat(os.path.join(flat_path, "header.json")).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _load_pipeline(path):
+    if path == PIPELINE_PATH and os.path.isdir(FLAT_PATH):
+        if not flat_is_stale(FLAT_PATH, path):
+            return load_flat(FLAT_PATH)
+        print(f"{FLAT_PATH} is older than {path}; serving {path}. Rewrite the flat artifact "
+              f"(python forecast_pipeline.py --flat) or delete it.", file=sys.stderr)
+    if os.path.isdir(path):
+        return load_flat(path)
+    import joblib
+
+    if os.path.exists(path):
+        pipeline = joblib.load(path)
+        if getattr(pipeline, "format_version", None) != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported pipeline format {getattr(pipeline, 'format_version', None)!r}, "
+                             f"expected {PIPELINE_FORMAT_VERSION}")
+    else:
+        pipeline = build_pipeline(forecast_core.load_model(), forecast_core.load_scaler(),
+                                  model_version=artifact_version(forecast_core.MODEL_PATH))
+    return pipeline.compile() if USE_TREE_ENGINE else pipeline
+
+
+# ------------------- FLAT ARTIFACT -------------------
+def _header_digest(header):
+    import hashlib
+
+    body = {k: v for k, v in header.items() if k != "header_sha256"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def save_flat(pipeline, path=FLAT_PATH):
+    """Write `pipeline` as a flat artifact directory; TypeError if its model cannot be flattened."""
+    import numpy as np
+    from tree_engine import compile_model, load_arrays, save_arrays
+
+    engine = pipeline.engine if pipeline.engine is not None else compile_model(pipeline.estimator)
+    try:
+        importances = pipeline.feature_importances_
+    except AttributeError:
+        importances = None
+    tmp = f"{path}.v{time.time_ns()}"
+    os.makedirs(tmp)
+    header = {
+        "format_version": FLAT_FORMAT_VERSION,
+        "model_version": pipeline.model_version,
+        "features": list(pipeline.features),
+        "encoders": pipeline.encoders,
+        "scaler_folded": pipeline.scaler_folded,
+        "scaler": None if pipeline.scaler is None else {
+            "mean": np.asarray(pipeline.scaler.mean_).tolist(), "scale": np.asarray(pipeline.scaler.scale_).tolist()},
+        "importances": None if importances is None else np.asarray(importances, dtype=np.float64).tolist(),
+        "permutation_importances": getattr(pipeline, "permutation_importances", None),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        header["engine"] = save_arrays(engine, tmp)
+        header["header_sha256"] = _header_digest(header)
+        with open(os.path.join(tmp, "header.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        load_arrays(tmp, header["engine"], verify=True)   # checksums read back before publishing
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _publish(path, tmp)
+    return header
+
+
+def _versions(path):
+    """Version directories of the flat artifact at `path`, oldest first."""
+    found = [p for p in glob.glob(glob.escape(path) + ".v*") if p.rsplit(".v", 1)[1].isdigit()]
+    return sorted(found, key=lambda p: int(p.rsplit(".v", 1)[1]))
+
+
+def _publish(path, version_dir, keep=2):
+    """Point `path` at `version_dir` with one atomic symlink rename, then drop all but the newest
+    `keep` versions. Readers that resolved the old link keep reading the previous version."""
+    link = f"{path}.{os.getpid()}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    try:
+        os.symlink(os.path.basename(version_dir), link, target_is_directory=True)
+    except (OSError, NotImplementedError):   # no symlinks here (e.g. Windows without the privilege)
+        old = f"{path}.{os.getpid()}.old"
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(version_dir, path)
+        shutil.rmtree(old, ignore_errors=True)
+        return
+    if os.path.isdir(path) and not os.path.islink(path):
+        # A plain directory from an older release: moving it aside is the one non-atomic step
+        legacy = f"{path}.{os.getpid()}.legacy"
+        os.replace(path, legacy)
+        os.replace(link, path)
+        shutil.rmtree(legacy, ignore_errors=True)
+    else:
+        os.replace(link, path)
+    for stale in _versions(path)[:-keep]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def remove_flat(path=FLAT_PATH):
+    """Delete the flat artifact: the link and every version behind it."""
+    if os.path.islink(path):
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    for version in _versions(path):
+        shutil.rmtree(version, ignore_errors=True)
+
+
+def load_flat(path=FLAT_PATH, verify=FLAT_VERIFY):
+    """ForecastPipeline backed by memory-mapped node arrays; ValueError on a corrupt artifact.
+
+    The header checksum, array sizes, dtypes and shapes are always checked; `verify` also
+    hashes every array, which reads all of their pages.
+    """
+    import numpy as np
+    from tree_engine import load_arrays
+
+    path = os.path.realpath(path)   # header and arrays from the same version, even mid-publish
+    with open(os.path.join(path, "header.json"), encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format_version") != FLAT_FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported flat format {header.get('format_version')!r}, "
+                         f"expected {FLAT_FORMAT_VERSION}")
+    if header.get("header_sha256") != _header_digest(header):
+        raise ValueError(f"{path}: header checksum mismatch")
+    scaler = header["scaler"]
+    pipeline = ForecastPipeline(
+        None, None if scaler is None else _AffineScaler(np.asarray(scaler["mean"]), np.asarray(scaler["scale"])),
+        header["encoders"], scaler_folded=scaler is None, model_version=header["model_version"])
+    pipeline.features = header["features"]
+    pipeline.importances = None if header["importances"] is None else np.asarray(header["importances"])
+    pipeline.permutation_importances = header.get("permutation_importances")
+    pipeline.engine = load_arrays(path, header["engine"], verify=verify)
+    return pipeline
+
+
+if __name__ == "__main__":
+    import joblib
+
+    args = sys.argv[1:]
+    if "--verify" in args:   # python forecast_pipeline.py --verify [forecast_model.flat]
+        args = [a for a in args if a != "--verify"]
+        path = args[0] if args else FLAT_PATH
+        started = time.perf_counter()
+        try:
+            load_flat(path, verify=True)
+        except (OSError, ValueError) as exc:
+            print(f"{path}: FAILED {exc}")
+            sys.exit(1)
+        print(f"{path}: checksums OK in {(time.perf_counter() - started) * 1e3:.1f} ms")
+        sys.exit(0)
+    flat = "--flat" in args
+    args = [a for a in args if a != "--flat"]
+    model_path = args[0] if len(args) > 0 else forecast_core.MODEL_PATH
+    scaler_path = args[1] if len(args) > 1 else forecast_core.SCALER_PATH
+    out_path = args[2] if len(args) > 2 else (FLAT_PATH if flat else PIPELINE_PATH)
+    started = time.perf_counter()
+    # The flat artifact keeps the pickle's version so caches and cubes built for it stay valid
+    pipeline = build_pipeline(joblib.load(model_path), joblib.load(scaler_path),
+                              model_version=artifact_version(model_path) if flat else None)
+    if flat:
+        header = save_flat(pipeline, out_path)
+        size = sum(a["bytes"] for a in header["engine"]["arrays"].values()) / 1e6
+        print(f"Saved {out_path}/ ({size:.1f} MB of arrays, version {pipeline.model_version}) "
+              f"in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        load_flat(out_path)
+        print(f"Reload: {(time.perf_counter() - started) * 1e3:.1f} ms")
+    else:
+        save_pipeline(pipeline, out_path)
+        print(f"Saved {out_path} (scaler folded: {pipeline.scaler_folded}, version {pipeline.model_version})")
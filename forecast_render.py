@@ -0,0 +1,465 @@
+"""Render layer for the forecast panels shared by PP.py and PT.py.
+
+A click computes a `Forecast` once and the app keeps it in st.session_state, so
+later reruns redraw it instead of losing it. Everything a panel draws (HTML
+cards, the recursive daily forecast, Plotly figures, sorted importances) is
+cached per forecast / horizon / model, so a rerun only re-sends it. Panels
+with their own widgets are st.fragment functions, so touching one reruns only
+that panel.
+"""
+import os
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache, partial
+
+import streamlit as st
+
+import metrics
+from forecast_core import (MAX_HORIZON, QUANTILES, QuantilesUnavailable, forecast_band, forecast_recursive,
+                           preprocess_input)
+from forecast_cube import load_cube
+from prediction_cache import cached_predict, cached_predict_with_quantiles
+
+SESSION_KEY = "forecast"
+INPUT_FIELDS = ("Category", "Brand", "Price", "DiscountedPrice", "Date", "Lag_1", "Lag_7", "RollingMean_7")
+
+# `inputs` follows INPUT_FIELDS; lower / median / upper are P10 / P50 / P90 when the model has per-tree
+# quantiles (`interval` says which). The random display values are drawn once per forecast so reruns keep them.
+Forecast = namedtuple("Forecast", "inputs model_version prediction lower median upper interval trend "
+                                  "turnover_days reorder_days lead_time")
+
+
+# ------------------- LAG INPUTS -------------------
+LAG_MAX = 1000   # the lag inputs' range; the model was trained on UnitsSold of roughly 0-300
+
+
+def prefilled_lags(category, brand, forecast_date):
+    """(Lag_1, Lag_7, RollingMean_7, as_of, source, (first, last) day of the window) from the
+    per-series feature store, else the category order history (rescaled to units); None when
+    neither covers the series at `forecast_date`."""
+    from feature_store import load_store
+    from lag_provider import load_history
+
+    store = load_store()
+    lags = store.lags(category, brand, forecast_date) if store else None
+    if lags is not None:
+        return lags + (f"{category} / {brand} feature store", store.window(category, brand))
+    history = load_history()
+    lags = history.lags(category, forecast_date) if history else None
+    if lags is not None:
+        as_of = lags[3]
+        return lags + (f"{history.resolve(category)} sales history", (as_of - timedelta(days=7), as_of - timedelta(days=1)))
+    return None
+
+
+def lag_inputs(category, brand, forecast_date):
+    """The three lag number_inputs, prefilled from history and labelled with the days they
+    describe; they stay editable for what-if runs."""
+    prefill = prefilled_lags(category, brand, forecast_date)
+    labels = ["Units Sold Yesterday", "7-Day Avg Sales", "7-Day Rolling Mean"]
+    values = [150, 150, 150]
+    if prefill is not None:
+        as_of, source, (first, last) = prefill[3:]
+        values = [min(LAG_MAX, max(0, int(round(v)))) for v in prefill[:3]]
+        labels = [f"{labels[0]} ({last:%d %b %Y})",
+                  f"{labels[1]} ({first:%d %b %Y})",
+                  f"{labels[2]} ({first:%d %b} - {last:%d %b %Y})"]
+        stale = (forecast_date - as_of).days
+        st.caption(f"From {source}" + (f", which ends {stale} days before the forecast date" if stale > 0 else ""))
+    return tuple(st.number_input(label, min_value=0, max_value=LAG_MAX, value=value, step=5)
+                 for label, value in zip(labels, values))
+
+
+def forecast_inputs(category, brand, price, discounted_price, forecast_date, lag_1, lag_7, rolling_mean):
+    return (category, brand, price, discounted_price, forecast_date, lag_1, lag_7, rolling_mean)
+
+
+def _input_data(inputs):
+    return dict(zip(INPUT_FIELDS[:5], inputs[:5]))
+
+
+def compute_forecast(pipeline, inputs):
+    import numpy as np
+
+    category, brand, price, discounted_price, forecast_date, lag_1, lag_7, rolling_mean = inputs
+    features = preprocess_input(_input_data(inputs), lag_1, lag_7, rolling_mean)
+    # Precomputed cube answers on-grid inputs in O(1); anything else runs the model live, once
+    # per distinct input: the point value and its quantiles come from one walk and are cached together
+    cube = load_cube(model_version=pipeline.model_version)
+    outputs = cube.lookup(category, brand, forecast_date, price, discounted_price, lag_1, lag_7, rolling_mean) if cube else None
+    if outputs is None:
+        try:
+            outputs = cached_predict_with_quantiles(pipeline, features, QUANTILES)[0]
+        except QuantilesUnavailable:
+            outputs = cached_predict(pipeline, features)
+    prediction = float(outputs[0])
+    if len(outputs) == 1 + len(QUANTILES):
+        lower, median, upper = (float(q) for q in outputs[1:])
+        interval = "P10 - P90 across the forest's trees"
+    else:   # boosted or non-tree model: fixed band
+        lower, median, upper = max(0, prediction * 0.85), prediction, prediction * 1.15
+        interval = "±15% of the prediction"
+    return Forecast(
+        inputs, pipeline.model_version, prediction, lower, median, upper, interval,
+        str(np.random.choice(['Upward', 'Stable', 'Seasonal'])), int(np.random.randint(3, 8)),
+        int(np.random.randint(3, 6)), (int(np.random.randint(1, 3)), int(np.random.randint(3, 5))),
+    )
+
+
+# ------------------- CACHED SPECS -------------------
+# Each day's point and P10 / P90 come from one cached walk: the band call is a cache hit
+def _cached_point(pipeline, features):
+    return cached_predict_with_quantiles(pipeline, features, QUANTILES)[:, 0]
+
+
+def _cached_band(pipeline, features):
+    return cached_predict_with_quantiles(pipeline, features, QUANTILES)[:, [1, -1]]
+
+
+@lru_cache(maxsize=64)
+def daily_forecast(pipeline, forecast, horizon):
+    """(dates, predictions, lower, upper) for `horizon` days from the forecast date."""
+    import numpy as np
+
+    inputs = forecast.inputs
+    dates = [inputs[4] + timedelta(days=i) for i in range(horizon)]
+    rows = [dict(_input_data(inputs), Lag_1=inputs[5], Lag_7=inputs[6], RollingMean_7=inputs[7])]
+    # Recursive forecast: each day's prediction feeds the next day's lag features
+    try:
+        daily_preds, bounds = forecast_recursive(rows, horizon, partial(_cached_point, pipeline),
+                                                 interval=partial(_cached_band, pipeline))
+        return dates, daily_preds[0], bounds[0, :, 0], bounds[0, :, 1]
+    except QuantilesUnavailable:   # no per-tree quantiles: band widening with the horizon
+        daily_preds = forecast_recursive(rows, horizon, partial(cached_predict, pipeline))[0]
+        band = forecast_band(horizon)
+        return dates, daily_preds, np.maximum(0, daily_preds * (1 - band)), daily_preds * (1 + band)
+
+
+@lru_cache(maxsize=64)
+def forecast_figure(pipeline, forecast, horizon):
+    import plotly.graph_objects as go
+
+    dates, daily_preds, lower, upper = daily_forecast(pipeline, forecast, horizon)
+    fig = go.Figure()
+
+    # Add confidence interval
+    fig.add_trace(go.Scatter(
+        x=dates,
+        y=upper,
+        fill=None,
+        mode='lines',
+        line_color='rgba(255,107,107,0.2)',
+        name='Upper Bound',
+        hoverinfo='skip'
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=dates,
+        y=lower,
+        fill='tonexty',
+        mode='lines',
+        line_color='rgba(255,107,107,0.2)',
+        name='Lower Bound',
+        hoverinfo='skip'
+    ))
+
+    # Add main line
+    fig.add_trace(go.Scatter(
+        x=dates,
+        y=daily_preds,
+        mode='lines+markers',
+        line=dict(color='#4a6bff', width=4),
+        marker=dict(size=10, color='white', line=dict(width=2, color='#4a6bff')),
+        name='Predicted Demand',
+        hovertemplate='<b>%{x|%a, %b %d}</b><br>%{y:.0f} units<extra></extra>'
+    ))
+
+    # Update layout
+    fig.update_layout(
+        height=500,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        margin=dict(l=20, r=20, t=40, b=20),
+        hovermode='x unified',
+        xaxis=dict(
+            showgrid=True,
+            gridcolor='#f0f0f0',
+            tickformat='%a, %b %d',
+            tickfont=dict(color='#7f8c8d')
+        ),
+        yaxis=dict(
+            title='Units Sold',
+            showgrid=True,
+            gridcolor='#f0f0f0',
+            tickfont=dict(color='#7f8c8d')
+        ),
+        legend=dict(
+            orientation='h',
+            yanchor='bottom',
+            y=1.02,
+            xanchor='right',
+            x=1
+        ),
+        title=dict(
+            text=f'{horizon}-Day Demand Forecast',
+            font=dict(size=20, color='#2c3e50'),
+            x=0.05,
+            xanchor='left'
+        )
+    )
+    return fig
+
+
+@lru_cache(maxsize=8)
+def importance_figure(pipeline):
+    """Sorted feature-importance bar chart, built once per model; None without importances.
+
+    Prefers the permutation importances computed at training time (drop in R² on held-out
+    rows) over impurity importances, which favour high-cardinality features like DayOfYear.
+    """
+    import numpy as np
+    import plotly.graph_objects as go
+
+    permutation = getattr(pipeline, 'permutation_importances', None)
+    if permutation is not None:
+        importances, error = np.asarray(permutation['mean']), np.asarray(permutation['std'])
+        title, axis_title = 'Permutation Importance', 'Drop in R² when shuffled'
+    else:
+        importances, error = getattr(pipeline, 'feature_importances_', None), None   # also served by flat artifacts
+        title, axis_title = 'Feature Importance', 'Importance Score'
+    if importances is None:
+        return None
+    order = np.argsort(importances, kind='stable')
+
+    fig2 = go.Figure(go.Bar(
+        x=np.asarray(importances)[order],
+        y=[pipeline.features[i] for i in order],
+        orientation='h',
+        error_x=None if error is None else dict(type='data', array=error[order], color='#7f8c8d'),
+        marker=dict(
+            color='#4a6bff',
+            line=dict(color='#4a6bff', width=1)
+    )))
+
+    fig2.update_layout(
+        height=500,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        margin=dict(l=20, r=20, t=40, b=20),
+        xaxis=dict(
+            title=axis_title,
+            showgrid=True,
+            gridcolor='#f0f0f0',
+            tickfont=dict(color='#7f8c8d')
+        ),
+        yaxis=dict(
+            showgrid=False,
+            tickfont=dict(color='#7f8c8d')
+        ),
+        title=dict(
+            text=title,
+            font=dict(size=20, color='#2c3e50'),
+            x=0.05,
+            xanchor='left'
+        )
+    )
+    return fig2
+
+
+@lru_cache(maxsize=64)
+def metric_cards(forecast):
+    prediction, lower, upper = forecast.prediction, forecast.lower, forecast.upper
+    forecast_date = forecast.inputs[4]
+    stock_level = int(round(prediction/2))
+    progress = min(100, stock_level)
+    return (f"""
+            <div class='metric-card pulse-animation'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span class='feature-icon'>📦</span>
+                    <h3 style="margin: 0; font-weight: 600;">Predicted Demand</h3>
+                </div>
+                <h1 style="color: var(--primary); margin: 0; font-size: 2.5rem;">{int(round(prediction)):,} units</h1>
+                <p style="color: #7f8c8d; margin-top: 10px;">for <span class='date-highlight'>{forecast_date.strftime('%b %d, %Y')}</span></p>
+                <div style="margin-top: 20px; background: rgba(74, 107, 255, 0.05); padding: 12px; border-radius: 12px;">
+                    <p style="margin: 0; font-size: 0.9rem; color: var(--primary);">📈 <b>Trend:</b> {forecast.trend}</p>
+                </div>
+            </div>
+        """, f"""
+            <div class='metric-card'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span class='feature-icon'>📊</span>
+                    <h3 style="margin: 0; font-weight: 600;">Confidence Range</h3>
+                </div>
+                <h2 style="color: var(--secondary); margin: 0; font-size: 2rem;">{int(round(lower)):,} - {int(round(upper)):,} units</h2>
+                <p style="color: #7f8c8d; margin-top: 10px;">{forecast.interval}, median {int(round(forecast.median)):,}</p>
+                <div style="margin-top: 20px;">
+                    <div style="background: #f1f8fe; height: 10px; border-radius: 8px; overflow: hidden;">
+                        <div style="background: var(--gradient-primary);
+                                    width: 100%; height: 10px; border-radius: 8px;"></div>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; margin-top: 8px;">
+                        <span style="font-size: 0.8rem; color: #7f8c8d;">Lower bound</span>
+                        <span style="font-size: 0.8rem; color: #7f8c8d;">Upper bound</span>
+                    </div>
+                </div>
+            </div>
+        """, f"""
+            <div class='metric-card'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span class='feature-icon'>📈</span>
+                    <h3 style="margin: 0; font-weight: 600;">Inventory Health</h3>
+                </div>
+                <div style="display: flex; align-items: center; justify-content: space-between;">
+                    <div>
+                        <h2 style="color: var(--success); margin: 0; font-size: 2rem;">{stock_level:,} units</h2>
+                        <p style="color: #7f8c8d; margin-top: 5px;">Recommended stock level</p>
+                    </div>
+                    <div style="width: 80px; height: 80px; position: relative;">
+                        <svg viewBox="0 0 36 36" style="transform: rotate(-90deg); width: 100%; height: 100%;">
+                            <path d="M18 2.0845
+                                    a 15.9155 15.9155 0 0 1 0 31.831
+                                    a 15.9155 15.9155 0 0 1 0 -31.831"
+                                fill="none"
+                                stroke="#eee"
+                                stroke-width="3"
+                                stroke-dasharray="100, 100"/>
+                            <path d="M18 2.0845
+                                    a 15.9155 15.9155 0 0 1 0 31.831
+                                    a 15.9155 15.9155 0 0 1 0 -31.831"
+                                fill="none"
+                                stroke="url(#gradient)"
+                                stroke-width="3"
+                                stroke-dasharray="{progress}, 100"/>
+                        </svg>
+                        <div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-weight: 600; color: var(--success);">{progress}%</div>
+                    </div>
+                </div>
+                <div style="margin-top: 15px; background: rgba(107, 255, 160, 0.05); padding: 12px; border-radius: 12px;">
+                    <p style="margin: 0; font-size: 0.9rem; color: var(--success);">🔄 <b>Turnover:</b> {forecast.turnover_days} days</p>
+                </div>
+            </div>
+        """)
+
+
+@lru_cache(maxsize=64)
+def recommendation_cards(forecast):
+    lower, upper = forecast.lower, forecast.upper
+    price, discounted_price = forecast.inputs[2], forecast.inputs[3]
+    discount_effect = ((price - discounted_price) / price) * 100
+    return (f"""
+            <div class='recommendation-card'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span style="font-size: 28px; margin-right: 12px; background: rgba(74, 107, 255, 0.1); padding: 12px; border-radius: 12px;">📦</span>
+                    <h4 style="margin: 0; font-weight: 600;">Inventory Planning</h4>
+                </div>
+                <p style="color: #555; line-height: 1.6;">Maintain stock between <b style="color: var(--primary);">{int(round(lower)):,}-{int(round(upper)):,} units</b> to meet
+                expected demand while minimizing overstock.</p>
+                <div style="margin-top: 20px; background: rgba(74, 107, 255, 0.05); padding: 12px; border-radius: 12px;">
+                    <p style="margin: 0; font-size: 0.9rem; color: var(--primary);"><b>📌 Pro Tip:</b> Increase stock by 15% on weekends and 25% before holidays.</p>
+                </div>
+            </div>
+        """, f"""
+            <div class='recommendation-card'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span style="font-size: 28px; margin-right: 12px; background: rgba(255, 107, 107, 0.1); padding: 12px; border-radius: 12px;">💰</span>
+                    <h4 style="margin: 0; font-weight: 600;">Pricing Strategy</h4>
+                </div>
+                <p style="color: #555; line-height: 1.6;">Current discount of <b style="color: var(--secondary);">{discount_effect:.1f}%</b> is effective. Consider these optimizations:</p>
+                <ul style="margin-top: 10px; padding-left: 20px; color: #555; line-height: 1.8;">
+                    <li>Increase discount to <b>25%</b> on weekdays</li>
+                    <li>Reduce to <b>15%</b> on weekends</li>
+                    <li>Flash sales during low-traffic hours</li>
+                </ul>
+                <div style="margin-top: 15px;">
+                    <div style="background: #f5f5f5; height: 8px; border-radius: 4px; overflow: hidden;">
+                        <div style="background: var(--gradient-secondary); width: {min(100, discount_effect*3)}%; height: 8px;"></div>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; margin-top: 5px;">
+                        <span style="font-size: 0.8rem; color: #7f8c8d;">Current</span>
+                        <span style="font-size: 0.8rem; color: #7f8c8d;">Optimal</span>
+                    </div>
+                </div>
+            </div>
+        """, f"""
+            <div class='recommendation-card'>
+                <div style="display: flex; align-items: center; margin-bottom: 15px;">
+                    <span style="font-size: 28px; margin-right: 12px; background: rgba(107, 255, 160, 0.1); padding: 12px; border-radius: 12px;">🔄</span>
+                    <h4 style="margin: 0; font-weight: 600;">Replenishment</h4>
+                </div>
+                <p style="color: #555; line-height: 1.6;">Based on lead time analysis and demand patterns:</p>
+                <ul style="margin-top: 10px; padding-left: 20px; color: #555; line-height: 1.8;">
+                    <li>Place order when stock reaches <b style="color: var(--success);">{int(round(lower/2)):,} units</b></li>
+                    <li>Optimal order quantity: <b style="color: var(--success);">{int(round(upper*1.2)):,} units</b></li>
+                    <li>Reorder frequency: every <b>{forecast.reorder_days} days</b></li>
+                </ul>
+                <div style="margin-top: 15px; background: rgba(107, 255, 160, 0.05); padding: 12px; border-radius: 12px;">
+                    <p style="margin: 0; font-size: 0.9rem; color: var(--success);">⏱️ <b>Lead Time:</b> {forecast.lead_time[0]}-{forecast.lead_time[1]} days</p>
+                </div>
+            </div>
+        """)
+
+
+# ------------------- PANELS -------------------
+def _cards(html_blocks):
+    for col, html in zip(st.columns(len(html_blocks)), html_blocks):
+        with col:
+            st.markdown(html, unsafe_allow_html=True)
+
+
+@st.fragment
+def chart_panel(pipeline, forecast, horizon=None):
+    """Daily forecast chart; without a `horizon` it has its own slider, which reruns only this panel."""
+    if horizon is None:
+        horizon = st.slider("Forecast Horizon (days)", min_value=7, max_value=MAX_HORIZON, value=7, key="forecast_horizon")
+    st.markdown(f"## 📈 {horizon}-Day Demand Forecast")
+    with metrics.timed("chart_render"):
+        st.plotly_chart(forecast_figure(pipeline, forecast, horizon), use_container_width=True)
+
+
+def forecast_panels(pipeline, forecast, horizon=None):
+    # Prediction Results
+    st.markdown("## 📊 Forecast Results")
+    _cards(metric_cards(forecast))
+
+    # Demand Forecast Chart
+    chart_panel(pipeline, forecast, horizon)
+
+    # Feature Importance
+    st.markdown("## 🔍 Feature Importance Analysis")
+    with metrics.timed("chart_render"):
+        fig2 = importance_figure(pipeline)
+        if fig2 is not None:
+            st.plotly_chart(fig2, use_container_width=True)
+
+    # Recommendation Section
+    st.markdown("## 🚀 Smart Recommendations")
+    _cards(recommendation_cards(forecast))
+
+
+def show_forecast(pipeline, inputs, submitted, horizon=None):
+    """Compute on submit, keep the result in session state, and draw the last result; False if there is none."""
+    if submitted:
+        st.session_state[SESSION_KEY] = compute_forecast(pipeline, inputs)
+    forecast = st.session_state.get(SESSION_KEY)
+    if forecast is None:
+        return False
+    if forecast.inputs != inputs or forecast.model_version != pipeline.model_version:
+        st.info("Showing the forecast for the last submitted inputs. Generate again to update it.")
+    forecast_panels(pipeline, forecast, horizon)
+    return True
+
+
+# ------------------- DIAGNOSTICS -------------------
+DIAGNOSTICS = os.environ.get("FORECAST_DIAGNOSTICS", "0") == "1"
+
+
+def diagnostics_panel():
+    """Per-stage latency table from this process' histograms (FORECAST_DIAGNOSTICS=1)."""
+    rows = ["| Stage | Count | Mean ms | p50 ms | p90 ms | p99 ms |", "|---|---:|---:|---:|---:|---:|"]
+    for stage, s in metrics.summary().items():
+        rows.append(f"| {stage} | {s['count']:,} | {s['mean'] * 1e3:.2f} | {s['p50'] * 1e3:.2f} | "
+                    f"{s['p90'] * 1e3:.2f} | {s['p99'] * 1e3:.2f} |")
+    with st.expander("Diagnostics: stage latency (this process)"):
+        st.markdown("\n".join(rows))
+        st.caption("Percentiles are interpolated within histogram buckets. "
+                   "forecast_service.py serves the same histograms on GET /metrics.")
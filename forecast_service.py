@@ -0,0 +1,271 @@
+"""Local HTTP/JSON forecast service with adaptive micro-batching (stdlib asyncio only).
+
+    POST /predict   {"Category": ..., "Brand": ..., "Price": ..., "DiscountedPrice": ...,
+                     "Date": "YYYY-MM-DD", "Lag_1": ..., "Lag_7": ..., "RollingMean_7": ...}
+                    or {"inputs": [ {...}, ... ]}
+                 -> {"predictions": [...], "model_version": "..."}
+    GET  /health
+    GET  /metrics   per-stage latency histograms, Prometheus text format
+
+Concurrent requests are merged into one featurize + predict call of up to
+`max_batch` rows. The batcher waits at most `max_wait` for more rows, and only
+when recent traffic suggests they will arrive in time. When `max_queue`
+requests are already waiting, new ones get 503 with Retry-After.
+
+    python forecast_service.py [--port 8502] [--max-batch 256] [--max-wait-ms 5] [--max-queue 1024]
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from datetime import datetime
+
+import forecast_core
+import metrics
+from forecast_core import brand_mapping, category_mapping
+
+REQUIRED_FIELDS = ("Category", "Brand", "Price", "DiscountedPrice", "Date", "Lag_1", "Lag_7", "RollingMean_7")
+MAX_BODY_BYTES = 1 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch=256, max_wait=0.005, max_queue=1024):
+        self.predict_fn = predict_fn      # list of input dicts -> sequence of floats
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.interarrival = max_wait      # EWMA of seconds between requests
+        self._last_arrival = None
+        self.batches = self.rows = 0
+
+    async def submit(self, rows):
+        now = time.perf_counter()
+        if self._last_arrival is not None:
+            self.interarrival = 0.9 * self.interarrival + 0.1 * (now - self._last_arrival)
+        self._last_arrival = now
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((rows, future))
+        except asyncio.QueueFull:
+            raise QueueFull() from None
+        return await future
+
+    def _wait_budget(self, pending_rows):
+        # Only hold the batch open if the expected next arrival lands inside max_wait.
+        if self.interarrival >= self.max_wait:
+            return 0.0
+        return min(self.max_wait, self.interarrival * (self.max_batch - pending_rows))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            n_rows = len(batch[0][0])
+            deadline = loop.time() + self._wait_budget(n_rows)
+            while n_rows < self.max_batch:
+                if not self.queue.empty():
+                    item = self.queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(item)
+                n_rows += len(item[0])
+            await self._flush(batch, loop)
+
+    async def _flush(self, batch, loop):
+        rows = [row for item_rows, _ in batch for row in item_rows]
+        try:
+            # Featurize + predict off the event loop so new requests keep queueing meanwhile.
+            preds = await loop.run_in_executor(None, self.predict_fn, rows)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.batches += 1
+        self.rows += len(rows)
+        start = 0
+        for item_rows, future in batch:
+            if not future.done():
+                future.set_result([float(p) for p in preds[start:start + len(item_rows)]])
+            start += len(item_rows)
+
+
+def _finite(value):
+    try:
+        return math.isfinite(value)
+    except OverflowError:   # ints too large for a float
+        return False
+
+
+def validate(payload):
+    rows = payload.get("inputs", [payload]) if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("expected an input object or {\"inputs\": [...]}")
+    canonical = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise ValueError(f"input {i}: expected an object")
+        missing = [f for f in REQUIRED_FIELDS if f not in row]
+        if missing:
+            raise ValueError(f"input {i}: missing {', '.join(missing)}")
+        if row["Category"] not in category_mapping:
+            raise ValueError(f"input {i}: unknown Category {row['Category']!r}")
+        if row["Brand"] not in brand_mapping:
+            raise ValueError(f"input {i}: unknown Brand {row['Brand']!r}")
+        for field in ("Price", "DiscountedPrice", "Lag_1", "Lag_7", "RollingMean_7"):
+            if isinstance(row[field], bool) or not isinstance(row[field], (int, float)):
+                raise ValueError(f"input {i}: {field} must be a number")
+            if not _finite(row[field]):   # json.loads accepts NaN and Infinity
+                raise ValueError(f"input {i}: {field} must be finite")
+        if not row["Price"] > 0:
+            raise ValueError(f"input {i}: Price must be positive")
+        # The whole string must parse, and every queued row carries YYYY-MM-DD, so rows in
+        # different ISO spellings can share a batch
+        if not isinstance(row["Date"], str):
+            raise ValueError(f"input {i}: Date must be an ISO date string")
+        try:
+            day = datetime.fromisoformat(row["Date"]).date()
+        except ValueError:
+            raise ValueError(f"input {i}: Date {row['Date']!r} is not an ISO date") from None
+        canonical.append(dict(row, Date=day.isoformat()))
+    return canonical
+
+
+def make_predict_fn(pipeline):
+    from prediction_cache import cached_predict
+
+    def predict(rows):
+        return cached_predict(pipeline, forecast_core.preprocess_batch(rows, encoders=pipeline.encoders))
+    return predict
+
+
+class ForecastService:
+    def __init__(self, pipeline, batcher):
+        self.pipeline = pipeline
+        self.batcher = batcher
+
+    async def handle(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok", "model_version": self.pipeline.model_version,
+                         "queued": self.batcher.queue.qsize(), "batches": self.batcher.batches,
+                         "rows": self.batcher.rows}
+        if path == "/metrics":
+            return 200, metrics.render_prometheus(dict(metrics.cache_gauges(), **{
+                "forecast_service_queued": ("Requests waiting for a batch.", self.batcher.queue.qsize()),
+                "forecast_service_batches": ("Batches run since start.", self.batcher.batches),
+                "forecast_service_rows": ("Rows predicted since start.", self.batcher.rows),
+            }))
+        if path != "/predict":
+            return 404, {"error": f"no route {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        with metrics.timed("service_request"):
+            return await self._predict(body)
+
+    async def _predict(self, body):
+        try:
+            rows = validate(json.loads(body or b"null"))
+        except (ValueError, TypeError) as exc:
+            return 400, {"error": str(exc)}
+        try:
+            preds = await self.batcher.submit(rows)
+        except QueueFull:
+            return 503, {"error": "forecast queue is full, retry later"}
+        except Exception as exc:
+            return 500, {"error": f"prediction failed: {exc}"}
+        return 200, {"predictions": preds, "model_version": self.pipeline.model_version}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                raw_length = headers.get("content-length", "0")
+                # Digits only: int() would also take "+5", "-1" and "1_0"
+                length = int(raw_length) if raw_length.isascii() and raw_length.isdigit() else None
+                if length is None:
+                    status, payload = 400, {"error": f"invalid Content-Length {raw_length!r}"}
+                elif length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "request body too large"}
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.handle(method, path.split("?", 1)[0], body)
+                # Without a valid length the body's end is unknown, so the connection cannot be reused
+                keep_alive = headers.get("connection", "").lower() != "close" and length is not None
+                self._write(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive or status == 413:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write(writer, status, payload, keep_alive):
+        if isinstance(payload, str):   # /metrics
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        headers = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+
+async def serve(host="127.0.0.1", port=8502, max_batch=256, max_wait=0.005, max_queue=1024):
+    from forecast_pipeline import load_pipeline
+
+    pipeline = load_pipeline()
+    batcher = MicroBatcher(make_predict_fn(pipeline), max_batch, max_wait, max_queue)
+    service = ForecastService(pipeline, batcher)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    print(f"Forecast service on http://{host}:{port} (model {pipeline.model_version}, "
+          f"max_batch={max_batch}, max_wait={max_wait * 1e3:.1f}ms, max_queue={max_queue})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast HTTP/JSON service with micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=1024)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch, args.max_wait_ms / 1e3, args.max_queue))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,303 @@
+"""Budgeted hyperparameter search (Hyperband over successive-halving brackets).
+
+Configurations are drawn from SEARCH_SPACES and first scored on a small slice of
+the budget, a fraction r of the most recent training rows and of n_estimators.
+The best 1/eta of each rung move on to eta times the budget until r = 1.
+Boosters also stop early, on the most recent EARLY_STOPPING_FRACTION of their fit
+rows, so the validation block that ranks them is never used to pick their tree
+count. Every rung of every model runs in parallel on a process pool, and the
+search stops at the wall-clock budget. Evaluations that are already running at
+that point still finish.
+
+Finished evaluations go to a checkpoint JSON after each result. Configurations
+are drawn from a seeded RNG, so a rerun regenerates the same brackets and only
+computes what is missing. The winning configuration per model is written to
+best_params.json, which ptr.build_model picks up. For boosters, it is written with
+the number of trees early stopping kept rather than the sampled n_estimators.
+Evaluations that failed are never picked.
+
+    python hpsearch.py [--budget-minutes 30] [--models XGBoost,RandomForest]
+                       [--checkpoint hpsearch_checkpoint.json] [--out best_params.json]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+CHECKPOINT_FORMAT_VERSION = 2
+EARLY_STOPPING_ROUNDS = 50
+EARLY_STOPPING_FRACTION = 0.1   # most recent share of the fit rows that boosters stop on
+BOOSTERS = ('XGBoost', 'LightGBM', 'CatBoost')
+MIN_ROWS = 200
+
+SEARCH_SPACES = {
+    'XGBoost': {
+        'n_estimators': [300, 1000, 2000], 'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'max_depth': [3, 5, 7, 9], 'subsample': [0.6, 0.8, 1.0],
+        'colsample_bytree': [0.6, 0.8, 1.0], 'min_child_weight': [1, 5, 10],
+    },
+    'LightGBM': {
+        'n_estimators': [300, 1000, 2000], 'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'max_depth': [-1, 5, 7, 9], 'num_leaves': [15, 31, 63, 127], 'subsample': [0.6, 0.8, 1.0],
+        'subsample_freq': [1], 'colsample_bytree': [0.6, 0.8, 1.0], 'min_child_samples': [5, 20, 50],
+    },
+    'CatBoost': {
+        'n_estimators': [300, 1000, 2000], 'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'max_depth': [4, 6, 8], 'l2_leaf_reg': [1, 3, 10],
+    },
+    'RandomForest': {
+        'n_estimators': [100, 300, 600], 'max_depth': [8, 15, 25, None],
+        'min_samples_leaf': [1, 2, 5, 10], 'max_features': [1.0, 0.5, 'sqrt'],
+    },
+}
+
+
+def sample_config(space, rng):
+    return {name: rng.choice(values) for name, values in sorted(space.items())}
+
+
+def brackets(eta=3, n_rungs=3):
+    """Hyperband brackets as (n_configs, [fractions per rung]), most aggressive first."""
+    s_max = n_rungs - 1
+    out = []
+    for s in range(s_max, -1, -1):
+        n = math.ceil((s_max + 1) / (s + 1) * eta ** s)
+        out.append((n, [eta ** (i - s_max) for i in range(s_max - s, s_max + 1)]))
+    return out
+
+
+# ------------------- EVALUATION (worker side) -------------------
+def fit_early_stopped(name, model, X_fit, y_fit, X_stop, y_stop):
+    """Fit a booster, stopping on (X_stop, y_stop); returns the number of trees it kept."""
+    if name == 'XGBoost':
+        model.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)], verbose=False)
+        return model.best_iteration + 1
+    if name == 'LightGBM':
+        import lightgbm
+        model.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)],
+                  callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+        return model.best_iteration_ or model.n_estimators
+    model.fit(X_fit, y_fit, eval_set=(X_stop, y_stop), early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+    return model.get_best_iteration() + 1
+
+
+def evaluate(name, params, fraction, threads, data_dir):
+    """Validation RMSE of one config trained on `fraction` of the rows and trees.
+
+    Boosters stop early on the tail of their fit rows; `best_n_estimators` is the tree
+    count they kept.
+    """
+    import ptr
+    from threadpoolctl import threadpool_limits
+
+    X_train = np.load(os.path.join(data_dir, 'X_train.npy'), mmap_mode='r')
+    y_train = np.load(os.path.join(data_dir, 'y_train.npy'), mmap_mode='r')
+    X_val = np.load(os.path.join(data_dir, 'X_val.npy'), mmap_mode='r')
+    y_val = np.load(os.path.join(data_dir, 'y_val.npy'), mmap_mode='r')
+
+    n_rows = max(MIN_ROWS, int(len(X_train) * fraction))
+    X_fit, y_fit = X_train[-n_rows:], y_train[-n_rows:]   # the most recent rows
+    params = dict(params, n_estimators=max(10, round(params['n_estimators'] * fraction)))
+    best_n = params['n_estimators']
+    started = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        if name in BOOSTERS:
+            stop = n_rows - max(1, int(n_rows * EARLY_STOPPING_FRACTION))
+            extra = {'early_stopping_rounds': EARLY_STOPPING_ROUNDS} if name == 'XGBoost' else {}
+            model = ptr.build_model(name, threads, dict(params, **extra))
+            best_n = fit_early_stopped(name, model, X_fit[:stop], y_fit[:stop], X_fit[stop:], y_fit[stop:])
+        else:
+            model = ptr.build_model(name, threads, params)
+            model.fit(X_fit, y_fit)
+        pred = model.predict(X_val)
+    rmse = float(np.sqrt(np.mean((np.asarray(y_val) - pred) ** 2)))
+    return {'rmse': rmse, 'seconds': time.perf_counter() - started, 'rows': n_rows,
+            'n_estimators': params['n_estimators'], 'best_n_estimators': int(best_n)}
+
+
+# ------------------- SEARCH (driver side) -------------------
+def _key(name, params, fraction):
+    return json.dumps([name, params, round(fraction, 6)], sort_keys=True)
+
+
+class Checkpoint:
+    def __init__(self, path, data_key):
+        self.path = path
+        self.data_key = data_key
+        self.evaluations = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    saved = json.load(f)
+                if saved.get('format_version') == CHECKPOINT_FORMAT_VERSION and saved.get('data_key') == data_key:
+                    self.evaluations = saved['evaluations']
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def add(self, key, result):
+        self.evaluations[key] = result
+        if self.path:
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'format_version': CHECKPOINT_FORMAT_VERSION, 'data_key': self.data_key,
+                           'evaluations': self.evaluations}, f)
+            os.replace(tmp, self.path)
+
+
+def run_search(X_train, y_train, X_val, y_val, names, budget_seconds, checkpoint_path=None,
+               eta=3, n_rungs=3, seed=42, n_cpus=None, log=print):
+    """Hyperband for every model in `names`; returns {name: best evaluation at the largest budget reached}."""
+    X_train, y_train, X_val, y_val = (np.ascontiguousarray(a, dtype=np.float64) for a in (X_train, y_train, X_val, y_val))
+    digest = hashlib.sha1()
+    for a in (X_train, y_train, X_val, y_val):
+        digest.update(a.tobytes())
+    checkpoint = Checkpoint(checkpoint_path, digest.hexdigest())
+    if checkpoint.evaluations:
+        log(f"Resuming: {len(checkpoint.evaluations)} evaluations from {checkpoint_path}")
+
+    deadline = time.monotonic() + budget_seconds
+    n_cpus = n_cpus or os.cpu_count() or 1
+    data_dir = tempfile.mkdtemp(prefix='hpsearch_')
+    try:
+        for fname, a in (('X_train', X_train), ('y_train', y_train), ('X_val', X_val), ('y_val', y_val)):
+            np.save(os.path.join(data_dir, f'{fname}.npy'), a)
+        with ProcessPoolExecutor(max_workers=n_cpus) as pool:
+            for b, (n_configs, fractions) in enumerate(brackets(eta, n_rungs)):
+                survivors = {}
+                for name in names:
+                    rng = random.Random(f"{seed}:{name}:{b}")
+                    survivors[name] = [sample_config(SEARCH_SPACES[name], rng) for _ in range(n_configs)]
+                for rung, fraction in enumerate(fractions):
+                    jobs = [(name, params) for name in names for params in survivors[name]]
+                    threads = max(1, n_cpus // max(1, min(len(jobs), n_cpus)))
+                    if not _run_rung(pool, jobs, fraction, threads, data_dir, checkpoint, deadline):
+                        log(f"Budget exhausted in bracket {b}, rung {rung}; checkpoint saved")
+                        return best_configs(checkpoint, names)
+                    log(f"bracket {b} rung {rung}: {len(jobs)} configs at {fraction:.3f} of the budget "
+                        f"({max(0.0, deadline - time.monotonic()):.0f}s left)")
+                    keep = max(1, len(survivors[names[0]]) // eta)
+                    for name in names:
+                        ranked = sorted(survivors[name],
+                                        key=lambda p: checkpoint.evaluations[_key(name, p, fraction)]['rmse'])
+                        survivors[name] = ranked[:keep]
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return best_configs(checkpoint, names)
+
+
+def _run_rung(pool, jobs, fraction, threads, data_dir, checkpoint, deadline):
+    """Evaluate the jobs missing from the checkpoint; False if the deadline passed first.
+
+    At the deadline, queued evaluations are cancelled; ones already running finish
+    and are still checkpointed.
+    """
+    pending = {}
+    for name, params in jobs:
+        key = _key(name, params, fraction)
+        if key not in checkpoint.evaluations and key not in pending.values():
+            pending[pool.submit(evaluate, name, params, fraction, threads, data_dir)] = key
+    in_time = True
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 and in_time:
+            in_time = False
+            for future in list(pending):
+                if future.cancel():
+                    del pending[future]
+            continue
+        done, _ = wait(pending, timeout=remaining if in_time else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending.pop(future)
+            name, params, frac = json.loads(key)
+            try:
+                result = future.result()
+            except Exception as exc:   # a config the library rejects just loses the race
+                result = {'rmse': float('inf'), 'error': f"{type(exc).__name__}: {exc}"}
+            checkpoint.add(key, dict(result, model=name, params=params, fraction=frac))
+    return in_time and time.monotonic() < deadline
+
+
+def best_configs(checkpoint, names):
+    """Per model, the lowest-RMSE evaluation at the largest budget reached; failed ones are skipped."""
+    best = {}
+    for entry in checkpoint.evaluations.values():
+        name = entry['model']
+        if name not in names or 'error' in entry or not math.isfinite(entry['rmse']):
+            continue
+        current = best.get(name)
+        if current is None or (entry['fraction'], -entry['rmse']) > (current['fraction'], -current['rmse']):
+            best[name] = entry
+    return best
+
+
+def tuned_params(entry):
+    """The params to train with: boosters get the tree count early stopping kept, scaled from the
+    evaluation's budget to the full one and capped at the sampled n_estimators."""
+    params = dict(entry['params'])
+    if 'best_n_estimators' in entry:
+        full = round(entry['best_n_estimators'] / entry['fraction'])
+        params['n_estimators'] = max(1, min(params['n_estimators'], full))
+    return params
+
+
+def write_best(best, path):
+    models = {name: {'params': tuned_params(e), 'rmse': e['rmse'], 'fraction': e['fraction']} for name, e in best.items()}
+    full = {n: m for n, m in models.items() if m['fraction'] >= 1}
+    out = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'best_model': min(full or models, key=lambda n: models[n]['rmse']) if models else None,
+        'models': models,
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(out, f, indent=2)
+    os.replace(tmp, path)
+    return out
+
+
+def load_training_data(csv_path):
+    """The train_model_zoo frame, split 80/20 in time order."""
+    import ptr
+    from ingest import load_dataset
+
+    df = ptr.enrich_features_by_series(ptr.balance_dataset(load_dataset(csv_path)))
+    split = int(len(df) * 0.8)
+    X = df[ptr.features].to_numpy(dtype=np.float64)
+    y = df['UnitsSold'].to_numpy(dtype=np.float64)
+    return X[:split], y[:split], X[split:], y[split:]
+
+
+if __name__ == '__main__':
+    import ptr
+
+    parser = argparse.ArgumentParser(description='Hyperband search over the model zoo.')
+    parser.add_argument('--data', default='DMart.csv')
+    parser.add_argument('--models', default=','.join(ptr.MODEL_NAMES))
+    parser.add_argument('--budget-minutes', type=float, default=30.0)
+    parser.add_argument('--checkpoint', default='hpsearch_checkpoint.json')
+    parser.add_argument('--out', default=ptr.BEST_PARAMS_PATH)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--rungs', type=int, default=3, help='budget levels per bracket (smallest is eta^-(rungs-1))')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-cpus', type=int, default=None)
+    args = parser.parse_args()
+
+    names = [n for n in args.models.split(',') if n]
+    unknown = set(names) - set(SEARCH_SPACES)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+    started = time.perf_counter()
+    best = run_search(*load_training_data(args.data), names, args.budget_minutes * 60, args.checkpoint,
+                      args.eta, args.rungs, args.seed, args.n_cpus)
+    result = write_best(best, args.out)
+    for name, entry in result['models'].items():
+        print(f"{name:<13} RMSE {entry['rmse']:.3f} at {entry['fraction']:.3f} of the budget: {entry['params']}")
+    print(f"Best model: {result['best_model']} -> {args.out} ({time.perf_counter() - started:.0f}s)")
@@ -0,0 +1,195 @@
+"""Compact, vectorized ingestion of the DMart catalog for training.
+
+`load_dataset` produces the same rows as `ptr.load_and_preprocess`: same RNG
+draws, and LabelEncoder-compatible codes where missing values sort last. It
+reads only the four columns it needs, in chunks and with explicit dtypes. The
+calendar fields come from datetime64[D] arithmetic rather than per-row
+`.dt`/`apply`, and the result is stored as int8/int16/int32/float32. The parsed
+frame is cached as a columnar file (Parquet when pyarrow is installed, otherwise
+a pandas pickle) keyed on the CSV's size and mtime, so repeat runs skip CSV
+parsing.
+
+    python ingest.py [DMart.csv] [--no-cache] [--check]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecast_core import BASE_DIR
+
+INGEST_FORMAT_VERSION = 1
+CACHE_DIR = os.path.join(os.environ.get("FORECAST_CACHE_DIR", os.path.join(BASE_DIR, ".cache")), "ingest")
+CHUNK_ROWS = int(os.environ.get("FORECAST_INGEST_CHUNK_ROWS", 1_000_000))
+START_DATE = "2022-01-01"
+HOLIDAYS = ('2022-01-01', '2022-01-26', '2022-08-15', '2022-10-02',
+            '2023-01-01', '2023-01-26', '2023-08-15', '2023-10-02')
+CSV_COLUMNS = {"Price": "float64", "DiscountedPrice": "float64", "Category": "category", "Brand": "category"}
+
+
+def read_catalog(path, chunk_rows=CHUNK_ROWS):
+    """The columns training needs, read in chunks with categorical string columns."""
+    from pandas.api.types import union_categoricals
+
+    chunks = list(pd.read_csv(path, usecols=list(CSV_COLUMNS), dtype=CSV_COLUMNS, chunksize=chunk_rows))
+    if not chunks:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in CSV_COLUMNS.items()})
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    out = {}
+    for col, dtype in CSV_COLUMNS.items():
+        parts = [c[col] for c in chunks]
+        if dtype == "category":
+            out[col] = union_categoricals(parts, sort_categories=True, ignore_order=True)
+        else:
+            out[col] = np.concatenate([p.to_numpy() for p in parts])
+    return pd.DataFrame(out)
+
+
+def encode_labels(values):
+    """LabelEncoder codes for a categorical: sorted categories, missing values after them."""
+    cat = values.cat.reorder_categories(sorted(values.cat.categories))
+    codes = cat.cat.codes.to_numpy().astype(np.int32)
+    codes[codes < 0] = len(cat.cat.categories)
+    dtype = np.int16 if len(cat.cat.categories) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype)
+
+
+def label_classes(csv_path):
+    """Sorted Category and Brand values: the `classes_` behind `encode_labels`' codes."""
+    catalog = pd.read_csv(csv_path, usecols=["Category", "Brand"], dtype="category")
+    return {col.lower(): sorted(catalog[col].cat.categories) for col in ("Category", "Brand")}
+
+
+def calendar(n_rows, start=START_DATE):
+    """Date, DayOfWeek, Month, Quarter and Year for one row per day from `start`."""
+    days = np.datetime64(start, "D") + np.arange(n_rows)
+    epoch_days = days.astype(np.int64)
+    month0 = days.astype("datetime64[M]").astype(np.int64) % 12
+    year = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    # pandas timestamps are nanoseconds (to 2262) by default; switch to seconds for longer histories
+    unit = "ns" if n_rows == 0 or days[-1] < np.datetime64("2262-04-11") else "s"
+    return {
+        "Date": days.astype(f"datetime64[{unit}]"),
+        "DayOfWeek": ((epoch_days + 3) % 7).astype(np.int16),   # 1970-01-01 was a Thursday
+        "Month": (month0 + 1).astype(np.int16),
+        "Quarter": (month0 // 3 + 1).astype(np.int16),
+        "Year": year.astype(np.int16),
+    }
+
+
+def preprocess(raw):
+    """Vectorized `load_and_preprocess` on the columns from `read_catalog`."""
+    n = len(raw)
+    cal = calendar(n)
+    price = raw["Price"].to_numpy(dtype=np.float64)
+    discounted = raw["DiscountedPrice"].to_numpy(dtype=np.float64)
+    discounted = np.where(np.isnan(discounted), np.nanmedian(discounted) if n else 0.0, discounted)
+    price = np.where(np.isnan(price), np.nanmedian(price) if n else 0.0, price)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discount_pct = ((price - discounted) / price) * 100
+
+    is_holiday = np.isin(cal["Date"].astype("datetime64[D]"), np.array(HOLIDAYS, dtype="datetime64[D]"))
+
+    # Same draws, in the same order, as the reference implementation
+    np.random.seed(42)
+    base_sales = np.random.randint(50, 200, size=n)
+    month_effect = np.where((cal["Month"] == 11) | (cal["Month"] == 12), 1.2, 1.0)
+    discount_effect = 1 + (discount_pct / 100) * 0.5
+    holiday_boost = np.where(is_holiday, 1.3, 1.0)
+    units = base_sales * month_effect * discount_effect * holiday_boost
+    units += np.random.normal(0, 10, n)
+    units = np.where(np.isnan(units), 0, units)
+
+    return pd.DataFrame({
+        "DayOfWeek": cal["DayOfWeek"],
+        "Month": cal["Month"],
+        "Quarter": cal["Quarter"],
+        "Year": cal["Year"],
+        "DiscountPct": discount_pct.astype(np.float32),
+        "IsHoliday": is_holiday.astype(np.int8),
+        "CategoryEncoded": encode_labels(raw["Category"]),
+        "BrandEncoded": encode_labels(raw["Brand"]),
+        "UnitsSold": units.astype(np.int32),
+        "Date": cal["Date"],
+    })
+
+
+# ------------------- COLUMNAR CACHE -------------------
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def cache_path(csv_path, cache_dir=CACHE_DIR):
+    st = os.stat(csv_path)
+    key = f"{os.path.abspath(csv_path)}:{st.st_size}:{st.st_mtime_ns}:{INGEST_FORMAT_VERSION}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    ext = "parquet" if _has_pyarrow() else "pkl"
+    return os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(csv_path))[0]}-{digest}.{ext}")
+
+
+def load_dataset(csv_path, cache=True, cache_dir=CACHE_DIR):
+    """Preprocessed training frame for `csv_path`, from the columnar cache when it is fresh."""
+    path = cache_path(csv_path, cache_dir) if cache else None
+    if path and os.path.exists(path):
+        try:
+            return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+        except Exception:
+            pass   # unreadable or partial cache file: rebuild it below
+    df = preprocess(read_catalog(csv_path))
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        if path.endswith(".parquet"):
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+    return df
+
+
+def check_parity(reference, fast):
+    """Compare against `ptr.load_and_preprocess` output; returns a list of mismatching columns."""
+    bad = []
+    for col in reference.columns:
+        ref, got = reference[col].to_numpy(), fast[col].to_numpy()
+        if col == "Date":
+            same = np.array_equal(ref.astype("datetime64[s]"), got.astype("datetime64[s]"))
+        elif col == "DiscountPct":
+            same = np.allclose(ref, got, rtol=1e-6, equal_nan=True)   # stored as float32
+        else:
+            same = np.array_equal(ref, got)
+        if not same:
+            bad.append(col)
+    return bad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the DMart catalog into the training frame.")
+    parser.add_argument("csv", nargs="?", default=os.path.join(BASE_DIR, "DMart.csv"))
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--check", action="store_true", help="compare with ptr.load_and_preprocess")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df = load_dataset(args.csv, cache=not args.no_cache)
+    print(f"{len(df):,} rows in {time.perf_counter() - started:.2f}s, "
+          f"{df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    if args.check:
+        from ptr import load_and_preprocess
+
+        started = time.perf_counter()
+        reference = load_and_preprocess(args.csv)
+        print(f"reference: {time.perf_counter() - started:.2f}s, "
+              f"{reference.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+        bad = check_parity(reference, df)
+        print("parity: OK" if not bad else f"parity: FAILED ({', '.join(bad)})")
+        sys.exit(1 if bad else 0)
@@ -0,0 +1,316 @@
+"""History-backed Lag_1 / Lag_7 / RollingMean_7 lookups.
+
+Orders from the retail analytics CSV (Order Date, Category, Sub Category, Sales)
+are aggregated once into dense daily totals per series. The series are every
+category, every "Category/Sub Category" pair, and ALL_SERIES. Each series also
+keeps a cumulative sum, so every lookup is a few array reads. The aggregate is
+cached as .npz next to the other caches. When the CSV only grows, the refresh
+parses just the appended rows.
+
+The CSV only has revenue (rupees), while the model's lags are UnitsSold. Lookups
+are therefore rescaled per series so that the series' mean day equals the mean
+UnitsSold of the training data (DMart.csv via ingest.load_dataset). Without the
+training data, there are no lookups.
+
+    python lag_provider.py [history.csv] [--series NAME] [--date YYYY-MM-DD]
+"""
+import argparse
+import hashlib
+import io
+import os
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+from forecast_core import BASE_DIR
+
+HISTORY_FORMAT_VERSION = 1
+HISTORY_PATH = os.environ.get(
+    "FORECAST_HISTORY_PATH", os.path.join(BASE_DIR, "DMart_Grocery_Sales_-_Retail_Analytics_Dataset.csv"))
+CACHE_DIR = os.path.join(os.environ.get("FORECAST_CACHE_DIR", os.path.join(BASE_DIR, ".cache")), "history")
+ALL_SERIES = "ALL"
+VALUE_COLUMN = "Sales"   # revenue; see `units_mean`
+TRAINING_DATA_PATH = os.environ.get("FORECAST_TRAINING_DATA_PATH", os.path.join(BASE_DIR, "DMart.csv"))
+TAIL_CHECK_BYTES = 4096
+
+# App categories -> the history category that covers them
+SERIES_FOR_CATEGORY = {
+    'Grocery': 'Food Grains', 'Pulses': 'Food Grains', 'Masala & Spices': 'Oil & Masala',
+    'Ghee & Vanaspati': 'Oil & Masala', 'Cooking Oil': 'Oil & Masala',
+}
+
+
+class SalesHistory:
+    """Daily totals, shape (n_series, n_days), starting at `start` (a date)."""
+
+    def __init__(self, series, start, totals, source=None, units_mean=None):
+        self.series = list(series)
+        self.start = start
+        self.totals = np.ascontiguousarray(totals, dtype=np.float64)
+        self.source = source or {}
+        self._index = {name: i for i, name in enumerate(self.series)}
+        self._cumsum = np.concatenate(
+            [np.zeros((len(self.series), 1)), np.cumsum(self.totals, axis=1)], axis=1)
+        self.units_mean = units_mean
+
+    @property
+    def units_mean(self):
+        """Mean training UnitsSold that a series' mean day maps to; None leaves lookups empty."""
+        return self._units_mean
+
+    @units_mean.setter
+    def units_mean(self, value):
+        self._units_mean = value
+        means = self.totals.mean(axis=1) if self.totals.size else np.zeros(len(self.series))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.unit_scale = np.where(means > 0, (np.nan if value is None else value) / means, np.nan)
+
+    @property
+    def end(self):
+        """Last day with history."""
+        return date.fromordinal(self.start.toordinal() + self.totals.shape[1] - 1)
+
+    def resolve(self, name):
+        """History series for a series name or an app category; ALL_SERIES when unknown."""
+        name = SERIES_FOR_CATEGORY.get(name, name)
+        return name if name in self._index else ALL_SERIES
+
+    def lags(self, name, when):
+        """(Lag_1, Lag_7, RollingMean_7, as_of) in units for the day `when` in series `name`.
+
+        Matches enrich_features: the previous day, the day a week earlier and the mean
+        of the seven days before `when`. Dates past the end of the history use the
+        latest complete window (`as_of` is the day the lags describe). Dates before it,
+        and series without a unit scale, return None.
+        """
+        if isinstance(when, datetime):
+            when = when.date()
+        s = self._index[self.resolve(name)]
+        n_days = self.totals.shape[1]
+        d = min(when.toordinal() - self.start.toordinal(), n_days)
+        scale = self.unit_scale[s]
+        if d < 7 or np.isnan(scale):
+            return None
+        total = self.totals[s]
+        rolling = (self._cumsum[s, d] - self._cumsum[s, d - 7]) / 7
+        as_of = date.fromordinal(self.start.toordinal() + d)
+        return float(total[d - 1] * scale), float(total[d - 7] * scale), float(rolling * scale), as_of
+
+    def lags_batch(self, names, dates):
+        """Vectorized `lags` for equal-length sequences, in units; NaN where there is no full window."""
+        rows = np.array([self._index[self.resolve(n)] for n in names], dtype=np.intp)
+        days = np.array([(d.date() if isinstance(d, datetime) else d).toordinal() for d in dates]) - self.start.toordinal()
+        days = np.minimum(days, self.totals.shape[1])
+        ok = days >= 7
+        d = np.where(ok, days, 7)
+        out = np.stack([
+            self.totals[rows, d - 1], self.totals[rows, d - 7],
+            (self._cumsum[rows, d] - self._cumsum[rows, d - 7]) / 7,
+        ], axis=1)
+        out[~ok] = np.nan
+        return out * self.unit_scale[rows, None]
+
+
+# ------------------- AGGREGATION -------------------
+def _parse_orders(header, data):
+    """Parse CSV bytes (without the header line) into (day ordinals, series names, values)."""
+    import pandas as pd
+
+    df = pd.read_csv(io.BytesIO(data), names=header, header=None,
+                     usecols=["Order Date", "Category", "Sub Category", VALUE_COLUMN])
+    # Exported dates mix "11-08-2017" and "4/15/2018"; both are month-first
+    when = pd.to_datetime(df["Order Date"].str.replace("/", "-", regex=False), format="%m-%d-%Y")
+    ordinals = (when.dt.normalize() - pd.Timestamp("0001-01-01")).dt.days.to_numpy() + 1
+    values = df[VALUE_COLUMN].to_numpy(dtype=np.float64)
+    category = df["Category"].astype(str).to_numpy()
+    pair = (df["Category"].astype(str) + "/" + df["Sub Category"].astype(str)).to_numpy()
+    n = len(df)
+    return (np.concatenate([ordinals, ordinals, ordinals]),
+            np.concatenate([category, pair, np.full(n, ALL_SERIES, dtype=object)]),
+            np.concatenate([values, values, values]))
+
+
+def _accumulate(history, ordinals, names, values):
+    """Add parsed orders into `history` (or build it), growing series/days as needed."""
+    if history is None:
+        series, start, totals = [], None, np.zeros((0, 0))
+    else:
+        series, start, totals = list(history.series), history.start, history.totals
+    if len(ordinals) == 0:
+        return history
+    index = {name: i for i, name in enumerate(series)}
+    for name in sorted(set(names) - index.keys()):
+        index[name] = len(series)
+        series.append(name)
+    first = int(ordinals.min()) if start is None else min(int(ordinals.min()), start.toordinal())
+    last = int(ordinals.max()) if start is None else max(int(ordinals.max()), start.toordinal() + totals.shape[1] - 1)
+    grown = np.zeros((len(series), last - first + 1))
+    if totals.size:
+        shift = start.toordinal() - first
+        grown[:totals.shape[0], shift:shift + totals.shape[1]] = totals
+    rows = np.array([index[n] for n in names], dtype=np.intp)
+    np.add.at(grown, (rows, ordinals - first), values)
+    return SalesHistory(series, date.fromordinal(first), grown)
+
+
+def _read_header(f):
+    return [c.strip() for c in f.readline().decode("utf-8-sig").strip().split(",")]
+
+
+def build_history(path=HISTORY_PATH, previous=None):
+    """Aggregate the CSV, reusing `previous` when the file only had rows appended."""
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        body_start = f.tell()
+        offset = body_start
+        if previous is not None and previous.source.get("path") == os.path.abspath(path):
+            prev_offset = previous.source["offset"]
+            f.seek(max(body_start, prev_offset - TAIL_CHECK_BYTES))
+            if hashlib.sha1(f.read(prev_offset - f.tell())).hexdigest() == previous.source["tail_sha1"]:
+                offset = prev_offset
+            else:
+                previous = None
+        else:
+            previous = None
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1   # a partially written last line waits for the next refresh
+    history = _accumulate(previous, *_parse_orders(header, data[:end])) if end else previous
+    if history is None:
+        raise ValueError(f"no orders in {path}")
+    new_offset = offset + end
+    with open(path, "rb") as f:
+        f.seek(max(body_start, new_offset - TAIL_CHECK_BYTES))
+        tail = hashlib.sha1(f.read(new_offset - f.tell())).hexdigest()
+    st = os.stat(path)
+    history.source = {"path": os.path.abspath(path), "offset": new_offset, "tail_sha1": tail,
+                      "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return history
+
+
+def _cache_file(path, cache_dir=CACHE_DIR):
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0][:40]}-{digest}.npz")
+
+
+def save_history(history, out):
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = f"{out}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, totals=history.totals, series=np.array(history.series, dtype=str),
+             start=history.start.toordinal(), format_version=HISTORY_FORMAT_VERSION,
+             source=np.array(repr(history.source)))
+    os.replace(tmp, out)
+
+
+def _read_cached(cache):
+    import ast
+
+    try:
+        with np.load(cache, allow_pickle=False) as z:
+            if int(z["format_version"]) != HISTORY_FORMAT_VERSION:
+                return None
+            return SalesHistory(z["series"].tolist(), date.fromordinal(int(z["start"])), z["totals"],
+                                ast.literal_eval(str(z["source"])))
+    except (OSError, ValueError, KeyError, SyntaxError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def training_units_mean(path=TRAINING_DATA_PATH, cache_dir=CACHE_DIR):
+    """Mean UnitsSold of the rows the model is trained on, or None without the training data.
+
+    Kept in a small JSON file per training CSV version, so cold starts skip pandas.
+    """
+    import json
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    cache = os.path.join(cache_dir, f"units-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.json")
+    try:
+        with open(cache, encoding="utf-8") as f:
+            return float(json.load(f)["units_mean"])
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        from ingest import load_dataset
+
+        mean = float(load_dataset(path)["UnitsSold"].mean())
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{cache}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": key, "units_mean": mean}, f)
+        os.replace(tmp, cache)
+    except OSError:
+        pass
+    return mean
+
+
+def load_history(path=HISTORY_PATH, cache_dir=CACHE_DIR, units_mean=None):
+    """The aggregated history for `path`, or None if the CSV is missing.
+
+    Cached in memory per CSV mtime and on disk as .npz; an appended CSV is refreshed
+    incrementally, anything else is rebuilt. Lookups are in units scaled to `units_mean`
+    (default: `training_units_mean()`).
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    units_mean = training_units_mean() if units_mean is None else units_mean
+    return _load_history(os.path.abspath(path), cache_dir, st.st_size, st.st_mtime_ns, units_mean)
+
+
+@lru_cache(maxsize=4)
+def _load_history(path, cache_dir, size, mtime_ns, units_mean):
+    history = _load_totals(path, cache_dir, size, mtime_ns)
+    if history is not None:
+        history.units_mean = units_mean
+    return history
+
+
+def _load_totals(path, cache_dir, size, mtime_ns):
+    cache = _cache_file(path, cache_dir)
+    cached = _read_cached(cache) if os.path.exists(cache) else None
+    if cached is not None and cached.source.get("size") == size and cached.source.get("mtime_ns") == mtime_ns:
+        return cached
+    try:
+        history = build_history(path, previous=cached if cached is not None and size >= cached.source.get("size", 0) else None)
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        save_history(history, cache)
+    except OSError:
+        pass   # read-only deployments still get the in-memory aggregate
+    return history
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Aggregate order history into daily lag features.")
+    parser.add_argument("csv", nargs="?", default=HISTORY_PATH)
+    parser.add_argument("--series", default=ALL_SERIES)
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    history = load_history(args.csv)
+    if history is None:
+        raise SystemExit(f"cannot read {args.csv}")
+    print(f"{len(history.series)} series, {history.start} .. {history.end} "
+          f"({history.totals.shape[1]} days) in {time.perf_counter() - started:.3f}s")
+    lags = history.lags(args.series, args.date)
+    if lags is None:
+        print(f"{args.series} @ {args.date}: not enough history (or no training data for the unit scale)")
+    else:
+        print(f"{history.resolve(args.series)} @ {args.date} (as of {lags[3]}): "
+              f"Lag_1={lags[0]:.0f} Lag_7={lags[1]:.0f} RollingMean_7={lags[2]:.1f} units "
+              f"(x{history.unit_scale[history._index[history.resolve(args.series)]]:.4f} of revenue, "
+              f"training mean {history.units_mean:.1f})")
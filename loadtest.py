@@ -0,0 +1,78 @@
+"""Load test for forecast_service: concurrent keep-alive clients, reports latency percentiles.
+
+    python loadtest.py [--url http://127.0.0.1:8502/predict] [--concurrency 64] [--requests 5000]
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+import forecast_core
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+async def _client(host, port, path, bodies, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            request = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(url, concurrency, total, seed=0):
+    parts = urlsplit(url)
+    inputs = forecast_core.synthetic_inputs(total, seed=seed)
+    inputs["Date"] = inputs["Date"].dt.strftime("%Y-%m-%d")
+    bodies = [json.dumps(row).encode("utf-8") for row in inputs.to_dict("records")]
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(parts.hostname, parts.port or 80, parts.path or "/predict", bodies[i::concurrency], latencies, statuses)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1e3,
+        "p99_ms": _percentile(latencies, 99) * 1e3,
+        "max_ms": (latencies[-1] if latencies else float("nan")) * 1e3,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the forecast service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8502/predict")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    report = asyncio.run(run(args.url, args.concurrency, args.requests))
+    print(f"{report['requests']} requests, concurrency {report['concurrency']}, statuses {report['statuses']}")
+    print(f"throughput {report['throughput_rps']:,.0f} req/s | p50 {report['p50_ms']:.2f} ms | "
+          f"p99 {report['p99_ms']:.2f} ms | max {report['max_ms']:.2f} ms")
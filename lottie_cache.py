@@ -0,0 +1,122 @@
+"""Lottie animation cache: memory -> disk -> bundled assets, refreshed in the background.
+
+`load_lottie_url` never waits on the network. It returns whatever copy is
+available locally (or None) and, when that copy is missing or older than the
+TTL, starts one background download per URL so a later rerun picks it up.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from forecast_core import BASE_DIR
+from metrics import timed
+
+ASSET_DIR = os.path.join(BASE_DIR, "assets", "lottie")
+CACHE_DIR = os.environ.get("FORECAST_CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+LOTTIE_CACHE_DIR = os.path.join(CACHE_DIR, "lottie")
+
+LOTTIE_TTL = 7 * 24 * 3600      # seconds before a cached copy is refreshed
+RETRY_AFTER = 300               # seconds to wait after a failed download
+CONNECT_TIMEOUT = 2.0
+READ_TIMEOUT = 5.0
+
+_lock = threading.Lock()
+_memory = {}        # url -> (fetched_at, data)
+_inflight = set()   # urls with a running background download
+_failed_at = {}     # url -> time of last failed download
+
+
+def _cache_path(url):
+    return os.path.join(LOTTIE_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _asset_path(url):
+    return os.path.join(ASSET_DIR, os.path.basename(url.split("?", 1)[0]))
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_local(url):
+    path = _cache_path(url)
+    data = _read_json(path)
+    if data is not None:
+        return os.path.getmtime(path), data
+    # Bundled assets count as stale so a fresh copy is fetched when the network allows.
+    data = _read_json(_asset_path(url))
+    if data is not None:
+        return 0.0, data
+    return None
+
+
+def _write_disk(url, data):
+    path = _cache_path(url)
+    os.makedirs(LOTTIE_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def fetch_lottie(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+    import requests
+
+    r = requests.get(url, timeout=timeout)
+    if r.status_code != 200:
+        return None
+    return r.json()
+
+
+def _refresh(url):
+    try:
+        with timed("lottie_fetch"):
+            data = fetch_lottie(url)
+    except Exception:
+        data = None
+    with _lock:
+        _inflight.discard(url)
+        if data is None:
+            _failed_at[url] = time.time()
+            return
+        _memory[url] = (time.time(), data)
+        _failed_at.pop(url, None)
+    try:
+        _write_disk(url, data)
+    except OSError:
+        pass
+
+
+def _schedule_refresh(url):
+    # Caller holds _lock.
+    if url in _inflight or time.time() - _failed_at.get(url, 0.0) < RETRY_AFTER:
+        return
+    _inflight.add(url)
+    threading.Thread(target=_refresh, args=(url,), name="lottie-refresh", daemon=True).start()
+
+
+def load_lottie_url(url: str, ttl: float = LOTTIE_TTL):
+    with timed("lottie_load"), _lock:
+        entry = _memory.get(url)
+        if entry is None:
+            entry = _read_local(url)
+            if entry is not None:
+                _memory[url] = entry
+        if entry is None or time.time() - entry[0] > ttl:
+            _schedule_refresh(url)
+    return entry[1] if entry is not None else None
+
+
+def clear_cache(disk=False):
+    with _lock:
+        _memory.clear()
+        _failed_at.clear()
+    if disk and os.path.isdir(LOTTIE_CACHE_DIR):
+        for name in os.listdir(LOTTIE_CACHE_DIR):
+            os.remove(os.path.join(LOTTIE_CACHE_DIR, name))
@@ -0,0 +1,174 @@
+"""Per-stage latency histograms with Prometheus text export (stdlib only).
+
+    with metrics.timed("predict"):
+        ...
+
+Stages are observed into one histogram family, `forecast_stage_seconds{stage=...}`,
+with fixed buckets, so recording is a bisect and three additions under a lock.
+`render_prometheus()` returns the text exposition format. forecast_service.py
+serves it on GET /metrics. The apps write it to FORECAST_METRICS_PATH (for the
+node_exporter textfile collector) and, with FORECAST_DIAGNOSTICS=1, show a panel.
+FORECAST_METRICS=0 turns every hook into a no-op.
+
+Stages: artifact_load, preprocess, transform, predict, predict_quantiles,
+lottie_load, lottie_fetch, chart_render, service_request.
+"""
+import bisect
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("FORECAST_METRICS", "1") != "0"
+METRICS_PATH = os.environ.get("FORECAST_METRICS_PATH")
+FLUSH_INTERVAL = float(os.environ.get("FORECAST_METRICS_FLUSH_SECONDS", 10))
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q):
+        """Estimate like Prometheus' histogram_quantile: linear within the bucket; nan when empty."""
+        counts, count, _ = self.snapshot()
+        if not count:
+            return float("nan")
+        rank, seen = q * count, 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                if i == len(self.buckets):   # +Inf bucket: the largest finite bound
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+
+_lock = threading.Lock()
+_stages = {}   # stage -> Histogram
+
+
+def histogram(stage):
+    h = _stages.get(stage)
+    if h is None:
+        with _lock:
+            h = _stages.setdefault(stage, Histogram())
+    return h
+
+
+def observe(stage, seconds):
+    if ENABLED:
+        histogram(stage).observe(seconds)
+
+
+class timed:
+    """Context manager that records the block's wall time under `stage`."""
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            histogram(self.stage).observe(time.perf_counter() - self.started)
+        return False
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def summary():
+    """{stage: {count, mean, p50, p90, p99}} in seconds, for the diagnostics panel."""
+    out = {}
+    for stage, h in sorted(_stages.items()):
+        _, count, total = h.snapshot()
+        out[stage] = {"count": count, "mean": total / count if count else float("nan"),
+                      "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99)}
+    return out
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def render_prometheus(extra_gauges=None):
+    """Text exposition format; `extra_gauges` is {name: (help, value)} appended as gauges."""
+    lines = ["# HELP forecast_stage_seconds Wall time per forecast stage.",
+             "# TYPE forecast_stage_seconds histogram"]
+    for stage, h in sorted(_stages.items()):
+        counts, count, total = h.snapshot()
+        cumulative = 0
+        for bound, c in zip(h.buckets + (float("inf"),), counts):
+            cumulative += c
+            lines.append(f'forecast_stage_seconds_bucket{{stage="{stage}",le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'forecast_stage_seconds_sum{{stage="{stage}"}} {total!r}')
+        lines.append(f'forecast_stage_seconds_count{{stage="{stage}"}} {count}')
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {float(value)!r}"]
+    return "\n".join(lines) + "\n"
+
+
+def cache_gauges():
+    """Prediction cache counters as gauges (only if the cache module is already loaded)."""
+    import sys
+
+    cache = sys.modules.get("prediction_cache")
+    if cache is None:
+        return {}
+    stats = cache.get_cache().stats()
+    return {f"forecast_prediction_cache_{k}": (f"Prediction cache {k}.", stats[k])
+            for k in ("size", "hits", "misses", "evictions", "expirations", "invalidations")}
+
+
+def write_textfile(path=METRICS_PATH):
+    """Atomically write the exposition to `path`."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus(cache_gauges()))
+    os.replace(tmp, path)
+
+
+_writer = None
+
+
+def start_textfile_writer(path=METRICS_PATH, interval=FLUSH_INTERVAL):
+    """Rewrite `path` every `interval` seconds from a daemon thread; started once per process,
+    and a no-op without a path or with metrics disabled."""
+    global _writer
+    if not path or not ENABLED:
+        return
+    with _lock:
+        if _writer is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    write_textfile(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        _writer = threading.Thread(target=run, name="metrics-textfile", daemon=True)
+        _writer.start()
@@ -0,0 +1,129 @@
+"""Process-wide, thread-safe LRU + TTL cache in front of the model.
+
+Keys are the 14-feature vectors from `preprocess_input` / `preprocess_batch`,
+rounded so equal inputs from different sessions hit the same entry. The cache
+is tied to the served artifact (its model version and the stat stamp
+`load_pipeline` records) and clears itself when either changes, so a
+republished artifact is noticed even when it keeps its model version.
+Entries hold one float, or with `kind`/`width` a row of `width` floats (e.g. the
+point prediction with its quantiles) kept apart from the plain predictions.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+CACHE_SIZE = int(os.environ.get("FORECAST_PREDICTION_CACHE_SIZE", 50_000))
+CACHE_TTL = float(os.environ.get("FORECAST_PREDICTION_CACHE_TTL", 6 * 3600))
+KEY_DECIMALS = 6
+
+
+class PredictionCache:
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, decimals=KEY_DECIMALS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self.model_version = None
+        self._entries = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def make_key(self, row, kind=None):
+        key = tuple(round(float(v), self.decimals) + 0.0 for v in row)
+        return key if kind is None else (kind,) + key
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < now:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value, now):
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _check_version(self, model_version):
+        if model_version != self.model_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.model_version = model_version
+
+    def predict(self, features, predict_fn, model_version, kind=None, width=None):
+        """Predictions for each feature row, calling `predict_fn` once for all misses; shape (n,),
+        or (n, width) when `predict_fn` returns `width` values per row."""
+        import numpy as np
+        import pandas as pd
+
+        X = features.to_numpy(dtype=np.float64) if isinstance(features, pd.DataFrame) else np.asarray(features, dtype=np.float64)
+        keys = [self.make_key(row, kind) for row in X]
+        out = np.empty(len(keys) if width is None else (len(keys), width))
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(model_version)
+            for i, key in enumerate(keys):
+                value = self._get(key, now)
+                if value is None:
+                    missing.append(i)
+                else:
+                    out[i] = value
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            rows = features.iloc[missing] if isinstance(features, pd.DataFrame) else X[missing]
+            out[missing] = predict_fn(rows)
+            now = time.monotonic()
+            with self._lock:
+                if model_version == self.model_version:
+                    for i in missing:
+                        self._put(keys[i], float(out[i]) if width is None else out[i].copy(), now)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "invalidations": self.invalidations,
+                "model_version": self.model_version,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_cache():
+    return PredictionCache()
+
+
+def cache_version(pipeline):
+    return pipeline.model_version, getattr(pipeline, "artifact_stamp", None)
+
+
+def cached_predict(pipeline, features):
+    """`pipeline.predict_features` through the process-wide cache."""
+    return get_cache().predict(features, pipeline.predict_features, cache_version(pipeline))
+
+
+def cached_predict_with_quantiles(pipeline, features, quantiles=None):
+    """`pipeline.predict_with_quantiles_features` through the process-wide cache: (n, 1 + k) with
+    the point prediction first; QuantilesUnavailable for models without per-tree quantiles."""
+    from functools import partial
+
+    from forecast_core import QUANTILES
+
+    quantiles = tuple(QUANTILES if quantiles is None else quantiles)
+    return get_cache().predict(features, partial(pipeline.predict_with_quantiles_features, quantiles=quantiles),
+                               cache_version(pipeline), kind=("quantiles",) + quantiles, width=1 + len(quantiles))
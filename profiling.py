@@ -0,0 +1,165 @@
+"""Opt-in cProfile capture of app reruns and training stages.
+
+With FORECAST_PROFILE=1 (or `--profile` on the command line, e.g.
+`python ptr.py --profile` / `streamlit run PP.py -- --profile`) each wrapped rerun
+or stage writes three files to FORECAST_PROFILE_DIR (default .cache/profiles/):
+
+    <name>-<time>-<model_version>.prof     pstats dump (snakeviz, flameprof, gprof2dot)
+    <name>-<time>-<model_version>.folded   collapsed stacks in microseconds (flamegraph.pl, speedscope)
+    <name>-<time>-<model_version>.json     tags: inputs/params, model version, wall time, top functions
+
+Disabled, `start()` and `profile()` return a shared recorder whose methods do nothing,
+and cProfile is never imported.
+
+    rerun = profiling.start("PP")
+    ...
+    rerun.stop(model_version=pipeline.model_version, inputs=inputs)
+
+    with profiling.profile("train.compare_models", model_version=run_version) as prof:
+        ...
+        prof.tag(rows=len(X))
+
+Profiles are per thread and do not nest: a stage started while another is being
+recorded on the same thread is folded into the outer one. Work done in process
+pools shows up as time spent waiting on the pool.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENABLED = os.environ.get("FORECAST_PROFILE", "0") == "1" or "--profile" in sys.argv[1:]
+PROFILE_DIR = os.environ.get("FORECAST_PROFILE_DIR", os.path.join(BASE_DIR, ".cache", "profiles"))
+TOP_FUNCTIONS = 25
+
+_active = threading.local()
+
+
+class _Disabled:
+    def tag(self, **tags):
+        pass
+
+    def stop(self, **tags):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+DISABLED = _Disabled()
+
+
+class Profile:
+    def __init__(self, name, tags):
+        import cProfile
+
+        self.name = name
+        self.tags = dict(tags)
+        now = time.time()
+        self.started_at = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{now % 1:.3f}"[1:]
+        self.started = time.perf_counter()
+        self.profiler = cProfile.Profile()
+        _active.profile = self
+        self.profiler.enable()
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def stop(self, **tags):
+        """Stop recording and write the .prof / .folded / .json files; returns the common path prefix."""
+        self.profiler.disable()
+        wall = time.perf_counter() - self.started
+        _active.profile = None
+        self.tag(**tags)
+        return write_profile(self.profiler, self.name, self.started_at, wall, self.tags)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def start(name, **tags):
+    """Start recording `name` on this thread; a no-op unless enabled and nothing is being recorded already.
+
+    An unfinished profile of the same name (a Streamlit rerun interrupted before `stop`)
+    is discarded.
+    """
+    if not ENABLED:
+        return DISABLED
+    current = getattr(_active, "profile", None)
+    if current is not None:
+        if current.name != name:
+            return DISABLED
+        current.profiler.disable()
+    return Profile(name, tags)
+
+
+profile = start   # `with profiling.profile(name, **tags) as prof:` reads better around a stage
+
+
+def _label(func):
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})" if line else name
+
+
+def folded_stacks(stats, min_seconds=1e-6):
+    """Collapsed `root;...;leaf microseconds` lines rebuilt from pstats caller/callee edges.
+
+    cProfile keeps one level of callers, so a function reached along several paths has
+    its time split between them in proportion to each edge's cumulative time.
+    """
+    entries = stats.stats
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    folded = {}
+
+    def walk(func, path, labels, share):
+        labels = labels + [_label(func)]
+        self_time = entries[func][2] * share
+        if self_time >= min_seconds:
+            key = ";".join(labels)
+            folded[key] = folded.get(key, 0.0) + self_time
+        for child, edge_time in children.get(func, ()):
+            total = entries[child][3]
+            child_share = share * edge_time / total if total else 0.0
+            if child not in path and child_share * total >= min_seconds:
+                walk(child, path | {child}, labels, child_share)
+
+    for root in roots:
+        walk(root, {root}, [], 1.0)
+    return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(folded.items()) if round(seconds * 1e6)]
+
+
+def _top_functions(stats, n=TOP_FUNCTIONS):
+    rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:n]
+    return [{"function": _label(func), "calls": nc, "tottime_s": tt, "cumtime_s": ct}
+            for func, (_, nc, tt, ct, _) in rows]
+
+
+def write_profile(profiler, name, started_at, wall, tags, directory=None):
+    import pstats
+
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    version = str(tags.get("model_version") or "unknown").replace(os.sep, "_")
+    prefix = os.path.join(directory, f"{name}-{started_at}-{version}")
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(prefix + ".prof")
+    with open(prefix + ".folded", "w", encoding="utf-8") as f:
+        f.write("\n".join(folded_stacks(stats)) + "\n")
+    with open(prefix + ".json", "w", encoding="utf-8") as f:
+        json.dump({"name": name, "started": started_at, "wall_s": wall, "python": sys.version.split()[0],
+                   "tags": tags, "top": _top_functions(stats)}, f, indent=2, default=str)
+    print(f"profile {name}: {wall:.3f}s -> {prefix}.prof", file=sys.stderr)
+    return prefix
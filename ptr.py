@@ -7,19 +7,33 @@ Original file is located at
     https://colab.research.google.com/drive/1v2U95jxnKp4k4olRg-QQPGrF9WHzy2av
 """
 
-from google.colab import files
+try:
+    from google.colab import files
+except ImportError:  # running outside Colab: DMart.csv is read from the working directory
+    files = None
 import io
 
-uploaded = files.upload()
+# Upload only when run as the notebook/script, so worker processes can import this module
+if __name__ == "__main__" and files is not None:
+  uploaded = files.upload()
 
-for fn in uploaded.keys():
-  print('User uploaded file "{name}" with length {length} bytes'.format(
-      name=fn, length=len(uploaded[fn])))
+  for fn in uploaded.keys():
+    print('User uploaded file "{name}" with length {length} bytes'.format(
+        name=fn, length=len(uploaded[fn])))
 
 # To read the file into a pandas DataFrame:
 # import pandas as pd
 # df = pd.read_csv(io.StringIO(uploaded[fn].decode('utf-8')))
 
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -29,6 +43,8 @@ from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import xgboost as xgb
 from sklearn.utils import resample
+from ingest import label_classes, load_dataset
+import profiling
 
 # Load and preprocess dataset
 def load_and_preprocess(file_path):
@@ -91,8 +107,19 @@ def balance_dataset(df):
     return balanced_df.drop('SalesCategory', axis=1)
 
 # Main workflow
+# P10 / P90 per row from the spread of a forest's trees; boosted models have no per-tree
+# distribution, so they get the empirical P10 / P90 of the held-out residuals instead
+def prediction_interval(model, X, predictions, residuals, quantiles=(0.1, 0.9)):
+    from tree_engine import compile_model
+
+    try:
+        return compile_model(model).predict_quantiles(X, quantiles).T
+    except TypeError:
+        offsets = np.quantile(np.asarray(residuals, dtype=np.float64), quantiles)
+        return predictions + offsets[0], predictions + offsets[1]
+
 def main():
-    df = load_and_preprocess('DMart.csv')
+    df = load_dataset('DMart.csv')
     balanced_df = balance_dataset(df)
 
     balanced_df = balanced_df.sort_values('Date')
@@ -109,22 +136,20 @@ def main():
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
 
-    model = xgb.XGBRegressor(
-        objective='reg:squarederror',
-        n_estimators=1000,
-        learning_rate=0.05,
-        max_depth=7,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        early_stopping_rounds=50,
-        random_state=42
-    )
-
-    tscv = TimeSeriesSplit(n_splits=5)
-
-    model.fit(X_train_scaled, y_train,
-              eval_set=[(X_test_scaled, y_test)],
-              verbose=False)
+    # Tuned params from hpsearch.py already carry the early-stopped tree count; without them,
+    # stop on the tail of the training rows so the test block stays held out
+    threads = os.cpu_count() or 1
+    tuned = load_best_params().get('XGBoost')
+    if tuned:
+        model = build_model('XGBoost', threads, tuned)
+        model.fit(X_train_scaled, y_train, verbose=False)
+    else:
+        from hpsearch import EARLY_STOPPING_FRACTION, EARLY_STOPPING_ROUNDS, fit_early_stopped
+        model = build_model('XGBoost', threads, dict(subsample=0.8, colsample_bytree=0.8,
+                                                     early_stopping_rounds=EARLY_STOPPING_ROUNDS))
+        stop = len(X_train_scaled) - max(1, int(len(X_train_scaled) * EARLY_STOPPING_FRACTION))
+        fit_early_stopped('XGBoost', model, X_train_scaled[:stop], y_train.iloc[:stop],
+                          X_train_scaled[stop:], y_train.iloc[stop:])
 
     y_pred = model.predict(X_test_scaled)
 
@@ -161,14 +186,13 @@ def main():
     predictions = model.predict(X_forecast_scaled)
 
     residuals = y_test - model.predict(X_test_scaled)
-    std_dev = residuals.std()
-    conf_interval = 1.96 * std_dev
+    lower, upper = prediction_interval(model, X_forecast_scaled, predictions, residuals)
 
     forecast_results = pd.DataFrame({
         'Date': forecast_dates,
         'PredictedUnits': predictions,
-        'LowerBound': predictions - conf_interval,
-        'UpperBound': predictions + conf_interval
+        'LowerBound': lower,
+        'UpperBound': upper
     })
 
     plt.figure(figsize=(14, 7))
@@ -177,7 +201,7 @@ def main():
     plt.fill_between(forecast_results['Date'],
                      forecast_results['LowerBound'],
                      forecast_results['UpperBound'],
-                     color='pink', alpha=0.3, label='95% Confidence Interval')
+                     color='pink', alpha=0.3, label='P10-P90 Interval')
 
     plt.title('30-Day Product Demand Forecast')
     plt.xlabel('Date')
@@ -197,17 +221,6 @@ def main():
     print("3. Balanced sampling technique used to prevent minority class underrepresentation")
     print("4. Regular monitoring for performance across product categories recommended")
 
-if __name__ == "__main__":
-    main()
-
-# Assuming your original preprocessing functions exist in the notebook:
-
-# 1. Load original data file (replace with the correct filename if needed)
-df = load_and_preprocess('DMart.csv')
-
-# 2. Balance the dataset using your defined function
-balanced_df = balance_dataset(df)
-
 def enrich_features(df):
     df = df.sort_values("Date").reset_index(drop=True)
 
@@ -228,8 +241,58 @@ def enrich_features(df):
 
     return df
 
-# Apply enrichment to entire dataset
-df_enriched = enrich_features(balanced_df)
+SERIES_KEYS = ['CategoryEncoded', 'BrandEncoded']
+
+# Series-aware version of enrich_features: lags and the 7-row rolling mean are taken within
+# each series key, in one pass over the key+Date sorted frame. Rows that share a key and Date
+# (e.g. copies made by resample) are one observation and get the same features, so they never
+# lag each other. Gaps at the start of a series are backfilled from within the same series.
+def enrich_features_by_series(df, keys=SERIES_KEYS):
+    n = len(df)
+    series_id = df.groupby(list(keys), sort=False).ngroup().to_numpy() if keys else np.zeros(n, dtype=np.int64)
+    dates = df['Date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    order = np.lexsort((dates, series_id))
+    sid, day = series_id[order], dates[order]
+    units = df['UnitsSold'].to_numpy(dtype=np.float64)[order]
+
+    # One observation per (series, Date)
+    new_obs = np.ones(n, dtype=bool)
+    new_obs[1:] = (sid[1:] != sid[:-1]) | (day[1:] != day[:-1])
+    obs_start = np.flatnonzero(new_obs)
+    obs_of_row = np.cumsum(new_obs) - 1
+    obs_value = np.add.reduceat(units, obs_start) / np.diff(np.append(obs_start, n)) if n else units
+    obs_sid = sid[obs_start]
+
+    # Position of each observation inside its series
+    m = len(obs_start)
+    idx = np.arange(m)
+    seg_new = np.ones(m, dtype=bool)
+    seg_new[1:] = obs_sid[1:] != obs_sid[:-1]
+    seg_start = np.flatnonzero(seg_new)
+    seg_len = np.diff(np.append(seg_start, m))
+    first = np.repeat(seg_start, seg_len)
+    pos, length = idx - first, np.repeat(seg_len, seg_len)
+    seg_mean = np.repeat(np.add.reduceat(obs_value, seg_start) / seg_len, seg_len) if m else obs_value
+
+    def lag(k):
+        out = np.where(pos >= k, obs_value[np.maximum(idx - k, 0)], np.nan)
+        # backfill inside the series (first value), series too short for the lag -> series mean
+        return np.where(pos >= k, out, np.where(length > k, obs_value[first], seg_mean))
+
+    csum = np.concatenate([[0.0], np.cumsum(obs_value)])
+    rolling = np.where(pos >= 6, (csum[idx + 1] - csum[np.maximum(idx - 6, 0)]) / 7, np.nan)
+    head = np.minimum(first + 6, m - 1)
+    rolling = np.where(pos >= 6, rolling, np.where(length >= 7, rolling[head], seg_mean))
+
+    out = df.copy()
+    for name, values in (('Lag_1', lag(1)), ('Lag_7', lag(7)), ('RollingMean_7', rolling)):
+        column = np.empty(n)
+        column[order] = values[obs_of_row]
+        out[name] = column
+    out['DayOfYear'] = out['Date'].dt.dayofyear
+    out['WeekOfYear'] = out['Date'].dt.isocalendar().week.astype(int)
+    out['IsWeekend'] = out['DayOfWeek'].isin([5, 6]).astype(int)
+    return out.sort_values('Date', kind='stable').reset_index(drop=True)
 
 # Redefine features
 features = [
@@ -242,76 +305,325 @@ from sklearn.ensemble import RandomForestRegressor
 from lightgbm import LGBMRegressor
 from catboost import CatBoostRegressor
 
-# Split
-split_index = int(len(df_enriched) * 0.8)
-train = df_enriched.iloc[:split_index]
-test = df_enriched.iloc[split_index:]
-
-X_train = train[features]
-y_train = train['UnitsSold']
-X_test = test[features]
-y_test = test['UnitsSold']
-
-# Scale
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-models = {
-    'XGBoost': xgb.XGBRegressor(objective='reg:squarederror', n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42),
-    'LightGBM': LGBMRegressor(n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42),
-    'CatBoost': CatBoostRegressor(verbose=0, n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42),
-    'RandomForest': RandomForestRegressor(n_estimators=300, max_depth=15, random_state=42)
+MODEL_NAMES = ['XGBoost', 'LightGBM', 'CatBoost', 'RandomForest']
+
+# Hard-coded defaults; hpsearch.py writes tuned overrides to best_params.json
+DEFAULT_PARAMS = {
+    'XGBoost': dict(objective='reg:squarederror', n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42),
+    'LightGBM': dict(n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42, verbose=-1),
+    'CatBoost': dict(verbose=0, n_estimators=1000, learning_rate=0.05, max_depth=7, random_state=42),
+    'RandomForest': dict(n_estimators=300, max_depth=15, random_state=42),
 }
+BEST_PARAMS_PATH = os.environ.get('FORECAST_BEST_PARAMS_PATH', 'best_params.json')
+
+def load_best_params(path=BEST_PARAMS_PATH):
+    import json
+    try:
+        with open(path, encoding='utf-8') as f:
+            return {name: entry['params'] for name, entry in json.load(f).get('models', {}).items()}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+# Each model gets an explicit thread budget so the zoo never oversubscribes cores
+def build_model(name, threads, params=None):
+    if name not in DEFAULT_PARAMS:
+        raise ValueError(f"unknown model {name!r}")
+    kwargs = dict(DEFAULT_PARAMS[name])
+    kwargs.update(load_best_params().get(name, {}) if params is None else params)
+    if name == 'XGBoost':
+        return xgb.XGBRegressor(n_jobs=threads, **kwargs)
+    if name == 'LightGBM':
+        return LGBMRegressor(n_jobs=threads, **kwargs)
+    if name == 'CatBoost':
+        return CatBoostRegressor(thread_count=threads, **kwargs)
+    return RandomForestRegressor(n_jobs=threads, **kwargs)
+
+def _peak_memory_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB on Linux
+
+def fit_and_score(name, threads, X_train, y_train, X_test, y_test):
+    from threadpoolctl import threadpool_limits
+
+    mem_start = _peak_memory_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    with threadpool_limits(limits=threads):
+        model = build_model(name, threads)
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_test)
+
+    return {
+        'Model': model,
+        'MAE': mean_absolute_error(y_test, y_pred),
+        'RMSE': np.sqrt(mean_squared_error(y_test, y_pred)),
+        'R2': r2_score(y_test, y_pred),
+        'Predictions': y_pred,
+        'Threads': threads,
+        'WallTime': time.perf_counter() - wall_start,
+        'CPUTime': time.process_time() - cpu_start,
+        'PeakMemMB': _peak_memory_mb(),
+        'FitMemMB': _peak_memory_mb() - mem_start,  # growth of the worker's peak RSS during fit/predict
+    }
 
-results = {}
+# Fit the zoo on a process pool: models run side by side and split the CPU budget between them
+def compare_models(X_train, y_train, X_test, y_test, names=MODEL_NAMES, n_cpus=None):
+    n_cpus = n_cpus or os.cpu_count() or 1
+    n_workers = max(1, min(len(names), n_cpus))
+    threads = max(1, n_cpus // n_workers)
+
+    # One fresh worker per model so peak memory is per model, not cumulative
+    try:
+        pool = ProcessPoolExecutor(max_workers=n_workers, max_tasks_per_child=1)
+    except TypeError:  # Python < 3.11
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+    with pool:
+        futures = {name: pool.submit(fit_and_score, name, threads, X_train, y_train, X_test, y_test) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+def results_table(results):
+    return pd.DataFrame({
+        name: {k: r[k] for k in ('MAE', 'RMSE', 'R2', 'Threads', 'WallTime', 'CPUTime', 'PeakMemMB', 'FitMemMB')}
+        for name, r in results.items()
+    }).T
+
+# ------------------- WALK-FORWARD CV -------------------
+CV_SPLITS = 5
+
+def _fit_fold(name, threads, x_path, y_path, fold, train_end, test_start, test_end):
+    # Workers map the shared matrix read-only instead of receiving pickled copies
+    X = np.load(x_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[:train_end])
+    X_test = scaler.transform(X[test_start:test_end])
+    result = fit_and_score(name, threads, X_train, y[:train_end], X_test, y[test_start:test_end])
+    result = {k: v for k, v in result.items() if k not in ('Model', 'Predictions')}
+    result.update(Model=name, Fold=fold, TrainRows=train_end, TestRows=test_end - test_start)
+    return result
+
+# Folds split the sorted unique dates with TimeSeriesSplit and map back to row ranges, so rows
+# of one day (resampled copies, several series) never sit on both sides of a fold boundary
+def walk_forward_folds(dates, n_splits=CV_SPLITS):
+    """(fold, train_end, test_start, test_end) row bounds for date-sorted `dates`."""
+    dates = np.asarray(dates)
+    if len(dates) > 1 and (dates[1:] < dates[:-1]).any():
+        raise ValueError("walk-forward folds need rows sorted by date")
+    days = np.unique(dates)
+    folds = []
+    for fold, (train_idx, test_idx) in enumerate(TimeSeriesSplit(n_splits=n_splits).split(days)):
+        train_end = int(np.searchsorted(dates, days[train_idx[-1]], side='right'))
+        test_end = int(np.searchsorted(dates, days[test_idx[-1]], side='right'))
+        folds.append((fold, train_end, train_end, test_end))
+    return folds
+
+# Every (model, fold) pair runs in its own worker; each fold trains on the past and scores on
+# the block of days right after it
+def walk_forward_evaluate(X, y, dates, names=MODEL_NAMES, n_splits=CV_SPLITS, n_cpus=None):
+    import shutil
+    import tempfile
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    folds = walk_forward_folds(dates, n_splits)
+    tasks = sorted(((name,) + f for name in names for f in folds), key=lambda t: -t[2])  # biggest fits first
+
+    n_cpus = n_cpus or os.cpu_count() or 1
+    n_workers = max(1, min(len(tasks), n_cpus))
+    threads = max(1, n_cpus // n_workers)
+    tmp = tempfile.mkdtemp(prefix='walk_forward_')
+    try:
+        x_path, y_path = os.path.join(tmp, 'X.npy'), os.path.join(tmp, 'y.npy')
+        np.save(x_path, X)
+        np.save(y_path, y)
+        # Workers are reused across folds (20 short fits would mostly pay process start-up),
+        # so PeakMemMB is the worker's peak so far rather than a per-fold figure
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_fit_fold, name, threads, x_path, y_path, fold, train_end, test_start, test_end)
+                       for name, fold, train_end, test_start, test_end in tasks]
+            rows = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    columns = ['Model', 'Fold', 'TrainRows', 'TestRows', 'MAE', 'RMSE', 'R2',
+               'Threads', 'WallTime', 'CPUTime', 'PeakMemMB']
+    return pd.DataFrame(rows)[columns].sort_values(['Model', 'Fold']).reset_index(drop=True)
+
+def walk_forward_summary(folds):
+    return folds.groupby('Model')[['MAE', 'RMSE', 'R2', 'WallTime']].agg(['mean', 'std'])
+
+# ------------------- PERMUTATION IMPORTANCE -------------------
+PERMUTATION_REPEATS = 5
+PERMUTATION_CHUNK_ROWS = 65536
+_permutation_state = {}
+
+def _permutation_task(model_path, x_path, y_path, threads, column, repeat, seed, chunk_rows=PERMUTATION_CHUNK_ROWS):
+    import joblib
+    from threadpoolctl import threadpool_limits
+
+    key = (model_path, x_path, chunk_rows)
+    if key not in _permutation_state:
+        # Each worker loads the model once and maps the shared test matrix read-only; the only
+        # copies are the shuffled column and one chunk-sized buffer that rows are predicted from
+        model = joblib.load(model_path)
+        params = model.get_params()
+        model.set_params(**{k: threads for k in ('n_jobs', 'thread_count') if k in params})
+        X = np.load(x_path, mmap_mode='r')
+        _permutation_state.clear()
+        _permutation_state[key] = (model, X, np.empty((min(chunk_rows, len(X)), X.shape[1])))
+    model, X, buffer = _permutation_state[key]
+    y = np.load(y_path, mmap_mode='r')
+    shuffled = np.random.default_rng([seed, column, repeat]).permutation(X[:, column])
+    pred = np.empty(len(X))
+    with threadpool_limits(limits=threads):
+        for start in range(0, len(X), chunk_rows):
+            stop = min(start + chunk_rows, len(X))
+            chunk = buffer[:stop - start]
+            chunk[:] = X[start:stop]
+            chunk[:, column] = shuffled[start:stop]
+            pred[start:stop] = model.predict(chunk)
+    return column, repeat, r2_score(y, pred)
+
+# Drop in R² when one column is shuffled, mean and std over repeats. Every (feature, repeat)
+# pair is a pool task over the same memory-mapped test matrix
+def permutation_importance(model, X, y, names=features, n_repeats=PERMUTATION_REPEATS, n_cpus=None, seed=42,
+                           chunk_rows=PERMUTATION_CHUNK_ROWS):
+    import joblib
+    import shutil
+    import tempfile
+
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    baseline = r2_score(y, model.predict(X))
+    tasks = [(column, repeat) for column in range(X.shape[1]) for repeat in range(n_repeats)]
+
+    n_cpus = n_cpus or os.cpu_count() or 1
+    n_workers = max(1, min(len(tasks), n_cpus))
+    threads = max(1, n_cpus // n_workers)
+    tmp = tempfile.mkdtemp(prefix='permutation_')
+    try:
+        model_path, x_path, y_path = (os.path.join(tmp, name) for name in ('model.joblib', 'X.npy', 'y.npy'))
+        joblib.dump(model, model_path)
+        np.save(x_path, X)
+        np.save(y_path, y)
+        drops = np.empty((X.shape[1], n_repeats))
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_permutation_task, model_path, x_path, y_path, threads, column, repeat, seed,
+                                   chunk_rows) for column, repeat in tasks]
+            for future in futures:
+                column, repeat, score = future.result()
+                drops[column, repeat] = baseline - score
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return pd.DataFrame({'Feature': list(names), 'ImportanceMean': drops.mean(axis=1),
+                         'ImportanceStd': drops.std(axis=1)})
+
+def train_model_zoo():
+    # Version of the artifact this run produces; `--profile` / FORECAST_PROFILE=1 tags each stage's profile with it
+    run_version = time.strftime("%Y%m%d%H%M%S")
+    run_tags = dict(model_version=run_version, dataset='DMart.csv', models=MODEL_NAMES, cv_splits=CV_SPLITS,
+                    best_params=load_best_params(), cpus=os.cpu_count())
+
+    with profiling.profile('train.prepare', **run_tags) as prof:
+        # 1. Load original data file (replace with the correct filename if needed); cached after the first run
+        df = load_dataset('DMart.csv')
+
+        # 2. Balance the dataset using your defined function
+        balanced_df = balance_dataset(df)
+
+        # Lags and rolling means per (Category, Brand) series, so they never leak across series or resampled copies
+        df_enriched = enrich_features_by_series(balanced_df)
+        prof.tag(rows=len(df), balanced_rows=len(df_enriched))
+
+    # Split
+    split_index = int(len(df_enriched) * 0.8)
+    train = df_enriched.iloc[:split_index]
+    test = df_enriched.iloc[split_index:]
+
+    X_train = train[features]
+    y_train = train['UnitsSold']
+    X_test = test[features]
+    y_test = test['UnitsSold']
 
-for name, model in models.items():
-    model.fit(X_train_scaled, y_train)
-    y_pred = model.predict(X_test_scaled)
+    # Scale
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
 
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    r2 = r2_score(y_test, y_pred)
+    comparison_start = time.perf_counter()
+    with profiling.profile('train.compare_models', rows=len(X_train), **run_tags):
+        results = compare_models(X_train_scaled, y_train, X_test_scaled, y_test)
+    comparison_time = time.perf_counter() - comparison_start
+
+    # Display all results
+    print("\n📊 Model Performance Comparison:")
+    print(results_table(results).to_string(float_format=lambda v: f"{v:.4f}"))
+    print(f"\nTotal comparison wall time: {comparison_time:.1f}s on {os.cpu_count()} CPUs")
+
+    # Walk-forward CV over the time-ordered frame: per-fold metrics and timings for every model
+    if CV_SPLITS:
+        cv_start = time.perf_counter()
+        with profiling.profile('train.walk_forward', rows=len(df_enriched), **run_tags):
+            cv_folds = walk_forward_evaluate(df_enriched[features], df_enriched['UnitsSold'], df_enriched['Date'])
+        print(f"\n🔁 Walk-forward CV ({CV_SPLITS} folds, {time.perf_counter() - cv_start:.1f}s):")
+        print(cv_folds.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(walk_forward_summary(cv_folds).to_string(float_format=lambda v: f"{v:.4f}"))
+
+    # Select best model based on R²
+    best_model_name = max(results, key=lambda k: results[k]['R2'])
+    best_model = results[best_model_name]['Model']
+    best_preds = results[best_model_name]['Predictions']
+
+    print(f"\n✅ Best Model: {best_model_name}")
+
+    # Visualize
+    plt.figure(figsize=(12, 5))
+    plt.plot(y_test.values, label='Actual', color='blue', alpha=0.6)
+    plt.plot(best_preds, label=f'Predicted by {best_model_name}', color='green', alpha=0.7)
+    plt.title(f"{best_model_name}: Actual vs Predicted Units Sold")
+    plt.xlabel("Test Samples")
+    plt.ylabel("Units Sold")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
 
-    results[name] = {
-        'Model': model,
-        'MAE': mae,
-        'RMSE': rmse,
-        'R2': r2,
-        'Predictions': y_pred
+    import joblib
+    joblib.dump(best_model, 'best_random_forest_model.pkl')
+    joblib.dump(scaler, 'scaler.pkl')
+
+    # Permutation importance on the held-out rows, stored in the artifact for the apps
+    pi_start = time.perf_counter()
+    with profiling.profile('train.permutation_importance', model=best_model_name, repeats=PERMUTATION_REPEATS,
+                           rows=len(X_test), **run_tags):
+        importance = permutation_importance(best_model, X_test_scaled, y_test)
+    print(f"\n🔀 Permutation importance ({PERMUTATION_REPEATS} repeats, {time.perf_counter() - pi_start:.1f}s):")
+    print(importance.sort_values('ImportanceMean', ascending=False).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+    # Fused encoders + scaler + model artifact used by the apps (scaler folded into tree thresholds)
+    from forecast_pipeline import build_pipeline, save_pipeline
+    with profiling.profile('train.build_pipeline', model=best_model_name, **run_tags):
+        pipeline = build_pipeline(best_model, scaler, model_version=run_version, classes=label_classes('DMart.csv'))
+    pipeline.permutation_importances = {
+        'mean': importance['ImportanceMean'].tolist(), 'std': importance['ImportanceStd'].tolist(),
+        'repeats': PERMUTATION_REPEATS, 'metric': 'r2_drop',
     }
+    save_pipeline(pipeline, 'forecast_pipeline.joblib')
+    # The apps prefer the flat artifact, so rewrite it too; a model the engine cannot flatten
+    # removes the old one instead of leaving the previous model in service
+    from forecast_pipeline import remove_flat, save_flat
+    try:
+        save_flat(pipeline, 'forecast_model.flat')
+    except TypeError:
+        remove_flat('forecast_model.flat')
+
+    if files is not None:
+        files.download('best_random_forest_model.pkl')
+        files.download('scaler.pkl')
+        files.download('forecast_pipeline.joblib')
 
-# Display all results
-print("\n📊 Model Performance Comparison:")
-for name, metrics in results.items():
-    print(f"\n{name} Model:")
-    print(f"MAE : {metrics['MAE']:.2f}")
-    print(f"RMSE: {metrics['RMSE']:.2f}")
-    print(f"R²  : {metrics['R2']:.4f}")
-
-# Select best model based on R²
-best_model_name = max(results, key=lambda k: results[k]['R2'])
-best_model = results[best_model_name]['Model']
-best_preds = results[best_model_name]['Predictions']
-
-print(f"\n✅ Best Model: {best_model_name}")
-
-# Visualize
-plt.figure(figsize=(12, 5))
-plt.plot(y_test.values, label='Actual', color='blue', alpha=0.6)
-plt.plot(best_preds, label=f'Predicted by {best_model_name}', color='green', alpha=0.7)
-plt.title(f"{best_model_name}: Actual vs Predicted Units Sold")
-plt.xlabel("Test Samples")
-plt.ylabel("Units Sold")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-
-import joblib
-joblib.dump(best_model, 'best_random_forest_model.pkl')
-
-from google.colab import files
-
-files.download('best_random_forest_model.pkl')
\ No newline at end of file
+if __name__ == "__main__":
+    with profiling.profile('train.xgb_forecast', dataset='DMart.csv'):
+        main()
+    train_model_zoo()
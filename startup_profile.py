@@ -0,0 +1,130 @@
+"""Opt-in cold-start profile for the Streamlit apps.
+
+With FORECAST_STARTUP_PROFILE=1 the first run of an app in each process records
+every top-level import the script triggers (cumulative ms, and the stage it
+happened in) and the time of each stage (imports, css, header, artifact load,
+first render, animations). The report goes to stderr and a sidebar expander,
+flagged when the total exceeds FORECAST_STARTUP_BUDGET_MS. Disabled, `begin()`
+returns a recorder whose methods do nothing, and `__import__` is left alone.
+
+    python startup_profile.py PP.py PT.py [--budget-ms 2000]   # fresh process per app; exit 1 over budget
+"""
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+ENABLED = os.environ.get("FORECAST_STARTUP_PROFILE", "0") == "1"
+BUDGET_MS = float(os.environ.get("FORECAST_STARTUP_BUDGET_MS", 2000))
+REPORT_PATH = os.environ.get("FORECAST_STARTUP_REPORT")   # also write the report as JSON here
+
+_profiled = set()   # apps already profiled in this process: later runs are warm
+
+
+class _Disabled:
+    def mark(self, stage):
+        pass
+
+    def finish(self, st=None):
+        return None
+
+
+class StartupProfile:
+    def __init__(self, app):
+        self.app = app
+        self.started = self._last = time.perf_counter()
+        self.stage = "imports"
+        self.stages = []    # (stage, ms)
+        self.imports = []   # (module, ms, stage)
+        self._thread = threading.get_ident()
+        self._depth = 0
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only modules imported for the first time, by the script itself (nested imports count toward them)
+        if self._depth or level or name in sys.modules or threading.get_ident() != self._thread:
+            return self._import(name, globals, locals, fromlist, level)
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.imports.append((name, (time.perf_counter() - started) * 1e3, self.stage))
+
+    def mark(self, stage):
+        """Close `stage`: the time since the previous mark is charged to it."""
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self._last) * 1e3))
+        self._last = now
+        self.stage = f"after {stage}"
+
+    def report(self):
+        total = sum(ms for _, ms in self.stages)
+        return {"app": self.app, "total_ms": total, "budget_ms": BUDGET_MS, "over_budget": total > BUDGET_MS,
+                "stages": dict(self.stages),
+                "imports": [{"module": m, "ms": ms, "stage": s}
+                            for m, ms, s in sorted(self.imports, key=lambda i: -i[1])]}
+
+    def format(self, report):
+        lines = [f"{self.app} cold start: {report['total_ms']:.0f} ms (budget {BUDGET_MS:.0f} ms"
+                 f"{', OVER' if report['over_budget'] else ''})"]
+        lines += [f"  {stage:<16}{ms:>8.1f} ms" for stage, ms in report["stages"].items()]
+        lines.append("  slowest imports:")
+        lines += [f"    {i['module']:<30}{i['ms']:>8.1f} ms  ({i['stage']})" for i in report["imports"][:15]]
+        return "\n".join(lines)
+
+    def finish(self, st=None):
+        """Stop recording and report; with `st`, also show the report in a sidebar expander."""
+        builtins.__import__ = self._import
+        report = self.report()
+        text = self.format(report)
+        print(text, file=sys.stderr)
+        if REPORT_PATH:
+            with open(REPORT_PATH, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if st is not None:
+            with st.sidebar.expander("Startup profile", expanded=report["over_budget"]):
+                st.code(text, language=None)
+        return report
+
+
+def begin(app):
+    """Recorder for this run of `app`; a no-op unless enabled and this is the app's first run in the process."""
+    if not ENABLED or app in _profiled:
+        return _Disabled()
+    _profiled.add(app)
+    return StartupProfile(app)
+
+
+def _profile_app(script, budget_ms):
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "report.json")
+        env = dict(os.environ, FORECAST_STARTUP_PROFILE="1", FORECAST_STARTUP_REPORT=out,
+                   FORECAST_STARTUP_BUDGET_MS=str(budget_ms))
+        code = ("from streamlit.testing.v1 import AppTest\n"
+                f"AppTest.from_file({script!r}, default_timeout=120).run()\n")
+        subprocess.run([sys.executable, "-c", code], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                       check=True)
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cold-start profile of the Streamlit apps, one fresh process each.")
+    parser.add_argument("apps", nargs="*", default=["PP.py", "PT.py"])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    over = [r["app"] for r in (_profile_app(app, args.budget_ms) for app in args.apps) if r["over_budget"]]
+    if over:
+        print(f"over the {args.budget_ms:.0f} ms startup budget: {', '.join(over)}", file=sys.stderr)
+    sys.exit(1 if over else 0)
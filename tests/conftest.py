@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def training_data():
+    """Synthetic app inputs, their features and a smooth target, 2000 rows."""
+    import numpy as np
+
+    import forecast_core
+
+    inputs = forecast_core.synthetic_inputs(2000, seed=1)
+    X = forecast_core.preprocess_batch(inputs)
+    y = 50 + 0.1 * X["Lag_1"] + 0.05 * X["RollingMean_7"] + 3 * X["DayOfWeek"] + np.random.default_rng(1).normal(0, 5, len(X))
+    return inputs, X, y.to_numpy()
+
+
+@pytest.fixture(scope="session")
+def small_pipeline(training_data):
+    """A 20-tree forest behind the fused pipeline, as the apps and service load it."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    from forecast_pipeline import build_pipeline
+
+    _, X, y = training_data
+    scaler = StandardScaler().fit(X)
+    model = RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(scaler.transform(X), y)
+    return build_pipeline(model, scaler, model_version="test").compile()
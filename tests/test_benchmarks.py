@@ -0,0 +1,36 @@
+from benchmarks import compare
+
+BASELINE = {"results": {
+    "dmart/ingest_csv": {"seconds": 1.0},
+    "dmart/balance_dataset": {"seconds": 1.0},
+    "predict/batch": {"seconds": 0.5},
+    "app/first_run": {"seconds": 2.0},
+}}
+
+
+def test_errored_and_missing_stages_fail():
+    results = {
+        "dmart/ingest_csv": {"seconds": 1.1},
+        "dmart/balance_dataset": {"error": "KeyError: 'Brand'"},
+        "predict/batch": {"seconds": 0.4},
+    }
+    regressions, failures = compare(results, BASELINE, 0.2, ran={"dmart", "predict"})
+    assert regressions == []
+    assert failures == [("dmart/balance_dataset", "KeyError: 'Brand'")]
+
+    del results["predict/batch"]
+    _, failures = compare(results, BASELINE, 0.2, ran={"dmart", "predict", "app"})
+    assert [key for key, _ in failures] == ["dmart/balance_dataset", "predict/batch", "app/first_run"]
+
+
+def test_skipped_groups_and_regressions():
+    results = {"dmart/ingest_csv": {"seconds": 1.5}, "dmart/balance_dataset": {"seconds": 0.9}}
+    regressions, failures = compare(results, BASELINE, 0.2, ran={"dmart"})
+    assert failures == []
+    assert [r[0] for r in regressions] == ["dmart/ingest_csv"]
+    assert results["dmart/ingest_csv"]["ratio"] == 1.5
+
+
+def test_errors_fail_without_a_baseline():
+    _, failures = compare({"app/rerun": {"error": "RuntimeError: boom"}}, {}, 0.2)
+    assert failures == [("app/rerun", "RuntimeError: boom")]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import compact_model
+from compact_model import INTEGER_FEATURES, distill, merge_redundant, quantize, select_trees
+from forecast_core import FEATURES
+from tree_engine import _pack, from_sklearn
+
+INTEGER = [FEATURES.index(f) for f in INTEGER_FEATURES]
+
+
+@pytest.fixture(scope="module")
+def forest(training_data):
+    """A 12-tree forest on raw features (no scaler), so integer snapping applies."""
+    from sklearn.ensemble import RandomForestRegressor
+
+    _, X, y = training_data
+    X = X.to_numpy(dtype=np.float64)
+    model = RandomForestRegressor(n_estimators=12, max_depth=8, random_state=0).fit(X[:1500], y[:1500])
+    return from_sklearn(model), X[1500:].astype(np.float32), y[1500:]
+
+
+def test_merge_keeps_predictions(forest):
+    engine, X, _ = forest
+    merged = merge_redundant(engine, INTEGER)
+    assert merged.n_nodes <= engine.n_nodes
+    assert np.array_equal(merged.predict(X), engine.predict(X))
+
+
+def test_merge_drops_unreachable_and_no_op_splits():
+    # x0 <= 5 -> (x0 <= 7 -> 1.0 | 2.0) | (x1 <= 0.5 -> 3.0 | 3.0): the inner x0 split cannot go
+    # right, and the x1 split has equal leaves
+    feature = np.array([0, 0, 1, 0, 0, 0, 0])
+    threshold = np.array([5.0, 7.0, 0.5, np.nan, np.nan, np.nan, np.nan])
+    left = np.array([1, 3, 5, -1, -1, -1, -1])
+    right = np.array([2, 4, 6, -1, -1, -1, -1])
+    value = np.array([0, 0, 0, 1.0, 2.0, 3.0, 3.0])
+    engine = _pack([(feature, threshold, left, right, value, np.ones(7, dtype=bool))], 2, aggregate="mean")
+    merged = merge_redundant(engine)
+    assert merged.n_nodes == 3
+    X = np.array([[0, 0], [5, 1], [6, 0], [9, 1]], dtype=np.float32)
+    assert np.array_equal(merged.predict(X), engine.predict(X))
+
+
+def test_quantize_is_smaller_and_within_float32(forest):
+    engine, X, _ = forest
+    quantized = quantize(engine)
+    assert quantized.quantized and quantized.nbytes < engine.nbytes / 2
+    np.testing.assert_allclose(quantized.predict(X), engine.predict(X), rtol=1e-6, atol=1e-4)
+
+
+def test_top_k_keeps_k_trees_closer_than_the_first_k(forest):
+    engine, X, _ = forest
+    full = engine.predict(X)
+    top = select_trees(engine, X, 4)
+    assert top.n_trees == 4
+    first = compact_model.repack(engine, compact_model.unpack(engine)[:4])
+    assert np.mean((top.predict(X) - full) ** 2) <= np.mean((first.predict(X) - full) ** 2)
+
+
+def test_distilled_forest_tracks_the_full_model(forest, training_data):
+    engine, X, _ = forest
+    _, X_all, _ = training_data
+    student, estimator = distill(engine, X_all.to_numpy(dtype=np.float32)[:1500], n_estimators=10, max_depth=8)
+    assert student.n_trees == 10 and student.nbytes < engine.nbytes
+    full, got = engine.predict(X), student.predict(X)
+    assert 1 - np.sum((got - full) ** 2) / np.sum((full - full.mean()) ** 2) > 0.8
+    np.testing.assert_allclose(got, estimator.predict(X), rtol=1e-5, atol=1e-4)
+
+
+def test_table_reports_slowdowns_against_the_full_model(small_pipeline):
+    variants, rows = compact_model.compact(small_pipeline, keep=(5,), students=((5, 6),), tol=0, n_app=500,
+                                           log=lambda *a: None)
+    assert {"full", "merged", "quantized", "top5", "top5-quantized", "distill-5x6", "distill-5x6-quantized"} <= set(variants)
+    full = next(r for r in rows if r["variant"] == "full")
+    assert full["latency_vs_full"] == full["size_vs_full"] == full["throughput_vs_full"] == 1
+    rows = [dict(r, latency_vs_full=2.0) if r["variant"] == "quantized" else r for r in rows]
+    slower = compact_model.slower_single_row(rows)
+    assert "quantized" in slower and "full" not in slower
@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from feature_store import FeatureStore, ingest_training_data
+
+START = date(2022, 1, 1)   # ingest.START_DATE: training row i is dated START + i
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """A DMart-like CSV with two categories and three brands in random row order."""
+    rng = np.random.default_rng(3)
+    n = 90
+    price = rng.integers(100, 500, n).astype(float)
+    path = tmp_path / "catalog.csv"
+    pd.DataFrame({
+        "Name": [f"item {i}" for i in range(n)],
+        "Brand": rng.choice(["Tata", "Premia", "KMK"], n),
+        "Price": price,
+        "DiscountedPrice": price * rng.uniform(0.6, 1.0, n).round(2),
+        "Category": rng.choice(["Grocery", "Home"], n),
+        "SubCategory": "x",
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_lags_match_training_features(catalog):
+    import ingest
+    import ptr
+
+    names = pd.read_csv(catalog, usecols=["Category", "Brand"])
+    train = ptr.enrich_features_by_series(ingest.load_dataset(catalog, cache=False).assign(
+        Category=names["Category"], Brand=names["Brand"]))
+    store = FeatureStore(fill_gaps=False)
+    previous = {}
+    checked = 0
+    for row in train.itertuples():
+        day = row.Date.date()
+        ingest_training_data(store, catalog, until=day - timedelta(days=1), cache=False)
+        key = (row.Category, row.Brand)
+        got = store.lags(*key, when=day)
+        if key in previous and previous[key][1] >= 6:
+            # The next step's lags are the training row's; the rolling window ends the step before
+            assert got[:2] == pytest.approx((row.Lag_1, row.Lag_7))
+            assert got[2] == pytest.approx(previous[key][0])
+            assert store.window(*key)[1] < day
+            checked += 1
+        else:
+            assert got is None
+        previous[key] = (row.RollingMean_7, previous.get(key, (0, -1))[1] + 1)
+    assert checked > 40
+
+
+def test_incremental_ingest_matches_one_shot(catalog, tmp_path):
+    until = START + timedelta(days=89)
+    once = ingest_training_data(path=catalog, until=until, cache=False)
+    path = str(tmp_path / "store.npz")
+    ingest_training_data(path=catalog, until=START + timedelta(days=30), cache=False).snapshot(path)
+    for day in (45, 46, 80, 89):
+        store = ingest_training_data(FeatureStore.restore(path), catalog, until=START + timedelta(days=day), cache=False)
+        store.snapshot(path)
+    store = FeatureStore.restore(path)
+    assert store.through == once.through == until.toordinal()
+    assert not store.fill_gaps
+    for key in once.keys:
+        assert store.lags(*key) == once.lags(*key)
+        if once.lags(*key) is not None:
+            assert store.window(*key) == once.window(*key)
+
+
+def test_lags_are_date_aware():
+    store = FeatureStore(fill_gaps=False)
+    for i in range(10):
+        store.append("Grocery", "Tata", START + timedelta(days=3 * i), float(i))
+    as_of = START + timedelta(days=28)
+    assert store.lags("Grocery", "Tata", when=as_of - timedelta(days=1)) is None
+    assert store.lags("Grocery", "Tata", when=as_of + timedelta(days=30)) == (9.0, 3.0, 6.0, as_of)
+    assert store.window("Grocery", "Tata") == (START + timedelta(days=9), START + timedelta(days=27))
+    assert store.lags("Pulses", "Tata") is None
+    assert store.lags("Home", "Tata") is None
+
+
+def test_app_categories_get_their_own_series_up_to_the_last_training_day(tmp_path):
+    n = 90
+    sub = np.array(["Pulses", "Grocery/Masala & Spices", "Dals"])[np.arange(n) % 3]
+    path = tmp_path / "catalog.csv"
+    pd.DataFrame({"Name": [f"item {i}" for i in range(n)], "Brand": "Tata", "Price": 200.0,
+                  "DiscountedPrice": 150.0, "Category": "Grocery", "SubCategory": sub}).to_csv(path, index=False)
+    category, _, _, _ = feature_store.training_rows(str(path), cache=False)
+    assert list(category[:3]) == ["Pulses", "Masala & Spices", "Grocery"]
+
+    store = ingest_training_data(path=str(path), cache=False)
+    assert store.through == (START + timedelta(days=n - 1)).toordinal()
+    assert sorted(store.keys) == [("Grocery", "Tata"), ("Masala & Spices", "Tata"), ("Pulses", "Tata")]
+    for key in store.keys:
+        assert store.lags(*key) is not None
+
+
+def test_filled_gaps_match_pandas():
+    assert feature_store.check_against_pandas() == 0
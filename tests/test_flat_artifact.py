@@ -0,0 +1,164 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import forecast_core
+import forecast_pipeline
+import ingest
+from forecast_pipeline import load_flat, remove_flat, save_flat, save_pipeline
+
+
+def test_publish_is_a_symlink_swap_with_pruned_versions(small_pipeline, tmp_path, training_data):
+    path = str(tmp_path / "model.flat")
+    for version in ("a", "b", "c"):
+        small_pipeline.model_version = version
+        save_flat(small_pipeline, path)
+    small_pipeline.model_version = "test"
+    assert os.path.islink(path)
+    assert sorted(os.listdir(tmp_path)) == sorted(["model.flat"] + [os.path.basename(v) for v in forecast_pipeline._versions(path)])
+    assert len(forecast_pipeline._versions(path)) == 2
+    loaded = load_flat(path)
+    assert loaded.model_version == "c"
+    _, X, _ = training_data
+    np.testing.assert_allclose(loaded.predict_features(X[:50]), small_pipeline.predict_features(X[:50]))
+
+
+def test_readers_always_find_an_artifact(small_pipeline, tmp_path):
+    path = str(tmp_path / "model.flat")
+    save_flat(small_pipeline, path)
+    missing, done = [], threading.Event()
+
+    def reader():
+        while not done.is_set():
+            if not os.path.exists(os.path.join(path, "header.json")):
+                missing.append(1)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for _ in range(10):
+            save_flat(small_pipeline, path)
+    finally:
+        done.set()
+        thread.join()
+    assert not missing
+
+
+def test_plain_directory_from_older_release_is_replaced(small_pipeline, tmp_path):
+    path = str(tmp_path / "model.flat")
+    os.makedirs(path)
+    open(os.path.join(path, "header.json"), "w").close()
+    save_flat(small_pipeline, path)
+    assert os.path.islink(path)
+    assert load_flat(path).model_version == "test"
+
+
+def test_stale_flat_artifact_is_not_served(small_pipeline, tmp_path, monkeypatch):
+    flat, joblib_path = str(tmp_path / "model.flat"), str(tmp_path / "pipeline.joblib")
+    small_pipeline.model_version = "old"
+    save_flat(small_pipeline, flat)
+    small_pipeline.model_version = "retrained"
+    save_pipeline(small_pipeline, joblib_path)
+    small_pipeline.model_version = "test"
+    header = os.path.join(flat, "header.json")
+    os.utime(header, ns=(os.stat(joblib_path).st_mtime_ns - 10**9,) * 2)
+    monkeypatch.setattr(forecast_pipeline, "FLAT_PATH", flat)
+    monkeypatch.setattr(forecast_pipeline, "PIPELINE_PATH", joblib_path)
+    assert forecast_pipeline.flat_is_stale(flat, joblib_path)
+    assert forecast_pipeline._load_pipeline(joblib_path).model_version == "retrained"
+
+    os.utime(header, ns=(os.stat(joblib_path).st_mtime_ns + 10**9,) * 2)
+    assert forecast_pipeline._load_pipeline(joblib_path).model_version == "old"
+
+
+def test_remove_flat(small_pipeline, tmp_path):
+    path = str(tmp_path / "model.flat")
+    save_flat(small_pipeline, path)
+    save_flat(small_pipeline, path)
+    remove_flat(path)
+    assert os.listdir(tmp_path) == []
+
+
+def _flip_last_byte(path):
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+
+def test_load_does_not_hash_arrays_unless_asked(small_pipeline, tmp_path, monkeypatch):
+    import tree_engine
+
+    path = str(tmp_path / "model.flat")
+    save_flat(small_pipeline, path)
+    _flip_last_byte(os.path.join(path, "value.npy"))   # same size: only a checksum notices
+    hashed = []
+    real = tree_engine._sha256
+    monkeypatch.setattr(tree_engine, "_sha256", lambda p: hashed.append(p) or real(p))
+    assert load_flat(path).model_version == "test"
+    assert hashed == []
+    with pytest.raises(ValueError, match="checksum"):
+        load_flat(path, verify=True)
+
+
+def test_load_rejects_truncated_arrays(small_pipeline, tmp_path):
+    path = str(tmp_path / "model.flat")
+    save_flat(small_pipeline, path)
+    value = os.path.join(path, "value.npy")
+    os.truncate(value, os.path.getsize(value) - 8)
+    with pytest.raises(ValueError, match="truncated"):
+        load_flat(path)
+
+
+def test_save_verifies_before_publishing(small_pipeline, tmp_path, monkeypatch):
+    import tree_engine
+
+    path = str(tmp_path / "model.flat")
+    save_flat(small_pipeline, path)
+    real = tree_engine.save_arrays
+
+    def corrupt(engine, directory):
+        meta = real(engine, directory)
+        _flip_last_byte(os.path.join(directory, "value.npy"))
+        return meta
+
+    monkeypatch.setattr(tree_engine, "save_arrays", corrupt)
+    small_pipeline.model_version = "corrupt"
+    try:
+        with pytest.raises(ValueError, match="checksum"):
+            save_flat(small_pipeline, path)
+    finally:
+        small_pipeline.model_version = "test"
+    assert load_flat(path, verify=True).model_version == "test"
+    assert len(forecast_pipeline._versions(path)) == 1
+
+
+def test_pipeline_round_trip_keeps_training_encoders(tmp_path, training_data):
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    inputs, X, y = training_data
+    catalog = inputs.assign(Category=inputs["Category"].replace("Pulses", "Staples"))
+    catalog.to_csv(tmp_path / "catalog.csv", index=False)
+    category, brand = LabelEncoder().fit(catalog["Category"]), LabelEncoder().fit(catalog["Brand"])
+    classes = ingest.label_classes(str(tmp_path / "catalog.csv"))
+    assert classes == {"category": list(category.classes_), "brand": list(brand.classes_)}
+
+    def features(rows):
+        return forecast_core.preprocess_batch(rows).assign(CategoryEncoded=category.transform(rows["Category"]),
+                                                           BrandEncoded=brand.transform(rows["Brand"]))
+
+    scaler = StandardScaler().fit(features(catalog))
+    model = RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(scaler.transform(features(catalog)), y)
+    path = str(tmp_path / "pipeline.joblib")
+    save_pipeline(forecast_pipeline.build_pipeline(model, scaler, model_version="rt", classes=classes), path)
+    loaded = joblib.load(path)   # the artifact as saved; the compiled engine sums trees in a different order
+    assert loaded.encoders["category"] == {name: code for code, name in enumerate(category.classes_)}
+
+    fresh = forecast_core.synthetic_inputs(500, seed=7)
+    fresh["Category"] = fresh["Category"].replace("Pulses", "Staples")
+    np.testing.assert_array_equal(loaded.predict(fresh), model.predict(scaler.transform(features(fresh))))
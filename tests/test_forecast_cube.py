@@ -0,0 +1,35 @@
+import glob
+import os
+from datetime import date
+
+import numpy as np
+
+from forecast_cube import build_cube, load_cube
+
+START = date(2024, 1, 5)
+
+
+def test_rebuild_publishes_a_new_pair_and_keeps_the_previous_data(small_pipeline, tmp_path):
+    out = str(tmp_path / "cube")
+    first = build_cube(small_pipeline, START, out=out, days=1, lag_levels=(100, 150))
+    old = load_cube(out, model_version="test")
+    before = np.array(old.values)
+
+    second = build_cube(small_pipeline, START, out=out, days=2, lag_levels=(100, 150))
+    assert second["data_file"] != first["data_file"]
+    cube = load_cube(out, model_version="test")
+    assert cube.header["build"] == second["build"] and cube.values.shape[2] == 2
+    assert np.array_equal(np.asarray(old.values), before)   # readers of the old pair are unaffected
+
+    build_cube(small_pipeline, START, out=out, days=1, lag_levels=(100, 150))
+    data_files = sorted(os.path.basename(p) for p in glob.glob(f"{out}.*.npy"))
+    assert first["data_file"] not in data_files and second["data_file"] in data_files
+    assert len(data_files) == 2
+    assert not glob.glob(f"{out}*.tmp")
+
+
+def test_header_without_its_data_file_is_ignored(small_pipeline, tmp_path):
+    out = str(tmp_path / "cube")
+    header = build_cube(small_pipeline, START, out=out, days=1, lag_levels=(150,))
+    os.remove(tmp_path / header["data_file"])
+    assert load_cube(out) is None
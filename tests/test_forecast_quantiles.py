@@ -0,0 +1,102 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import forecast_core
+import forecast_render
+from forecast_core import QUANTILES, QuantilesUnavailable
+from forecast_cube import build_cube, load_cube
+from prediction_cache import cached_predict_with_quantiles, get_cache
+
+INPUTS = ("Grocery", "Tata", 100.0, 80.0, date(2024, 1, 5), 150, 150, 150)
+
+
+def features(inputs=INPUTS):
+    return forecast_core.preprocess_input(forecast_render._input_data(inputs), *inputs[5:])
+
+
+@pytest.fixture
+def counted(small_pipeline, monkeypatch):
+    """The small pipeline with its single-walk point + quantile call counted."""
+    calls = []
+    original = type(small_pipeline).predict_with_quantiles_features
+
+    def predict_with_quantiles_features(features, quantiles=QUANTILES):
+        calls.append(len(features))
+        return original(small_pipeline, features, quantiles)
+
+    monkeypatch.setattr(small_pipeline, "predict_with_quantiles_features", predict_with_quantiles_features)
+    monkeypatch.setattr(forecast_render, "load_cube", lambda **kwargs: None)
+    get_cache().clear()
+    return small_pipeline, calls
+
+
+def test_point_and_quantiles_share_one_cached_walk(counted):
+    pipeline, calls = counted
+    X = features()
+    first = cached_predict_with_quantiles(pipeline, X)
+    second = cached_predict_with_quantiles(pipeline, X)
+    assert calls == [1]
+    np.testing.assert_allclose(first, second)
+    np.testing.assert_allclose(first[:, 0], pipeline.predict_features(X))
+    np.testing.assert_allclose(first[:, 1:], pipeline.predict_quantiles_features(X, QUANTILES))
+
+
+def test_repeat_forecasts_do_not_rerun_the_model(counted):
+    pipeline, calls = counted
+    forecast = forecast_render.compute_forecast(pipeline, INPUTS)
+    forecast_render.compute_forecast(pipeline, INPUTS)
+    assert calls == [1]
+    assert forecast.lower <= forecast.median <= forecast.upper
+    assert forecast.interval.startswith("P10")
+
+
+def test_daily_band_comes_from_the_cached_walk(counted):
+    pipeline, calls = counted
+    forecast = forecast_render.compute_forecast(pipeline, INPUTS)
+    dates, preds, lower, upper = forecast_render.daily_forecast.__wrapped__(pipeline, forecast, 5)
+    assert len(calls) == 5   # day 0 is the card's cached entry; the other four are one walk each
+    assert preds[0] == pytest.approx(forecast.prediction)
+    assert (lower <= upper).all()
+
+
+def test_cube_hit_answers_point_and_band(small_pipeline, tmp_path, monkeypatch):
+    header = build_cube(small_pipeline, date(2024, 1, 5), out=str(tmp_path / "cube"), days=1)
+    assert header["outputs"] == ["prediction", "p10", "p50", "p90"]
+    cube = load_cube(str(tmp_path / "cube"), model_version=small_pipeline.model_version)
+    monkeypatch.setattr(forecast_render, "load_cube", lambda **kwargs: cube)
+
+    def no_model(*args, **kwargs):
+        raise AssertionError("on-grid inputs must not reach the model")
+
+    monkeypatch.setattr(small_pipeline, "predict_with_quantiles_features", no_model)
+    monkeypatch.setattr(small_pipeline, "predict_features", no_model)
+    get_cache().clear()
+    forecast = forecast_render.compute_forecast(small_pipeline, INPUTS)
+    category, brand, price, discounted_price, day, lag_1, lag_7, rolling_mean = INPUTS
+    outputs = cube.lookup(category, brand, day, price, discounted_price, lag_1, lag_7, rolling_mean)
+    assert (forecast.prediction, forecast.lower, forecast.median, forecast.upper) == pytest.approx(outputs)
+
+
+def test_models_without_quantiles_get_the_fixed_band(small_pipeline, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise QuantilesUnavailable("boosted")
+
+    monkeypatch.setattr(small_pipeline, "predict_with_quantiles_features", unavailable)
+    monkeypatch.setattr(forecast_render, "load_cube", lambda **kwargs: None)
+    get_cache().clear()
+    forecast = forecast_render.compute_forecast(small_pipeline, INPUTS)
+    assert forecast.upper == pytest.approx(forecast.prediction * 1.15)
+    assert forecast.interval.startswith("±15%")
+
+
+def test_other_type_errors_are_not_swallowed(small_pipeline, monkeypatch):
+    def broken(*args, **kwargs):
+        raise TypeError("a real bug")
+
+    monkeypatch.setattr(small_pipeline, "predict_with_quantiles_features", broken)
+    monkeypatch.setattr(forecast_render, "load_cube", lambda **kwargs: None)
+    get_cache().clear()
+    with pytest.raises(TypeError, match="a real bug"):
+        forecast_render.compute_forecast(small_pipeline, INPUTS)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import forecast_core
+from forecast_core import MAX_HORIZON, forecast_recursive
+
+
+class Stub:
+    """predict stub: Lag_1 + 1 per product, recording each call's features."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, features):
+        self.calls.append(features.copy())
+        return features["Lag_1"].to_numpy() + 1
+
+
+def products(n=3):
+    inputs = forecast_core.synthetic_inputs(n, seed=2)
+    return inputs.assign(Lag_1=[10.0, 20.0, 30.0][:n], Lag_7=[3.0, 6.0, 9.0][:n], RollingMean_7=[7.0, 14.0, 21.0][:n])
+
+
+def test_lags_roll_forward_from_each_days_prediction():
+    inputs, stub = products(), Stub()
+    horizon = 10
+    preds = forecast_recursive(inputs, horizon, stub)
+    history = forecast_core._seed_history(inputs["Lag_1"].to_numpy(dtype=float), inputs["Lag_7"].to_numpy(dtype=float),
+                                          inputs["RollingMean_7"].to_numpy(dtype=float))
+    for h, day in enumerate(stub.calls):
+        np.testing.assert_array_equal(day["Lag_1"], history[:, -1])
+        np.testing.assert_array_equal(day["Lag_7"], history[:, -7])
+        np.testing.assert_allclose(day["RollingMean_7"], history[:, -7:].mean(axis=1))
+        dates = pd.to_datetime(inputs["Date"]) + pd.Timedelta(days=h)
+        np.testing.assert_array_equal(day["DayOfYear"], dates.dt.dayofyear)
+        history = np.column_stack([history, preds[:, h]])
+    np.testing.assert_array_equal(preds, inputs["Lag_1"].to_numpy()[:, None] + np.arange(1, horizon + 1))
+
+
+def test_one_predict_call_per_day_for_all_products():
+    stub = Stub()
+    inputs = pd.concat([products()] * 40, ignore_index=True)   # 120 products
+    preds = forecast_recursive(inputs, 14, stub)
+    assert preds.shape == (120, 14)
+    assert [len(day) for day in stub.calls] == [120] * 14
+
+
+def test_horizon_beyond_the_maximum_is_rejected():
+    stub = Stub()
+    with pytest.raises(ValueError, match="horizon"):
+        forecast_recursive(products(), MAX_HORIZON + 1, stub)
+    with pytest.raises(ValueError, match="horizon"):
+        forecast_recursive(products(), 0, stub)
+    assert stub.calls == []
+    assert forecast_recursive(products(), MAX_HORIZON, stub).shape == (3, MAX_HORIZON)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+import forecast_core
+from forecast_service import ForecastService, MicroBatcher, make_predict_fn, validate
+
+ROW = {"Category": "Grocery", "Brand": "Tata", "Price": 100.0, "DiscountedPrice": 80.0,
+       "Date": "2024-01-01", "Lag_1": 120, "Lag_7": 110, "RollingMean_7": 115}
+
+
+@pytest.mark.parametrize("value", ["2024-01-01junk", "2024-13-01", "", "yesterday", 20240105, None, 1.5])
+def test_validate_rejects_bad_dates(value):
+    with pytest.raises(ValueError, match="Date"):
+        validate(dict(ROW, Date=value))
+
+
+@pytest.mark.parametrize("value", ["2024-01-02", "2024-01-02T10:00:00", "2024-01-02 23:59", "20240102"])
+def test_validate_canonicalizes_dates(value):
+    (row,) = validate(dict(ROW, Date=value))
+    assert row["Date"] == "2024-01-02"
+
+
+def test_validate_does_not_mutate_payload():
+    payload = {"inputs": [dict(ROW, Date="2024-01-02T10:00:00")]}
+    validate(payload)
+    assert payload["inputs"][0]["Date"] == "2024-01-02T10:00:00"
+
+
+def test_preprocess_batch_mixed_iso_formats():
+    rows = [ROW, dict(ROW, Date="2024-01-02T10:00:00"), dict(ROW, Date="2024-03-25")]
+    features = forecast_core.preprocess_batch(rows)
+    assert features["DayOfYear"].tolist() == [1, 2, 85]
+    assert features["IsHoliday"].tolist() == [1, 0, 1]
+
+
+def test_mixed_format_requests_share_a_batch(small_pipeline):
+    async def run():
+        batcher = MicroBatcher(make_predict_fn(small_pipeline), max_batch=8, max_wait=0.05)
+        worker = asyncio.create_task(batcher.run())
+        requests = [validate(dict(ROW, Date=d)) for d in ("2024-01-01", "2024-01-02T10:00:00", "20240103")]
+        try:
+            return await asyncio.gather(*(batcher.submit(rows) for rows in requests)), batcher.batches
+        finally:
+            worker.cancel()
+
+    results, batches = asyncio.run(run())
+    assert batches == 1
+    expected = small_pipeline.predict([dict(ROW, Date=d) for d in ("2024-01-01", "2024-01-02", "2024-01-03")])
+    assert [r[0] for r in results] == pytest.approx(list(expected))
+
+
+@pytest.mark.parametrize("field", ["Price", "DiscountedPrice", "Lag_1", "Lag_7", "RollingMean_7"])
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf"), 10 ** 400])
+def test_validate_rejects_non_finite_numbers(field, value):
+    with pytest.raises(ValueError, match=f"{field} must be finite"):
+        validate(dict(ROW, **{field: value}))
+
+
+def _exchange(service, request):
+    async def run():
+        server = await asyncio.start_server(service.serve_connection, "127.0.0.1", 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)   # the server closes the connection
+            writer.close()
+            return response
+
+    return asyncio.run(run())
+
+
+def test_non_finite_json_gets_a_400(small_pipeline):
+    body = json.dumps(dict(ROW, Lag_1=float("nan"))).encode()   # serialized as a bare NaN
+    service = ForecastService(small_pipeline, MicroBatcher(make_predict_fn(small_pipeline)))
+    response = _exchange(service, b"POST /predict HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s"
+                         % (len(body), body))
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Lag_1 must be finite" in response
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"+5", b"1_0", b"12.5"])
+def test_malformed_content_length_gets_a_400(small_pipeline, length):
+    service = ForecastService(small_pipeline, MicroBatcher(make_predict_fn(small_pipeline)))
+    response = _exchange(service, b"POST /predict HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+    assert b"invalid Content-Length" in response
@@ -0,0 +1,52 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+import hpsearch
+
+
+@pytest.fixture
+def data_dir(tmp_path, training_data):
+    _, X, y = training_data
+    X = X.to_numpy(dtype=np.float64)
+    for name, a in (('X_train', X[:1500]), ('y_train', y[:1500]), ('X_val', X[1500:]), ('y_val', y[1500:])):
+        np.save(tmp_path / f'{name}.npy', a)
+    return tmp_path
+
+
+XGB = {'n_estimators': 300, 'learning_rate': 0.2, 'max_depth': 5, 'subsample': 1.0,
+       'colsample_bytree': 1.0, 'min_child_weight': 1}
+
+
+def test_boosters_do_not_stop_on_the_validation_block(data_dir):
+    first = hpsearch.evaluate('XGBoost', XGB, 1.0, 1, str(data_dir))
+    assert first['best_n_estimators'] < first['n_estimators']
+    np.save(data_dir / 'y_val.npy', np.load(data_dir / 'y_val.npy')[::-1].copy())
+    second = hpsearch.evaluate('XGBoost', XGB, 1.0, 1, str(data_dir))
+    assert second['best_n_estimators'] == first['best_n_estimators']
+    assert second['rmse'] != first['rmse']
+
+
+def test_best_configs_skip_failed_evaluations(tmp_path):
+    checkpoint = hpsearch.Checkpoint(None, 'k')
+    ok = {'model': 'XGBoost', 'params': XGB, 'fraction': 1 / 3, 'rmse': 12.0, 'n_estimators': 100,
+          'best_n_estimators': 40}
+    checkpoint.add('a', ok)
+    checkpoint.add('b', {'model': 'XGBoost', 'params': XGB, 'fraction': 1.0, 'rmse': float('inf'),
+                         'error': 'XGBoostError: boom'})
+    checkpoint.add('c', {'model': 'XGBoost', 'params': XGB, 'fraction': 1.0, 'rmse': float('nan')})
+    best = hpsearch.best_configs(checkpoint, ['XGBoost'])
+    assert best['XGBoost'] is ok
+
+    out = hpsearch.write_best(best, str(tmp_path / 'best.json'))
+    assert out['models']['XGBoost']['params']['n_estimators'] == 120   # 40 trees at 1/3 of the budget
+    with open(tmp_path / 'best.json', encoding='utf-8') as f:
+        assert math.isfinite(json.load(f)['models']['XGBoost']['rmse'])
+
+
+def test_tuned_params_cap_at_the_sampled_tree_count():
+    entry = {'params': XGB, 'fraction': 1 / 9, 'best_n_estimators': 60}
+    assert hpsearch.tuned_params(entry)['n_estimators'] == 300
+    assert hpsearch.tuned_params({'params': {'n_estimators': 100}, 'fraction': 1.0})['n_estimators'] == 100
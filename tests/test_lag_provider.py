@@ -0,0 +1,32 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from lag_provider import SalesHistory, load_history
+
+
+def write_orders(path, days):
+    lines = ["Order ID,Customer Name,Category,Sub Category,City,Order Date,Region,Sales,Discount,Profit,State"]
+    for i, (day, sales) in enumerate(days):
+        lines.append(f"OD{i},A,Food Grains,Rice,Vellore,{day:%m-%d-%Y},North,{sales},0.1,1,Tamil Nadu")
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_lags_are_rescaled_to_training_units(tmp_path):
+    days = [(date(2018, 1, d), 1000 * d) for d in range(1, 15)]   # revenue 1000..14000, mean 7500
+    csv = tmp_path / "orders.csv"
+    write_orders(csv, days)
+    history = load_history(str(csv), cache_dir=str(tmp_path / "cache"), units_mean=150.0)
+    lag_1, lag_7, rolling, as_of = history.lags("Grocery", date(2018, 1, 15))
+    scale = 150.0 / 7500
+    assert as_of == date(2018, 1, 15)
+    assert (lag_1, lag_7, rolling) == pytest.approx((14000 * scale, 8000 * scale, 11000 * scale))
+    batch = history.lags_batch(["Grocery"], [date(2018, 1, 15)])
+    assert batch[0] == pytest.approx([lag_1, lag_7, rolling])
+
+
+def test_no_lookups_without_a_unit_scale():
+    history = SalesHistory(["ALL"], date(2018, 1, 1), np.full((1, 10), 500.0))
+    assert history.lags("ALL", date(2018, 1, 9)) is None
+    assert np.isnan(history.lags_batch(["ALL"], [date(2018, 1, 9)])).all()
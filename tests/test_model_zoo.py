@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ptr
+
+CHEAP = {
+    'RandomForest': dict(n_estimators=5, max_depth=4, random_state=0),
+    'XGBoost': dict(objective='reg:squarederror', n_estimators=10, max_depth=3, random_state=0),
+}
+
+
+@pytest.fixture
+def cheap_models(monkeypatch, tmp_path):
+    """Small models via best_params.json in the working directory, which spawned workers read too."""
+    monkeypatch.chdir(tmp_path)
+    with open(tmp_path / 'best_params.json', 'w', encoding='utf-8') as f:
+        json.dump({'models': {name: {'params': params} for name, params in CHEAP.items()}}, f)
+    return list(CHEAP)
+
+
+@pytest.fixture(scope="module")
+def dated_frame():
+    """Rows sorted by date, each day repeated 1-4 times like the balanced training frame."""
+    rng = np.random.default_rng(0)
+    days = np.repeat(pd.date_range("2023-01-01", periods=200).to_numpy(), rng.integers(1, 5, 200))
+    X = rng.normal(size=(len(days), 4))
+    y = 3 * X[:, 0] + rng.normal(size=len(days))
+    return X, y, days
+
+
+def test_folds_never_split_a_day(dated_frame):
+    _, _, days = dated_frame
+    folds = ptr.walk_forward_folds(days, 4)
+    assert len(folds) == 4
+    for fold, train_end, test_start, test_end in folds:
+        train, test = set(days[:train_end]), set(days[test_start:test_end])
+        assert train and test and not train & test
+        assert max(train) < min(test)
+    assert folds[-1][3] == len(days)
+    with pytest.raises(ValueError):
+        ptr.walk_forward_folds(days[::-1], 4)
+
+
+def test_walk_forward_reports_every_model_and_fold(dated_frame, cheap_models):
+    X, y, days = dated_frame
+    folds = ptr.walk_forward_evaluate(X, y, days, names=cheap_models, n_splits=3, n_cpus=2)
+    assert sorted(folds['Model'].unique()) == sorted(cheap_models)
+    assert folds.groupby('Model')['Fold'].apply(list).to_dict() == {name: [0, 1, 2] for name in cheap_models}
+    bounds = ptr.walk_forward_folds(days, 3)
+    assert folds['TrainRows'].tolist() == [b[1] for b in bounds] * 2
+    assert (folds[['WallTime', 'CPUTime']] > 0).all().all()
+    assert folds[['MAE', 'RMSE', 'R2']].notna().all().all()
+    summary = ptr.walk_forward_summary(folds)
+    assert list(summary.index) == sorted(cheap_models)
+
+
+@pytest.mark.parametrize("n_cpus, threads", [(1, 1), (4, 2)])
+def test_compare_models_splits_the_cpu_budget(dated_frame, cheap_models, n_cpus, threads):
+    X, y, _ = dated_frame
+    results = ptr.compare_models(X[:400], y[:400], X[400:], y[400:], names=cheap_models, n_cpus=n_cpus)
+    assert list(results) == cheap_models
+    for name, r in results.items():
+        assert r['Threads'] == threads
+        assert len(r['Predictions']) == len(X) - 400
+        assert r['R2'] > 0.5
+        assert r['WallTime'] > 0 and r['CPUTime'] > 0
+    table = ptr.results_table(results)
+    assert list(table.index) == cheap_models
+    assert list(table.columns) == ['MAE', 'RMSE', 'R2', 'Threads', 'WallTime', 'CPUTime', 'PeakMemMB', 'FitMemMB']
+    assert (table['Threads'] == threads).all()
@@ -0,0 +1,25 @@
+import numpy as np
+from sklearn.metrics import r2_score
+
+
+def test_chunked_tasks_match_whole_matrix_shuffles(training_data):
+    from sklearn.ensemble import RandomForestRegressor
+
+    import ptr
+
+    _, X, y = training_data
+    X = X.to_numpy(dtype=np.float64)
+    X_train, y_train, X_test, y_test = X[:1500], y[:1500], X[1500:], y[1500:]
+    model = RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(X_train, y_train)
+
+    got = ptr.permutation_importance(model, X_test, y_test, n_repeats=2, n_cpus=1, chunk_rows=128)
+
+    baseline = r2_score(y_test, model.predict(X_test))
+    for column in range(X.shape[1]):
+        drops = []
+        for repeat in range(2):
+            shuffled = X_test.copy()
+            shuffled[:, column] = np.random.default_rng([42, column, repeat]).permutation(X_test[:, column])
+            drops.append(baseline - r2_score(y_test, model.predict(shuffled)))
+        assert np.isclose(got['ImportanceMean'][column], np.mean(drops))
+        assert np.isclose(got['ImportanceStd'][column], np.std(drops))
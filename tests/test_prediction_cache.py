@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+import forecast_pipeline
+import prediction_cache
+from prediction_cache import PredictionCache
+
+
+class Counted:
+    """predict_fn stub: 10 * the first feature, recording how many rows each call gets."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, rows):
+        self.calls.append(len(rows))
+        return 10 * np.asarray(rows)[:, 0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def rows(*firsts):
+    return np.array([[v, 1.0, 2.0] for v in firsts])
+
+
+def test_hits_misses_and_lru_eviction():
+    cache, fn = PredictionCache(maxsize=3, ttl=60), Counted()
+    np.testing.assert_array_equal(cache.predict(rows(1, 2, 3), fn, "v1"), [10, 20, 30])
+    np.testing.assert_array_equal(cache.predict(rows(1, 4), fn, "v1"), [10, 40])   # 1 is fresh again, 2 goes
+    assert fn.calls == [3, 1]
+    cache.predict(rows(1, 3, 4), fn, "v1")
+    cache.predict(rows(2), fn, "v1")
+    assert fn.calls == [3, 1, 1]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (4, 5, 2, 3)
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache, fn = PredictionCache(maxsize=10, ttl=60), Counted()
+    cache.predict(rows(1), fn, "v1")
+    clock[0] += 59
+    cache.predict(rows(1), fn, "v1")
+    clock[0] += 61
+    cache.predict(rows(1), fn, "v1")
+    assert fn.calls == [1, 1]
+    assert cache.stats()["expirations"] == 1
+
+
+def test_a_new_version_clears_the_cache():
+    cache, fn = PredictionCache(maxsize=10, ttl=60), Counted()
+    cache.predict(rows(1, 2), fn, "v1")
+    cache.predict(rows(1, 2), fn, "v2")
+    assert fn.calls == [2, 2]
+    stats = cache.stats()
+    assert (stats["invalidations"], stats["size"], stats["model_version"]) == (1, 2, "v2")
+
+
+def test_republished_artifact_is_reloaded_and_invalidates(small_pipeline, tmp_path, monkeypatch, training_data):
+    _, X, _ = training_data
+    path = str(tmp_path / "pipeline.joblib")
+    monkeypatch.setattr(forecast_pipeline, "FLAT_PATH", str(tmp_path / "missing.flat"))
+    cache = PredictionCache()
+    monkeypatch.setattr(prediction_cache, "get_cache", lambda: cache)
+
+    forecast_pipeline.save_pipeline(small_pipeline, path)
+    first = forecast_pipeline.load_pipeline(path)
+    assert forecast_pipeline.load_pipeline(path) is first
+    prediction_cache.cached_predict(first, X[:5])
+    prediction_cache.cached_predict(first, X[:5])
+
+    forecast_pipeline.save_pipeline(small_pipeline, path + ".new")   # same model_version, new file
+    os.replace(path + ".new", path)
+    second = forecast_pipeline.load_pipeline(path)
+    assert second is not first and second.model_version == first.model_version
+    prediction_cache.cached_predict(second, X[:5])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (5, 10, 1)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from tree_engine import check_parity, compile_model
+
+
+@pytest.fixture(scope="module")
+def regression_data(training_data):
+    _, X, y = training_data
+    return X.to_numpy(dtype=np.float64), y
+
+
+def test_sklearn_random_forest_parity(regression_data):
+    from sklearn.ensemble import RandomForestRegressor
+
+    X, y = regression_data
+    model = RandomForestRegressor(n_estimators=15, max_depth=10, random_state=0).fit(X[:1500], y[:1500])
+    ok, diff = check_parity(model, X[1500:])
+    assert ok, diff
+
+
+@pytest.mark.parametrize("objective", ["reg:squarederror", "reg:pseudohubererror"])
+def test_xgboost_parity(regression_data, objective):
+    import xgboost as xgb
+
+    X, y = regression_data
+    model = xgb.XGBRegressor(objective=objective, n_estimators=60, max_depth=5, learning_rate=0.1,
+                             early_stopping_rounds=5, random_state=0)
+    model.fit(X[:1200], y[:1200], eval_set=[(X[1200:1500], y[1200:1500])], verbose=False)
+    ok, diff = check_parity(model, X[1500:])
+    assert ok, diff
+
+
+@pytest.mark.parametrize("objective", ["count:poisson", "reg:gamma", "reg:tweedie"])
+def test_xgboost_link_objectives_are_rejected(regression_data, objective):
+    import xgboost as xgb
+
+    X, y = regression_data
+    model = xgb.XGBRegressor(objective=objective, n_estimators=5, max_depth=3).fit(X, np.maximum(y, 1))
+    with pytest.raises(TypeError, match=objective):
+        compile_model(model)
+
+
+def test_xgboost_parallel_trees_stop_at_the_best_round(regression_data):
+    import xgboost as xgb
+
+    X, y = regression_data
+    model = xgb.XGBRegressor(num_parallel_tree=3, n_estimators=200, max_depth=4, learning_rate=0.3,
+                             subsample=0.8, early_stopping_rounds=5, random_state=0)
+    model.fit(X[:1200], y[:1200], eval_set=[(X[1200:1500], y[1200:1500])], verbose=False)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+    engine = compile_model(model)
+    assert engine.n_trees == (model.best_iteration + 1) * 3
+    ok, diff = check_parity(model, X[1500:], engine)
+    assert ok, diff
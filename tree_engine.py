@@ -0,0 +1,390 @@
+"""Flattened-array inference engine for the tree models.
+
+A fitted RandomForest / DecisionTree (sklearn) or XGBoost booster is converted
+into contiguous node arrays (feature, threshold, left child, value). Prediction
+walks every (row, tree) pair one level per step with NumPy gathers, so a single
+row costs ~depth vectorized ops instead of one Python-level call per tree.
+
+    python tree_engine.py [model-or-pipeline.pkl] [n_rows]   # parity + latency check
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from forecast_core import QuantilesUnavailable
+
+# (row, tree) pairs walked per chunk; keeps the working set cache-sized for big batches.
+CHUNK_PAIRS = 1 << 16
+# Threads used for batches spanning several chunks (NumPy gathers release the GIL).
+N_THREADS = int(os.environ.get("FORECAST_ENGINE_THREADS", os.cpu_count() or 1))
+
+_pool = None
+
+
+def _thread_pool():
+    global _pool
+    if _pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _pool = ThreadPoolExecutor(N_THREADS, thread_name_prefix="tree-engine")
+    return _pool
+
+
+class FlatForest:
+    """Trees in breadth-first order with siblings adjacent: the right child of node i is left[i] + 1.
+
+    Leaves point to themselves with a NaN threshold, so every (row, tree) pair can
+    take exactly `depth` steps of `node = left[node] + (x > threshold[node])`.
+    """
+
+    def __init__(self, feature, threshold, left, value, roots, depth, n_features,
+                 aggregate="mean", base_score=0.0, strict=False, missing_left=None,
+                 cuts=None, cut_offsets=None):
+        if cuts is None:
+            self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+            self.threshold = np.ascontiguousarray(threshold, dtype=np.float32)
+            self.left = np.ascontiguousarray(left, dtype=np.intp)
+            self.value = np.ascontiguousarray(value, dtype=np.float64)
+            self.cuts = self.cut_offsets = None
+        else:
+            # Quantized forest (see quantize): thresholds are bin indices into per-feature cut
+            # tables, and the node arrays keep their compact dtypes.
+            self.feature = np.ascontiguousarray(feature)
+            self.threshold = np.ascontiguousarray(threshold)
+            self.left = np.ascontiguousarray(left)
+            self.value = np.ascontiguousarray(value)
+            self.cuts = np.ascontiguousarray(cuts, dtype=np.float32)
+            self.cut_offsets = np.ascontiguousarray(cut_offsets, dtype=np.intp)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        self.n_features = int(n_features)
+        self.aggregate = aggregate
+        self.base_score = float(base_score)
+        self.strict = bool(strict)   # XGBoost goes left on x < t, sklearn on x <= t
+        self.missing_left = None if missing_left is None else np.ascontiguousarray(missing_left, dtype=bool)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        arrays = [self.feature, self.threshold, self.left, self.value, self.roots,
+                  self.missing_left, self.cuts, self.cut_offsets]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    @property
+    def quantized(self):
+        return self.cuts is not None
+
+    def _bin(self, X):
+        """Per-feature bin index: the number of cuts a value passes (cuts <= x when strict)."""
+        side = "right" if self.strict else "left"
+        widest = int(np.diff(self.cut_offsets).max(initial=0))
+        Xb = np.empty(X.shape, dtype=np.uint16 if widest < np.iinfo(np.uint16).max else np.int32)
+        for f in range(self.n_features):
+            Xb[:, f] = np.searchsorted(self.cuts[self.cut_offsets[f]:self.cut_offsets[f + 1]], X[:, f], side=side)
+        return Xb
+
+    def apply(self, X):
+        """Leaf node index for every (row, tree) pair, shape (n_rows, n_trees)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected an array of shape (n, {self.n_features}), got {X.shape}")
+        n_rows = X.shape[0]
+        chunk = max(1, CHUNK_PAIRS // max(self.n_trees, 1))
+        if n_rows <= chunk:
+            return self._walk(X)
+        leaves = np.empty((n_rows, self.n_trees), dtype=np.intp)
+        starts = range(0, n_rows, chunk)
+
+        def walk(start):
+            leaves[start:start + chunk] = self._walk(X[start:start + chunk])
+
+        if N_THREADS > 1:
+            list(_thread_pool().map(walk, starts))
+        else:
+            for start in starts:
+                walk(start)
+        return leaves
+
+    def _walk(self, X):
+        missing = np.isnan(X).ravel() if self.missing_left is not None and np.isnan(X).any() else None
+        if self.quantized:
+            X = self._bin(X)
+        flat = X.ravel()
+        offsets = (np.arange(X.shape[0], dtype=np.intp) * self.n_features)[:, None]
+        nodes = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        go_right = np.greater_equal if self.strict and not self.quantized else np.greater
+        for _ in range(self.depth):
+            at = offsets + self.feature[nodes]
+            step = go_right(flat[at], self.threshold[nodes])
+            if missing is not None:
+                step = np.where(missing[at], ~self.missing_left[nodes], step)
+            nodes = self.left[nodes] + step
+        return nodes
+
+    def predict_trees(self, X):
+        """Per-tree outputs, shape (n_rows, n_trees)."""
+        return self.value[self.apply(X)]
+
+    def predict_quantiles(self, X, quantiles=(0.1, 0.5, 0.9)):
+        """Per-row quantiles of the per-tree outputs, shape (n_rows, len(quantiles)), from one walk.
+
+        Only meaningful for averaged forests, where each tree is a separate estimate; boosted
+        trees are additive corrections and raise QuantilesUnavailable (a TypeError).
+        """
+        if self.aggregate != "mean":
+            raise QuantilesUnavailable("quantiles need an averaged forest, not a boosted one")
+        return np.quantile(self.predict_trees(X), quantiles, axis=1).T
+
+    def predict_with_quantiles(self, X, quantiles=(0.1, 0.5, 0.9)):
+        """`predict` and `predict_quantiles` side by side, shape (n_rows, 1 + len(quantiles)), from one walk."""
+        if self.aggregate != "mean":
+            raise QuantilesUnavailable("quantiles need an averaged forest, not a boosted one")
+        per_tree = self.predict_trees(X)
+        return np.column_stack([per_tree.mean(axis=1, dtype=np.float64), np.quantile(per_tree, quantiles, axis=1).T])
+
+    def predict(self, X):
+        per_tree = self.predict_trees(X)
+        if self.aggregate == "mean":
+            return per_tree.mean(axis=1, dtype=np.float64)
+        return per_tree.sum(axis=1, dtype=np.float32).astype(np.float64) + self.base_score
+
+
+# ------------------- CONVERTERS -------------------
+def _sibling_order(left, right):
+    """Breadth-first node order with each node's two children adjacent, plus the tree depth."""
+    levels = [np.zeros(1, dtype=np.intp)]
+    while True:
+        frontier = levels[-1]
+        internal = frontier[left[frontier] >= 0]
+        if not len(internal):
+            break
+        levels.append(np.stack([left[internal], right[internal]], axis=1).ravel())
+    return np.concatenate(levels), len(levels) - 1
+
+
+def _round_down_f32(threshold):
+    # For float32 x: x <= t (float64)  <=>  x <= largest float32 not above t.
+    t32 = threshold.astype(np.float32)
+    return np.where(t32.astype(np.float64) > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+
+
+def _pack(trees, n_features, strict=False, **kwargs):
+    """trees: list of (feature, threshold, left, right, value, missing_left) with -1 children at leaves."""
+    feature, threshold, left_out, value, missing_left, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for feat, thr, left, right, val, miss in trees:
+        left, right = np.asarray(left, dtype=np.intp), np.asarray(right, dtype=np.intp)
+        order, tree_depth = _sibling_order(left, right)
+        new_id = np.empty(len(left), dtype=np.intp)
+        new_id[order] = np.arange(len(order))
+        leaf = left[order] < 0
+        thr = np.asarray(thr, dtype=np.float64)[order]
+        feature.append(np.where(leaf, 0, np.asarray(feat)[order]))
+        threshold.append(np.where(leaf, np.nan, thr if strict else _round_down_f32(thr)))
+        left_out.append(np.where(leaf, np.arange(len(order)), new_id[np.where(leaf, 0, left[order])]) + offset)
+        value.append(np.asarray(val, dtype=np.float64)[order])
+        missing_left.append(np.asarray(miss, dtype=bool)[order] | leaf)
+        roots.append(offset)
+        offset += len(order)
+        depth = max(depth, tree_depth)
+    return FlatForest(
+        np.concatenate(feature), np.concatenate(threshold), np.concatenate(left_out),
+        np.concatenate(value), roots, depth, n_features, strict=strict,
+        missing_left=np.concatenate(missing_left), **kwargs,
+    )
+
+
+def from_sklearn(model):
+    from sklearn.tree import BaseDecisionTree
+
+    estimators = [model] if isinstance(model, BaseDecisionTree) else list(getattr(model, "estimators_", []))
+    if not estimators or not all(isinstance(e, BaseDecisionTree) for e in estimators):
+        raise TypeError(f"unsupported sklearn model {type(model).__name__}")
+    trees = []
+    for est in estimators:
+        t = est.tree_
+        if t.n_outputs != 1:
+            raise TypeError("only single-output regression trees are supported")
+        missing = getattr(t, "missing_go_to_left", np.zeros(t.node_count, dtype=np.uint8))
+        trees.append((t.feature, t.threshold, t.children_left, t.children_right, t.value[:, 0, 0], missing))
+    return _pack(trees, model.n_features_in_, aggregate="mean")
+
+
+# Objectives whose prediction is the raw margin (leaf sum + base_score); the rest apply a link
+# function (exp for count:poisson / reg:gamma / reg:tweedie, sigmoid for reg:logistic, ...)
+XGB_IDENTITY_OBJECTIVES = ("reg:squarederror", "reg:squaredlogerror", "reg:pseudohubererror",
+                           "reg:absoluteerror", "reg:linear")
+
+
+def _xgb_base_score(config):
+    raw = config["learner"]["learner_model_param"]["base_score"]
+    return float(np.float32(str(raw).strip("[]").split(",")[0]))
+
+
+def _check_xgb_config(config):
+    learner = config["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in XGB_IDENTITY_OBJECTIVES:
+        raise TypeError(f"XGBoost objective {objective!r} does not predict the raw margin; "
+                        f"only {', '.join(XGB_IDENTITY_OBJECTIVES)} are supported")
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise TypeError(f"XGBoost booster {learner['gradient_booster']['name']!r} is not supported")
+    if int(learner["learner_model_param"].get("num_target", 1)) != 1:
+        raise TypeError("only single-output XGBoost models are supported")
+
+
+def from_xgboost(model):
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    config = json.loads(booster.save_config())
+    _check_xgb_config(config)
+    names = booster.feature_names
+    index = {name: i for i, name in enumerate(names)} if names else None
+    dumps = booster.get_dump(dump_format="json")
+    try:
+        # XGBRegressor.predict stops at the best iteration; each round holds num_parallel_tree trees
+        per_round = int(config["learner"]["gradient_booster"]["gbtree_model_param"]["num_parallel_tree"])
+        dumps = dumps[:(booster.best_iteration + 1) * per_round]
+    except AttributeError:
+        pass
+
+    trees = []
+    for dump in dumps:
+        nodes = {}
+        stack = [json.loads(dump)]
+        while stack:
+            node = stack.pop()
+            nodes[node["nodeid"]] = node
+            stack.extend(node.get("children", []))
+        n = max(nodes) + 1
+        feat = np.zeros(n, dtype=np.intp)
+        thr = np.zeros(n)
+        left = np.full(n, -1, dtype=np.intp)
+        right = np.full(n, -1, dtype=np.intp)
+        val = np.zeros(n)
+        miss = np.zeros(n, dtype=bool)
+        for nid, node in nodes.items():
+            if "leaf" in node:
+                val[nid] = np.float32(node["leaf"])
+                continue
+            if "categories" in node:
+                raise TypeError("categorical XGBoost splits are not supported")
+            split = node["split"]
+            feat[nid] = index[split] if index else int(split.lstrip("f"))
+            thr[nid] = np.float32(node["split_condition"])
+            left[nid], right[nid] = node["yes"], node["no"]
+            miss[nid] = node["missing"] == node["yes"]
+        trees.append((feat, thr, left, right, val, miss))
+    return _pack(trees, booster.num_features(), aggregate="sum", strict=True,
+                 base_score=_xgb_base_score(config))
+
+
+def compile_model(model):
+    """Flatten a fitted sklearn tree ensemble or XGBoost model; TypeError for anything else."""
+    if hasattr(model, "get_booster") or type(model).__module__.startswith("xgboost"):
+        return from_xgboost(model)
+    return from_sklearn(model)
+
+
+# ------------------- FLAT ARRAYS ON DISK -------------------
+FLAT_ARRAYS = ("feature", "threshold", "left", "value", "roots", "missing_left", "cuts", "cut_offsets")
+
+
+def _sha256(path):
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_arrays(engine, directory):
+    """Write the node arrays as .npy files; returns the header entry describing them."""
+    arrays = {}
+    for name in FLAT_ARRAYS:
+        a = getattr(engine, name)
+        if a is None:
+            continue
+        path = os.path.join(directory, f"{name}.npy")
+        np.save(path, np.ascontiguousarray(a))   # .npy data starts 64-byte aligned
+        arrays[name] = {"file": f"{name}.npy", "dtype": a.dtype.str, "shape": list(a.shape),
+                        "bytes": os.path.getsize(path), "sha256": _sha256(path)}
+    return {
+        "aggregate": engine.aggregate, "base_score": engine.base_score, "strict": engine.strict,
+        "depth": engine.depth, "n_features": engine.n_features, "arrays": arrays,
+    }
+
+
+def load_arrays(directory, meta, verify=True):
+    """FlatForest over read-only memory maps of the arrays described by `meta`."""
+    arrays = {}
+    for name, entry in meta["arrays"].items():
+        path = os.path.join(directory, entry["file"])
+        if os.path.getsize(path) != entry["bytes"]:
+            raise ValueError(f"{path}: size {os.path.getsize(path)} != {entry['bytes']} (truncated?)")
+        if verify and _sha256(path) != entry["sha256"]:
+            raise ValueError(f"{path}: checksum mismatch")
+        a = np.load(path, mmap_mode="r")
+        if a.dtype.str != entry["dtype"] or list(a.shape) != entry["shape"]:
+            raise ValueError(f"{path}: expected {entry['dtype']} {entry['shape']}, got {a.dtype.str} {list(a.shape)}")
+        arrays[name] = a
+    return FlatForest(
+        arrays["feature"], arrays["threshold"], arrays["left"], arrays["value"], arrays["roots"],
+        meta["depth"], meta["n_features"], aggregate=meta["aggregate"], base_score=meta["base_score"],
+        strict=meta["strict"], missing_left=arrays.get("missing_left"),
+        cuts=arrays.get("cuts"), cut_offsets=arrays.get("cut_offsets"),
+    )
+
+
+# ------------------- PARITY CHECK -------------------
+def check_parity(model, X, engine=None, rtol=1e-5, atol=1e-4):
+    """Compare the engine against `model.predict`; returns (ok, max_abs_diff)."""
+    engine = compile_model(model) if engine is None else engine
+    expected = np.asarray(model.predict(X), dtype=np.float64)
+    got = engine.predict(np.asarray(X))
+    diff = float(np.abs(expected - got).max()) if len(got) else 0.0
+    return bool(np.allclose(expected, got, rtol=rtol, atol=atol)), diff
+
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    import forecast_core
+    from forecast_pipeline import ForecastPipeline, load_pipeline
+
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    loaded = load_pipeline() if path is None else __import__("joblib").load(path)
+    model = loaded.estimator if isinstance(loaded, ForecastPipeline) else loaded
+    transform = loaded.transform if isinstance(loaded, ForecastPipeline) else np.asarray
+
+    X = transform(forecast_core.preprocess_batch(forecast_core.synthetic_inputs(n_rows)))
+    engine = compile_model(model)
+    ok, diff = check_parity(model, X, engine)
+    print(f"{type(model).__name__}: {engine.n_trees} trees, {engine.n_nodes} nodes, depth {engine.depth}, "
+          f"{engine.nbytes / 1e6:.1f} MB")
+    print(f"parity: {'OK' if ok else 'FAILED'} (max abs diff {diff:.3g})")
+    one = X[:1]
+    print(f"single row: model.predict {_time(lambda: model.predict(one), 50) * 1e3:.3f} ms, "
+          f"engine {_time(lambda: engine.predict(one), 200) * 1e3:.3f} ms")
+    for size in sorted({min(256, n_rows), n_rows}):
+        batch = X[:size]
+        t_model = _time(lambda: model.predict(batch), 3)
+        t_engine = _time(lambda: engine.predict(batch), 3)
+        print(f"batch of {size}: model.predict {size / t_model:,.0f} rows/s, engine {size / t_engine:,.0f} rows/s")
+    sys.exit(0 if ok else 1)